@@ -0,0 +1,56 @@
+"""
+Wall time of a command line run cold (new interpreter importing the
+command module) and warm (forwarded to a pyclap.daemon).
+
+    python benchmarks/bench_daemon.py [runs]
+"""
+
+import os, sys, time, shutil, tempfile, subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULE = '''
+import asyncio, decimal, email.mime.multipart, http.client, json, xml.dom.minidom # a realistic import cost
+commands = ['add']
+
+def add(a, b):
+    return int(a) + int(b)
+'''
+
+COLD = 'import sys, bench_cmds; from pyclap.daemon import execute; from pyclap.core import ArgumentParser; ' \
+       'sys.exit(execute(ArgumentParser.parser_from(bench_cmds), sys.argv[1:]))'
+WARM = 'import sys; from pyclap.daemon import forward; sys.exit(forward("bench_cmds", sys.argv[2:], sys.argv[1], spawn=False))'
+
+
+def timed(args, env):
+    start = time.perf_counter()
+    subprocess.check_call(args, env=env, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def main(runs=20):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'bench.sock')
+    with open(os.path.join(directory, 'bench_cmds.py'), 'w') as f:
+        f.write(MODULE)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([directory, ROOT]))
+    env.pop('PYTHONDONTWRITEBYTECODE', None) # compare imports as installed, from .pyc files
+    daemon = subprocess.Popen([sys.executable, '-m', 'pyclap.daemon', 'bench_cmds', '--socket', path], env=env)
+    try:
+        while not os.path.exists(path):
+            time.sleep(0.01)
+        cold = median([timed([sys.executable, '-c', COLD, 'add', '1', '2'], env) for _ in range(runs)])
+        warm = median([timed([sys.executable, '-c', WARM, path, 'add', '1', '2'], env) for _ in range(runs)])
+        print('cold {0:.1f} ms   warm {1:.1f} ms   x{2:.1f}'.format(cold * 1e3, warm * 1e3, cold / warm))
+    finally:
+        daemon.terminate()
+        daemon.wait()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,47 @@
+"""
+Time per parse of smart_parse_args with and without the fast path.
+
+    python benchmarks/bench_fastpath.py [repeat]
+"""
+
+import os, sys, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyclap import annotations, Positional as Pos, Option as Opt, Flag
+from pyclap.core import ArgumentParser
+
+
+@annotations(src=Pos('source'), count=Opt('count', 'c', type=int), name=Opt('name', 'n'),
+             ratio=Opt('ratio', 'r', type=float), verbose=Flag('verbose', 'v'))
+def copy(src, dst='out', count=1, name='x', ratio=0.5, verbose=False):
+    pass
+
+
+class Interface(object):
+    commands = ['copy']
+    copy = staticmethod(copy)
+
+
+WORKLOADS = [
+    ('function', copy, ['a', 'b', '-c', '3', '--name=y', '-v']),
+    ('command', Interface(), ['copy', 'a', '-r', '0.1', '-n', 'y']),
+]
+
+
+def bench(obj, arg_list, fast_parse, number):
+    parser = ArgumentParser.parser_from(obj, fast_parse=fast_parse)
+    parse = parser.smart_parse_args
+    return min(timeit.repeat(lambda: parse(list(arg_list)), number=number, repeat=5)) / number
+
+
+def main(number=2000):
+    for name, obj, arg_list in WORKLOADS:
+        slow = bench(obj, arg_list, False, number)
+        fast = bench(obj, arg_list, True, number)
+        print('{0:10} argparse {1:8.2f} us   fast path {2:8.2f} us   x{3:.1f}'.format(
+            name, slow * 1e6, fast * 1e6, slow / fast))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,89 @@
+"""
+Memory held by the command specs of a large command set: the former
+dict-backed Annotation and CallableCommandSpec, with a fresh annotation
+per parameter, against the slotted ones sharing interned annotations.
+
+    python benchmarks/bench_specs.py [n_commands]
+"""
+
+import os, sys, gc, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyclap import annotations, Option
+from pyclap.core import CallableCommandSpec, getfullargspec
+
+
+class LegacyAnnotation(object):
+    def __init__(self, help=None, kind="positional", abbrev=None, type=None,
+                 choices=None, metavar=None, default=None, container=None):
+        self.help = help
+        self.kind = kind
+        self.abbrev = abbrev
+        self.type = type
+        self.choices = choices
+        self.metavar = metavar
+        self.default = default
+        self.container = container
+
+
+def legacy_annotation(obj):
+    if isinstance(obj, (LegacyAnnotation, Option)):
+        return obj
+    if isinstance(obj, tuple):
+        return LegacyAnnotation(*obj)
+    return LegacyAnnotation(obj)
+
+
+class LegacySpec(object):
+    """CallableCommandSpec as it was: a dict per instance, the argspec kept, an annotation per parameter"""
+    NONE = object()
+
+    def __init__(self, obj):
+        self.arg_spec = getfullargspec(obj)
+        self.obj = obj
+        defaults = self.arg_spec.defaults or ()
+        self.defaults = (self.NONE,) * (len(self.arg_spec.args) - len(defaults)) + defaults
+        self.vars = self.arg_spec.args
+        self.varargs = self.arg_spec.varargs
+        self.varkw = self.arg_spec.varkw
+        self.annotations = dict()
+        for key in self.vars + [self.varargs] + [self.varkw]:
+            if key:
+                self.annotations[key] = legacy_annotation(self.arg_spec.annotations.get(key, ()))
+
+
+def make_commands(n_commands):
+    """Functions with unannotated, help string, tuple and Option parameters"""
+    commands = []
+    for i in range(n_commands):
+        namespace = {}
+        exec('def command{0}(source, target, verbose=0, mode=None, limit=10):\n    pass\n'.format(i), namespace)
+        commands.append(annotations(target='Where to write', verbose=('Verbosity', 'option', 'v', int),
+                                    limit=Option('Limit', 'l', int))(namespace['command{0}'.format(i)]))
+    return commands
+
+
+def held(build, commands):
+    """Bytes still allocated after building the specs of commands"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        specs = [build(command) for command in commands]
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del specs
+    return size
+
+
+def main(n_commands=20000):
+    commands = make_commands(n_commands)
+    old = held(LegacySpec, commands)
+    new = held(CallableCommandSpec, commands)
+    print('specs of {0} commands: legacy {1:.1f} MiB ({2} B each)   slotted {3:.1f} MiB ({4} B each)   x{5:.2f}'.format(
+        n_commands, old / 2.0 ** 20, old // n_commands, new / 2.0 ** 20, new // n_commands, old / float(new)))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
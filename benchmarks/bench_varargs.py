@@ -0,0 +1,74 @@
+"""
+*args/**kwargs ingestion: the former ArgsAction splitting loop (one
+DictType call and one uncompiled re.match per value, an exception per
+plain value) against the single pass of split_kwargs(), on the same
+string values, name=value ones included.
+
+    python benchmarks/bench_varargs.py [n_values]
+"""
+
+import os, re, sys, time, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyclap import call, annotations, Positional
+from pyclap.core import split_kwargs
+
+
+class LegacyDictType(object):
+    """DictType as it was before split_kwargs()"""
+    def __init__(self, value_type=None):
+        self.value_type = value_type or (lambda x:x)
+
+
+    def __call__(self, string):
+        match = re.match(r'([a-zA-Z_]\w*)=', string)
+        if match:
+            name = match.group(1)
+            value = string[len(name)+1:]
+            return name, (self.value_type(value) if self.value_type else value)
+        else:
+            msg = "{0!r} is not a key=value".format(string)
+            raise argparse.ArgumentTypeError(msg)
+
+
+def legacy(values):
+    """The loop of the former ArgsAction.__call__"""
+    dict_type = LegacyDictType()
+    args = []
+    kwargs = []
+    for value in values:
+        try:
+            kwargs.append(dict_type(value))
+        except argparse.ArgumentTypeError:
+            args.append(value)
+    return args, dict(kwargs)
+
+
+def current(values):
+    return split_kwargs(values)
+
+
+@annotations(values=Positional(type=int))
+def total(*values, **options):
+    return len(values) + len(options)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main(n_values=10 ** 6):
+    values = [str(i) if i % 10 else 'k{0}={0}'.format(i) for i in range(n_values)]
+    assert legacy(values) == current(values)
+    old = timed(legacy, values)
+    new = timed(current, values)
+    print('split {0} values: legacy {1:.3f} s   single pass {2:.3f} s   x{3:.1f}'.format(
+        n_values, old, new, old / new))
+    print('call(total) with {0} values: {1:.3f} s'.format(n_values, timed(call, total, values)))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,171 @@
+"""
+Benchmark suite: time and peak memory of building parsers, parsing,
+matching and dispatching commands, and collecting results.
+
+    python benchmarks/run.py [-q] [-k parse] [--save base.json] [--baseline base.json]
+
+Every case is timed over enough calls to last about --min-time seconds
+(best of 3), then run once more under tracemalloc for its peak memory.
+With --baseline the exit code is 1 when a case got slower or bigger than
+the baseline by more than --threshold.
+"""
+
+import os, sys, gc, json, time, platform, tracemalloc
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyclap import annotations, call, Option, Flag, __version__
+from pyclap.core import ArgumentParser, CallableCommandSpec
+from pyclap.output import JsonLinesSink, emit
+from workloads import make_function, option_args, make_module, make_class, command_name, total, packed, rows
+
+
+def build(obj, **params):
+    return lambda: ArgumentParser.parser_from(obj, **params)
+
+
+def specs(n_commands):
+    module = make_module(n_commands)
+    functions = [getattr(module, name) for name in module.commands]
+    return lambda: [CallableCommandSpec(func) for func in functions]
+
+
+def populate(func):
+    spec = CallableCommandSpec(func)
+    return lambda: ArgumentParser().populate_from(spec)
+
+
+def parse(obj, arg_list, **params):
+    parser = ArgumentParser.parser_from(obj, **params)
+    return lambda: parser.smart_parse_args(list(arg_list))
+
+
+def match(n_commands):
+    parser = ArgumentParser.parser_from(make_module(n_commands), lazy_subcommands=True)
+    commands = parser._get_subparsers()
+    names = [command_name(i) for i in range(0, n_commands, max(1, n_commands // 100))]
+    return lambda: [parser._match_cmd(name, commands) for name in names]
+
+
+def dispatch(obj, arg_list, **params):
+    parser = ArgumentParser.parser_from(obj, **params)
+    return lambda: parser.consume(list(arg_list))
+
+
+def output(n_items, how):
+    arg_list = [str(n_items)]
+    if how == 'list':
+        return lambda: call(rows, arg_list, use_cache=False)
+    if how == 'stream':
+        return lambda: deque(call(rows, arg_list, greedy=True, use_cache=False)[1], maxlen=0)
+    def write():
+        with open(os.devnull, 'w') as stream:
+            emit(call(rows, arg_list, greedy=True, use_cache=False)[1], JsonLinesSink(stream))
+    return write
+
+
+def cases(quick=False):
+    """Yields (name, setup): setup() returns the function to measure"""
+    params = [1, 20, 200]
+    commands = [10, 500] if quick else [10, 500, 5000]
+    items = 10 ** 4 if quick else 10 ** 6
+
+    for n in params:
+        yield 'build/function-{0}'.format(n), lambda n=n: build(make_function(n))
+        yield 'populate/function-{0}'.format(n), lambda n=n: populate(make_function(n))
+        yield 'parse/function-{0}'.format(n), lambda n=n: parse(make_function(n), option_args(n))
+        yield 'parse/function-{0}-fast'.format(n), lambda n=n: parse(make_function(n), option_args(n), fast_parse=True)
+    for n in commands:
+        yield 'spec/module-{0}'.format(n), lambda n=n: specs(n)
+        yield 'build/module-{0}'.format(n), lambda n=n: build(make_module(n))
+        yield 'build/module-{0}-lazy'.format(n), lambda n=n: build(make_module(n), lazy_subcommands=True)
+        yield 'build/class-{0}'.format(n), lambda n=n: build(make_class(n))
+        yield 'match/module-{0}'.format(n), lambda n=n: match(n)
+        yield 'dispatch/module-{0}'.format(n), \
+              lambda n=n: dispatch(make_module(n), [command_name(n // 2), 'x'], lazy_subcommands=True)
+        yield 'dispatch/class-{0}'.format(n), \
+              lambda n=n: dispatch(make_class(n)(), [command_name(n // 2), 'x'], lazy_subcommands=True)
+    yield 'parse/varargs-{0}'.format(items), lambda: dispatch(total, [str(i) for i in range(items)])
+    yield 'parse/array-{0}'.format(items), lambda: dispatch(packed, [str(i) for i in range(items)])
+    for how in ('list', 'stream', 'jsonl'):
+        yield 'output/{0}-{1}'.format(how, items), lambda how=how: output(items, how)
+
+
+def timed(func, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return time.perf_counter() - start
+
+
+def measure(func, min_time):
+    """Returns (seconds per call, peak traced bytes of one call)"""
+    number = max(1, int(min_time / max(timed(func, 1), 1e-9)))
+    seconds = min(timed(func, number) for _ in range(3)) / number
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def compare(results, baseline, threshold):
+    """Returns the regressions of results over baseline, as a list of messages"""
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ('time', 'peak'):
+            if base[key] and result[key] > base[key] * (1 + threshold):
+                regressions.append('{0}: {1} x{2:.2f}'.format(name, key, result[key] / base[key]))
+    return regressions
+
+
+def format_result(name, result, base=None):
+    line = '{0:32} {1:12.1f} us {2:12.1f} KiB'.format(name, result['time'] * 1e6, result['peak'] / 1024.0)
+    if base:
+        line += '   time x{0:.2f}  peak x{1:.2f}'.format(result['time'] / (base['time'] or 1),
+                                                      result['peak'] / float(base['peak'] or 1))
+    return line
+
+
+@annotations(filter=Option("Only run the cases whose name contains this text", 'k'),
+             quick=Flag("Smaller workloads", 'q'),
+             save=Option("Save the results as a baseline in this file", 's'),
+             baseline=Option("Compare the results with the baseline in this file", 'c'),
+             threshold=Option("Relative slow down or growth counted as a regression (default {default})", 't',
+                              type=float),
+             min_time=Option("Seconds spent timing each case (default {default})", 'm', type=float))
+def main(filter=None, quick=False, save=None, baseline=None, threshold=0.25, min_time=0.2):
+    """Runs the benchmarks and prints the time per call and peak memory of each case"""
+    base = {}
+    if baseline:
+        with open(baseline) as f:
+            base = json.load(f)['results']
+
+    results = {}
+    for name, setup in cases(quick):
+        if filter and filter not in name:
+            continue
+        seconds, peak = measure(setup(), min_time)
+        results[name] = dict(time=seconds, peak=peak)
+        print(format_result(name, results[name], base.get(name)))
+        sys.stdout.flush()
+
+    if save:
+        with open(save, 'w') as f:
+            json.dump(dict(python=platform.python_version(), pyclap=__version__, quick=quick, results=results),
+                      f, indent=1, sort_keys=True)
+    regressions = compare(results, base, threshold)
+    for message in regressions:
+        print('REGRESSION ' + message)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(call(main, arg_list=sys.argv[1:], use_cache=False)[1])
@@ -0,0 +1,66 @@
+"""
+Synthetic commands for the benchmarks: functions with many parameters,
+modules and classes with many commands, large varargs and outputs.
+"""
+
+import types
+
+from pyclap import annotations, Positional, Option
+
+
+def command_name(i):
+    return 'command{0:05d}'.format(i)
+
+
+def make_function(n_params, name='f'):
+    """A function with one positional and n_params - 1 int options, returning the positional"""
+    names = ['p{0}'.format(i) for i in range(n_params)]
+    params = [names[0]] + ['{0}=0'.format(n) for n in names[1:]]
+    namespace = {}
+    exec('def {0}({1}):\n    return {2}\n'.format(name, ', '.join(params), names[0]), namespace)
+    return annotations(**dict((n, Option(type=int)) for n in names[1:]))(namespace[name])
+
+
+def option_args(n_params):
+    """An argument list for make_function(n_params) setting every option"""
+    arg_list = ['x']
+    for i in range(1, n_params):
+        arg_list += ['--p{0}'.format(i), str(i)]
+    return arg_list
+
+
+def make_module(n_commands, **attrs):
+    """A module with n_commands commands taking a positional and an option"""
+    module = types.ModuleType('bench_module_{0}'.format(n_commands))
+    module.commands = [command_name(i) for i in range(n_commands)]
+    for name in module.commands:
+        setattr(module, name, make_function(2, name))
+    for key, value in attrs.items():
+        setattr(module, key, value)
+    return module
+
+
+def make_class(n_commands):
+    """A class with n_commands commands taking a positional and an option"""
+    namespace = dict(commands=[command_name(i) for i in range(n_commands)])
+    for name in namespace['commands']:
+        code = {}
+        exec('def {0}(self, p0, p1=0):\n    return p0\n'.format(name), code)
+        namespace[name] = annotations(p1=Option(type=int))(code[name])
+    return type('Commands', (object,), namespace)
+
+
+@annotations(values=Positional(type=int))
+def total(*values, **opts):
+    return len(values)
+
+
+@annotations(values=Positional(type=int, container='array'))
+def packed(values):
+    return len(values)
+
+
+@annotations(n=Positional(type=int))
+def rows(n):
+    for i in range(n):
+        yield i
@@ -0,0 +1,104 @@
+"""
+Support of coroutine and async generator commands (Python 3.6+).
+"""
+
+__all__ = ['async_call', 'collect', 'stream_result', 'run_result']
+
+import sys, asyncio, inspect
+
+from .core import ArgumentParser, parser_cache, iterable
+
+
+def is_async_iterable(obj):
+    return hasattr(obj, '__aiter__')
+
+
+async def resolve(result):
+    """Awaits result until it is not awaitable anymore"""
+    while inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def stream_result(result):
+    """
+    Async generator over the items of result. Awaitables and async
+    iterables found among the items (the command wrappers yield the
+    coroutine or async generator of an async command) are resolved in
+    place, each before the next item is requested, so the wrapper's
+    __enter__/__exit__ scope is still open while they run.
+    """
+    result = await resolve(result)
+    if is_async_iterable(result):
+        async for item in result:
+            yield item
+    elif iterable(result):
+        for item in result:
+            if inspect.isawaitable(item) or is_async_iterable(item):
+                async for sub_item in stream_result(item):
+                    yield sub_item
+            else:
+                yield item
+    else:
+        yield result
+
+
+async def collect(result, greedy=False):
+    """
+    Resolves result: iterables come back as a list, or as an async
+    generator with greedy.
+    """
+    result = await resolve(result)
+    if is_async_iterable(result) or iterable(result):
+        stream = stream_result(result)
+        if greedy:
+            return stream
+        return [item async for item in stream]
+    return result
+
+
+async def async_call(obj, arg_list=sys.argv[1:], greedy=False, only_known_args=False, use_cache=True,
+                     **parser_params):
+    """
+    call() for a running event loop: the command is awaited, with greedy
+    its items are returned as an async generator.
+    """
+    if use_cache:
+        parser = parser_cache.get(obj, **parser_params)
+    else:
+        parser = ArgumentParser.parser_from(obj, **parser_params)
+    ns, result = parser.consume(arg_list, only_known_args)
+    return ns, await collect(result, greedy)
+
+
+def run_result(result, greedy=False):
+    """
+    Resolves result on a new event loop, for call(). With greedy iterable
+    results are streamed by a generator which runs the loop on demand.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        result = loop.run_until_complete(resolve(result))
+        if not (is_async_iterable(result) or iterable(result)):
+            return result
+        if greedy:
+            stream, loop = drive(loop, stream_result(result)), None
+            return stream
+        return loop.run_until_complete(collect(result))
+    finally:
+        if loop is not None:
+            loop.close()
+
+
+def drive(loop, stream):
+    """Iterates the async generator stream by running loop, closes both at the end"""
+    try:
+        while True:
+            try:
+                item = loop.run_until_complete(stream.__anext__())
+            except StopAsyncIteration:
+                break
+            yield item
+    finally:
+        loop.run_until_complete(stream.aclose())
+        loop.close()
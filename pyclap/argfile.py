@@ -0,0 +1,91 @@
+"""
+Argument files: @path in an argument list stands for the arguments
+stored in path, @- for the ones read from stdin.
+
+Arguments are separated by NUL when the start of the file contains one
+(find -print0, xargs -0), else by newline. Files are read in chunks,
+large ones are memory-mapped, and tokens are decoded one at a time, so
+the file content is never held as one string next to its arguments.
+argparse still needs the arguments as a list: expanding an argument list
+materializes it once.
+"""
+
+__all__ = ['expand_args', 'iter_tokens']
+
+import os, sys, mmap
+
+CHUNK_SIZE = 1 << 16
+MMAP_THRESHOLD = 1 << 20
+ENCODING = sys.getfilesystemencoding() or 'utf-8'
+
+
+def expand_args(arg_list, prefix_chars='@'):
+    """Yields the arguments of arg_list, with the argument files replaced by their content"""
+    for arg in arg_list:
+        if len(arg) > 1 and arg[0] in prefix_chars:
+            for token in iter_tokens(arg[1:]):
+                yield token
+        else:
+            yield arg
+
+
+def iter_tokens(path, delimiter=None):
+    """Yields the arguments stored in the file path (- for stdin)"""
+    if path == '-':
+        stream = getattr(sys.stdin, 'buffer', sys.stdin)
+        for token in split_stream(stream, delimiter):
+            yield token
+        return
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for token in split_buffer(data, size, delimiter):
+                    yield token
+            finally:
+                data.close()
+        else:
+            for token in split_stream(f, delimiter):
+                yield token
+
+
+def detect(head):
+    return b'\0' if b'\0' in head else b'\n'
+
+
+def decode(token, delimiter):
+    if delimiter == b'\n' and token.endswith(b'\r'):
+        token = token[:-1]
+    if str is bytes: # Python 2: arguments are byte strings
+        return token
+    return token.decode(ENCODING, 'surrogateescape')
+
+
+def split_buffer(data, size, delimiter=None):
+    """Tokens of a memory-mapped file, sliced one by one"""
+    delimiter = delimiter or detect(data[:CHUNK_SIZE])
+    start = 0
+    while start < size:
+        end = data.find(delimiter, start)
+        if end < 0:
+            end = size
+        yield decode(data[start:end], delimiter)
+        start = end + 1
+
+
+def split_stream(stream, delimiter=None):
+    """Tokens of a binary stream read in chunks"""
+    rest = b''
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if delimiter is None:
+            delimiter = detect(chunk)
+        parts = (rest + chunk).split(delimiter)
+        rest = parts.pop()
+        for part in parts:
+            yield decode(part, delimiter)
+    if rest:
+        yield decode(rest, delimiter)
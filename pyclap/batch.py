@@ -0,0 +1,134 @@
+"""
+Runs a stream of argument lists against a single parser.
+
+    python -m pyclap.batch package.module[:attr] [-i records.txt] [-z] [-f jsonl]
+"""
+
+__all__ = ['batch_call', 'read_records', 'load_target']
+
+import sys, shlex, importlib
+
+from .core import (ArgumentParser, CommandError, ParserError, annotations, call, iterable,
+                   basestring, Positional, Option, Flag)
+from .output import SINKS, emit
+from .isolation import IsolatedPool
+
+
+def batch_call(obj, records, greedy=False, only_known_args=False, executor=None, **parser_params):
+    """
+    Builds the parser for obj once and consumes every argument list of
+    records, which can be lists of arguments or command line strings.
+    Yields (ns, result) per record; a record which fails to parse or whose
+    command raises yields (None, CommandError) instead of exiting.
+    With greedy, iterable results are returned unconsumed and errors raised
+    while iterating them are not isolated.
+
+    executor runs the commands in process by default; 'isolated' or an
+    IsolatedPool (left running) runs them in worker processes, see
+    pyclap.isolation. Their iterable results are always listed, greedy or
+    not: a worker streaming a result is not free for the next record.
+    """
+    parser = ArgumentParser.parser_from(obj, raise_errors=True, **parser_params)
+    if executor == 'isolated':
+        pool = IsolatedPool()
+    elif executor is None or isinstance(executor, IsolatedPool):
+        pool = executor
+    else:
+        raise ValueError('Unknown executor {0!r}'.format(executor))
+    try:
+        for arg_list in records:
+            if isinstance(arg_list, basestring):
+                arg_list = shlex.split(arg_list)
+            else:
+                arg_list = list(arg_list) # the parser rewrites abbreviated commands in place
+            try:
+                if pool is None:
+                    ns, result = parser.consume(list(arg_list), only_known_args)
+                else: # parsed here, run by a worker
+                    args, varargs, kwargs, func, ns = parser.smart_parse_args(list(arg_list), only_known_args)
+                    result = pool.run(parser, func, args + varargs, kwargs, ns)
+                if iterable(result) and (not greedy or pool is not None):
+                    result = list(result)
+            except ParserError as e:
+                yield None, CommandError(arg_list, 2, e)
+            except SystemExit as e: # -h and explicit exits of the command
+                yield None, CommandError(arg_list, e.code, e)
+            except Exception as e:
+                yield None, CommandError(arg_list, 1, e)
+            else:
+                yield ns, result
+    finally:
+        if pool is not executor:
+            pool.close()
+
+
+def read_records(stream, delimiter='\n', split=True, chunk_size=1 << 16):
+    """
+    Yields the records of stream separated by delimiter ('\\n' or '\\0'),
+    as argument lists when split is true. Blank records are skipped.
+    """
+    tail = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        records = (tail + chunk).split(delimiter)
+        tail = records.pop()
+        for record in records:
+            if record.strip():
+                yield shlex.split(record) if split else record
+    if tail.strip():
+        yield shlex.split(tail) if split else tail
+
+
+def load_target(spec):
+    """Imports 'package.module[:attr.attr]' and returns the object"""
+    module_name, _, path = spec.partition(':')
+    obj = importlib.import_module(module_name)
+    for name in filter(None, path.split('.')):
+        obj = getattr(obj, name)
+    return obj
+
+
+@annotations(target=Positional("Commands to run, as package.module[:attr]"),
+             input=Option("File with one command line per record, - for stdin (default {default})", 'i'),
+             null=Flag("Records are separated by NUL instead of newline", 'z'),
+             format=Option("Output format (default {default})", 'f', choices=sorted(SINKS)),
+             timeout=Option("Run the commands in a worker process, killed after this many seconds", 't',
+                            type=float))
+def main(target, input='-', null=False, format='lines', timeout=None):
+    """Runs every command line read from input against target"""
+    obj = load_target(target)
+    pool = IsolatedPool(timeout=timeout) if timeout is not None else None
+    stream = sys.stdin if input == '-' else open(input)
+    sink = SINKS[format](sys.stdout)
+    failed = 0
+    current = []
+
+    def remember(records):
+        for record in records:
+            current[:] = record
+            yield record
+
+    try:
+        records = remember(read_records(stream, '\0' if null else '\n'))
+        for ns, result in batch_call(obj, records, greedy=True, executor=pool):
+            if not isinstance(result, CommandError):
+                try:
+                    emit(result, sink) # results are streamed: errors can happen while writing
+                except Exception as e:
+                    result = CommandError(list(current), 1, e)
+            if isinstance(result, CommandError):
+                failed += 1
+                sys.stderr.write('{0}\n'.format(result))
+    finally:
+        sink.close()
+        if pool is not None:
+            pool.close()
+        if stream is not sys.stdin:
+            stream.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(call(main, arg_list=sys.argv[1:], use_cache=False)[1])
@@ -0,0 +1,92 @@
+"""
+Several commands in one invocation:
+
+    mytool --db prod load a.csv + index + report --format html
+
+The options before the first command apply to every command of the
+chain: the commands of a class run against one instance, entered once
+when it is a context manager, so its setup (connections, ...) is paid
+once. Every command is parsed before the first one runs.
+
+With pipe, the items returned by a command are appended to the *args of
+the next one, unconverted.
+"""
+
+__all__ = ['chain_call', 'split_chain']
+
+import sys, inspect
+from contextlib import contextmanager
+
+from .core import ArgumentParser, ClassCommandsSpec, command_scope, iterable, parser_cache
+from .defaults import resolve_lazy
+
+
+def split_chain(arg_list, separator='+'):
+    """The argument lists of the commands of arg_list"""
+    segments = [[]]
+    for arg in arg_list:
+        if arg == separator:
+            segments.append([])
+        else:
+            segments[-1].append(arg)
+    return segments
+
+
+@contextmanager
+def shared_scope(parser, args):
+    """Keeps the instance the commands of parser run against entered, args being the parsed root arguments"""
+    commands_spec = getattr(parser, 'commands_spec', None)
+    if isinstance(commands_spec, ClassCommandsSpec):
+        constructor_args, _ = resolve_lazy(args[:len(parser.callable_spec.vars)], {})
+        with commands_spec.instances.using(tuple(constructor_args)) as obj:
+            with command_scope(obj):
+                yield
+    else:
+        with command_scope(getattr(commands_spec, 'obj', None)):
+            yield
+
+
+def chain_call(obj=None, arg_list=sys.argv[1:], separator='+', pipe=False, use_cache=True, **parser_params):
+    """
+    Runs the commands of arg_list separated by separator, in order, and
+    returns the list of their (ns, result), iterable results being listed
+    while the shared instance is still entered.
+    """
+    obj = obj or inspect.getmodule(inspect.currentframe().f_back)
+    if use_cache:
+        parser = parser_cache.get(obj, **parser_params)
+    else:
+        parser = ArgumentParser.parser_from(obj, **parser_params)
+    if separator[:1] in parser.prefix_chars:
+        raise ValueError('The separator {0!r} starts like an option!'.format(separator))
+
+    segments = split_chain(arg_list, separator)
+    prefix = []
+    if hasattr(parser, 'subparsers'):
+        i, cmd = parser._find_cmd(segments[0], parser._get_subparsers())
+        if cmd is not None:
+            prefix = segments[0][:i] # the root options, repeated for every command
+
+    commands = []
+    for n, segment in enumerate(segments):
+        if not segment:
+            parser.error('Empty command in the chain')
+        parsed = parser.smart_parse_args((prefix if n else []) + segment)
+        func = parsed[3]
+        if func is None:
+            parser.error('No command in {0!r}'.format(' '.join(segment)))
+        if pipe and n and not parser.command_spec(func).varargs:
+            parser.error('{0!r} takes no *args to pipe into'.format(segment[0]))
+        commands.append(parsed)
+
+    results = []
+    with shared_scope(parser, commands[0][0]):
+        piped = []
+        for args, varargs, kwargs, func, ns in commands:
+            result = parser.call_command(func, args + varargs + piped, kwargs, ns)
+            if iterable(result):
+                result = list(result)
+            results.append((ns, result))
+            if pipe:
+                piped = result if isinstance(result, list) else [result]
+    return results
@@ -0,0 +1,273 @@
+"""
+Shell completion answered from the command specs, without building parsers.
+
+Command names are completed from a sorted CommandIndex, then only the
+spec of the selected command is introspected to complete its options
+(long names and abbrev short forms) and choices. For modules served from
+a SpecCache nothing is imported at all.
+
+    python -m pyclap.completion script bash mytool >> ~/.bashrc
+    python -m pyclap.completion script fish mytool --module mytool > ~/.config/fish/completions/mytool.fish
+
+The generated script runs the program with PYCLAP_COMPLETE, PYCLAP_COMPLETE_PROG
+(the name of the program) and COMP_CWORD (index of the word under the
+cursor, the program being word 0) in its environment. call() never runs
+a command then: if the name is one of the program's (the prog of its
+parser, its script name, the package run with python -m) it prints the
+candidates, one per line, else nothing, and exits. The variables are
+removed first, so that the programs it may run do not answer in its
+stead.
+With --module the script asks python -m pyclap.completion query instead,
+which reads the module specs from the spec cache.
+"""
+
+__all__ = ['Completer', 'complete_call', 'completer_for', 'script']
+
+import os, sys, inspect
+from bisect import bisect_left
+
+from .core import (CallableCommandSpec, Choices, CommandIndex, annotations, call, constructor_spec, as_group,
+                   command_names, indexed_choices, unbound_function, name_from_python, Positional, Option)
+
+
+class Completer(object):
+    """
+    Completes the words of a command line for a target with spec (the
+    parameters of a function or a class constructor), and/or commands
+    whose specs are looked up with spec_of(name) when needed.
+    """
+
+    def __init__(self, spec=None, commands=None, spec_of=None, case_sensitive=True, prefix_chars='-'):
+        self.spec = spec
+        self.index = CommandIndex(commands, case_sensitive) if commands is not None else None
+        self.spec_of = spec_of
+        self.prefix = prefix_chars[0]
+
+
+    def complete(self, words, current):
+        """Candidates for the word current, words being the arguments before it"""
+        spec, options = self.spec, self.options(self.spec)
+        if self.index is not None:
+            position = self.first_positional(words, options)
+            if position is None:
+                if current.startswith(self.prefix):
+                    return matching(sorted(options), current)
+                if words and options.get(words[-1]) is not None:
+                    return matching(options[words[-1]], current)
+                return self.index.complete(current)
+            try:
+                command = self.index.match(words[position])
+            except NameError:
+                return []
+            if command is None:
+                return []
+            spec = self.spec_of(command)
+            words = words[position + 1:]
+            if isinstance(spec, Completer): # a group of commands
+                return spec.complete(words, current)
+            options = self.options(spec)
+        return self.complete_arguments(spec, options, words, current)
+
+
+    def complete_arguments(self, spec, options, words, current):
+        if words and words[-1] in options and options[words[-1]] is not None:
+            return matching(options[words[-1]], current)
+        if current.startswith(self.prefix * 2) and '=' in current:
+            name, _, value = current.partition('=')
+            return [name + '=' + choice for choice in matching(options.get(name) or [], value)]
+        if current.startswith(self.prefix):
+            return matching(sorted(options), current)
+
+        count = len(self.positionals(words, options))
+        positionals = [name for name in spec.vars if spec.annotations[name].kind == 'positional'] if spec else []
+        if count < len(positionals):
+            return matching(choices(spec.annotations[positionals[count]]), current)
+        if spec and spec.varargs:
+            return matching(choices(spec.annotations[spec.varargs]), current)
+        return []
+
+
+    def options(self, spec):
+        """Maps the option strings of spec to their sorted choices: [] for any value, None for flags"""
+        prefix = self.prefix
+        options = {prefix + 'h': None, prefix * 2 + 'help': None}
+        for name in (spec.vars if spec else ()):
+            a = spec.annotations[name]
+            if a.kind in ('option', 'flag'):
+                values = choices(a) if a.kind == 'option' else None
+                options[prefix * 2 + name_from_python(name)] = values
+                if a.abbrev:
+                    options[prefix + a.abbrev] = values
+        return options
+
+
+    def positionals(self, words, options):
+        """The positional words, option values left out"""
+        result = []
+        skip = False
+        for word in words:
+            if skip:
+                skip = False
+            elif word.startswith(self.prefix) and len(word) > 1:
+                skip = options.get(word) is not None
+            else:
+                result.append(word)
+        return result
+
+
+    def first_positional(self, words, options):
+        skip = False
+        for i, word in enumerate(words):
+            if skip:
+                skip = False
+            elif word.startswith(self.prefix) and len(word) > 1:
+                skip = options.get(word) is not None
+            else:
+                return i
+        return None
+
+
+
+def choices(annotation):
+    values = indexed_choices(annotation.choices) # the Choices of the parsers for iterators and large sets
+    if isinstance(values, Choices):
+        return values.names() # sorted once
+    return sorted(str(choice) for choice in values) if values is not None else []
+
+
+def matching(candidates, prefix):
+    """The candidates (sorted) starting with prefix"""
+    i = bisect_left(candidates, prefix)
+    result = []
+    while i < len(candidates) and candidates[i].startswith(prefix):
+        result.append(candidates[i])
+        i += 1
+    return result
+
+
+def completer_for(obj, **parser_params):
+    """Completer of the target obj of call(): a function, class, object or (cached) module"""
+    from .spec_cache import CachedModule, CachedCommandsSpec
+    case_sensitive = parser_params.get('case_sensitive', getattr(obj, 'case_sensitive', True))
+    prefix_chars = parser_params.get('prefix_chars', getattr(obj, 'prefix_chars', '-'))
+    if inspect.isfunction(obj) or inspect.ismethod(obj):
+        return Completer(CallableCommandSpec(obj), prefix_chars=prefix_chars)
+    if isinstance(obj, CachedModule):
+        spec, spec_of = None, CachedCommandsSpec(obj).command_specs.get
+    elif inspect.isclass(obj):
+        spec, spec_of = constructor_spec(obj), lambda name: CallableCommandSpec(getattr(obj, name),
+                                                                                unbound_function(obj, name))
+    else:
+        spec, spec_of = None, lambda name: CallableCommandSpec(getattr(obj, name))
+
+    groups = dict((g.name, g) for g in map(as_group, obj.commands) if g is not None)
+    def lookup(name):
+        if name in groups: # imported only once selected
+            return completer_for(groups[name].resolve(), prefix_chars=prefix_chars)
+        return spec_of(name)
+    return Completer(spec, command_names(obj.commands), lookup, case_sensitive, prefix_chars)
+
+
+def requested(prog=None):
+    """
+    Whether the completion asked in the environment is for this program:
+    PYCLAP_COMPLETE_PROG is one of its names (see program_names), or is
+    not given. If so the request is removed from the environment.
+    """
+    wanted = os.environ.get('PYCLAP_COMPLETE_PROG')
+    if wanted and os.path.basename(wanted) not in program_names(prog):
+        return False
+    for name in ('PYCLAP_COMPLETE', 'PYCLAP_COMPLETE_PROG'):
+        os.environ.pop(name, None)
+    return True
+
+
+def program_names(prog=None):
+    """The names the program answers completions to: prog, the script name, and the package run with -m"""
+    names = set([os.path.basename(sys.argv[0])])
+    if prog:
+        names.add(os.path.basename(prog))
+    if '__main__.py' in names:
+        package = getattr(sys.modules.get('__main__'), '__package__', None)
+        if package:
+            names.add(package)
+    return names
+
+
+def complete_call(obj, arg_list, stream=None, **parser_params):
+    """Prints the completions of arg_list at the word COMP_CWORD, for call()"""
+    arg_list = list(arg_list)
+    try:
+        position = int(os.environ.get('COMP_CWORD', len(arg_list) + 1)) - 1
+    except ValueError:
+        position = len(arg_list)
+    position = max(0, min(position, len(arg_list)))
+    current = arg_list[position] if position < len(arg_list) else ''
+    candidates = completer_for(obj, **parser_params).complete(arg_list[:position], current)
+    (stream or sys.stdout).write(''.join(candidate + '\n' for candidate in candidates))
+    return 0
+
+
+SCRIPTS = dict(
+    bash='''_pyclap_{name}() {{
+    local IFS=$'\\n'
+    COMPREPLY=($(PYCLAP_COMPLETE=bash PYCLAP_COMPLETE_PROG={name_arg} COMP_CWORD=$COMP_CWORD {command} "${{COMP_WORDS[@]:1}}" 2>/dev/null))
+}}
+complete -o default -F _pyclap_{name} {prog}
+''',
+    zsh='''_pyclap_{name}() {{
+    local -a candidates
+    candidates=("${{(@f)$(PYCLAP_COMPLETE=zsh PYCLAP_COMPLETE_PROG={name_arg} COMP_CWORD=$((CURRENT - 1)) {command} "${{words[@]:1}}" 2>/dev/null)}}")
+    compadd -a candidates
+}}
+compdef _pyclap_{name} {prog}
+''',
+    fish='''function __pyclap_{name}
+    set -l tokens (commandline -opc)
+    env PYCLAP_COMPLETE=fish PYCLAP_COMPLETE_PROG={name_arg} COMP_CWORD=(count $tokens) {command} $tokens[2..] (commandline -ct) 2>/dev/null
+end
+complete -c {prog} -f -a '(__pyclap_{name})'
+''')
+
+PROGRAM = dict(bash='"${COMP_WORDS[0]}"', zsh='"${words[1]}"', fish='$tokens[1]')
+
+
+def script(shell, prog, module=None, name=None):
+    """
+    The completion script of prog for shell, asking prog itself or the spec
+    cache of module. name is the program name sent with the request, which
+    call() compares to the names of the program (the basename of prog by
+    default): give the prog of its parser when it differs.
+    """
+    if shell not in SCRIPTS:
+        raise ValueError('Unknown shell {0!r}, choose from {1}'.format(shell, sorted(SCRIPTS)))
+    if module:
+        command = '{0} -m pyclap.completion query {1}'.format(sys.executable, module)
+    else:
+        command = PROGRAM[shell]
+    function = ''.join(c if c.isalnum() else '_' for c in os.path.basename(prog))
+    name_arg = "'{0}'".format((name or os.path.basename(prog)).replace("'", ''))
+    return SCRIPTS[shell].format(name=function, name_arg=name_arg, prog=prog, command=command)
+
+
+@annotations(shell=Positional("Shell", choices=sorted(SCRIPTS)),
+             prog=Positional("Program to complete"),
+             module=Option("Complete from the spec cache of this module instead of running prog", 'm'),
+             name=Option("Program name to request completions for, the prog of its parser if it differs", 'n'))
+def script_command(shell, prog, module=None, name=None):
+    """Prints the completion script of prog"""
+    sys.stdout.write(script(shell, prog, module, name))
+
+
+def query(module, *words):
+    """Prints the completions of words for module, from its spec cache (COMP_CWORD as with call())"""
+    from .spec_cache import SpecCache
+    complete_call(SpecCache().target(module), words)
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    if argv[:1] == ['query'] and len(argv) > 1:
+        query(*argv[1:]) # the words are not ours to parse
+    else:
+        call(script_command, arg_list=argv[1:] if argv[:1] == ['script'] else argv, use_cache=False)
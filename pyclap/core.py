@@ -1,14 +1,24 @@
 __version__ = '0.1.0'
 
-#TODO: add possibility to define defaults as function or class member of current instance
 #TODO: add possibility to define substitutions context for help
-#TODO: add support for "module commands"
 
 
-__all__=['call', 'annotations', 'Annotation', 'Positional', 'Option', 'Flag', 'iterable', 'wizard_call']
+__all__=['call', 'annotations', 'Annotation', 'Positional', 'Option', 'Flag', 'iterable', 'wizard_call',
+         'ParserCache', 'parser_cache', 'ParserError', 'CommandError', 'InstancePool', 'group', 'Choices']
 
 import keyword
-import re, sys, inspect, argparse
+import os, re, sys, time, array, shutil, inspect, argparse, threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from collections import OrderedDict
+
+from .profiling import timed, phase, count
+from .defaults import ConfigDefaults, LazyDefault, resolve_lazy, calling, current_namespace
+
+try:
+    basestring
+except NameError: # Python 3
+    basestring = str
 
 if sys.version >= '3':
     from inspect import getfullargspec
@@ -43,8 +53,10 @@ def annotations(**ann):
 
 
 class Annotation(object):
+    __slots__ = ('help', 'kind', 'abbrev', 'type', 'choices', 'metavar', 'default', 'container')
+
     def __init__(self, help=None, kind="positional", abbrev=None, type=None,
-                 choices=None, metavar=None, default=None):
+                 choices=None, metavar=None, default=None, container=None):
         assert kind in ('positional', 'option', 'flag'), kind
         if kind == "positional":
             assert abbrev is None, abbrev
@@ -55,18 +67,34 @@ class Annotation(object):
         self.choices = choices
         self.metavar = metavar
         self.default = default
+        self.container = container
 
 
     @classmethod
     def from_(cls, obj):
-        """Helper to convert an object into an annotation, if needed"""
+        """
+        Helper to convert an object into an annotation, if needed. The
+        annotations converted from hashable objects (the empty one of
+        unannotated arguments, help strings, tuples) are shared.
+        """
         if Annotation.is_annotation(obj):
             return obj # do nothing
-        elif isinstance(obj, dict):
-            return cls(**obj)
+        try: # the types tell 1 from True
+            key = (cls, obj, tuple(map(type, obj)) if isinstance(obj, tuple) else type(obj))
+            return _interned[key]
+        except KeyError:
+            pass
+        except TypeError: # unhashable
+            key = None
+        if isinstance(obj, dict):
+            annotation = cls(**obj)
         elif iterable(obj):
-            return cls(*obj)
-        return cls(obj)
+            annotation = cls(*obj)
+        else:
+            annotation = cls(obj)
+        if key is not None and len(_interned) < INTERN_LIMIT:
+            annotation = _interned.setdefault(key, annotation)
+        return annotation
 
 
     @staticmethod
@@ -83,35 +111,311 @@ class Annotation(object):
 
 
 class Positional(Annotation):
-    def __init__(self, help=None, abbrev=None, type=None, choices=None, metavar=None):
+    """
+    With a container ('array', 'numpy' or an array typecode) the argument
+    takes one or more values, collected into an array.array or a NumPy
+    array of type.
+    """
+    __slots__ = ()
+
+    def __init__(self, help=None, abbrev=None, type=None, choices=None, metavar=None, container=None):
         #noinspection PyArgumentEqualDefault
-        super(Positional, self).__init__(help, 'positional', abbrev, type, choices, metavar)
+        super(Positional, self).__init__(help, 'positional', abbrev, type, choices, metavar, container=container)
 
 
 
 class Option(Annotation):
+    __slots__ = ()
+
     def __init__(self, help=None, abbrev=None, type=None, choices=None, metavar=None, default=None):
         super(Option, self).__init__(help, 'option', abbrev, type, choices, metavar, default)
 
 
 
 class Flag(Annotation):
+    __slots__ = ()
+
     def __init__(self, help=None, abbrev=None, type=None, choices=None, metavar=None):
         super(Flag, self).__init__(help, 'flag', abbrev, type, choices, metavar)
 
 
 
+_interned = {} # see Annotation.from_
+INTERN_LIMIT = 1 << 12
+
+
+
+class Choices(object):
+    """
+    Indexed set of the valid values of an argument: membership is a hash
+    lookup, prefix completion a binary search on the sorted names, and a
+    rejected value gets suggestions within a bounded edit distance. The
+    values stay in their original order for iteration.
+    """
+    METAVAR_LIMIT = 8 # choices listed by metavar() and error messages
+
+    def __init__(self, values):
+        self.values = tuple(values)
+        try:
+            self._set = frozenset(self.values)
+        except TypeError: # unhashable values: linear search
+            self._set = None
+        self._names = None
+        self._name_set = None
+        self._alphabet = None
+
+
+    def __contains__(self, value):
+        if self._set is not None:
+            try:
+                return value in self._set
+            except TypeError:
+                return False
+        return value in self.values
+
+
+    def __iter__(self):
+        return iter(self.values)
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+    def __repr__(self):
+        return 'Choices({0})'.format(self.summary())
+
+
+    def names(self):
+        """The sorted string forms of the values"""
+        if self._names is None:
+            self._names = sorted(set(str(value) for value in self.values))
+        return self._names
+
+
+    def complete(self, prefix):
+        """The names starting with prefix"""
+        names = self.names()
+        i = bisect_left(names, prefix)
+        matches = []
+        while i < len(names) and names[i].startswith(prefix):
+            matches.append(names[i])
+            i += 1
+        return matches
+
+
+    def suggest(self, value, limit=3, max_distance=2):
+        """
+        The names closest to value, at most max_distance edits away (fewer
+        for short values). The edits of value are looked up in the set of
+        names rather than value compared to every name.
+        """
+        value = str(value)
+        max_distance = min(max_distance, len(value) // 3)
+        if self._name_set is None:
+            self._name_set = frozenset(self.names())
+            self._alphabet = ''.join(sorted(set(''.join(self._name_set))))
+        seen = frontier = set([value])
+        for distance in range(1, max_distance + 1):
+            if len(frontier) * (2 * len(self._alphabet) + 2) * (len(value) + distance) > EDIT_BUDGET:
+                break
+            reached = set()
+            for word in frontier:
+                reached.update(edits(word, self._alphabet))
+            reached -= seen
+            matches = sorted(self._name_set.intersection(reached))
+            if matches: # the nearest ones only
+                return matches[:limit]
+            seen = seen | reached
+            frontier = reached
+        return []
+
+
+    def summary(self, limit=None):
+        """The first values, then how many there are"""
+        limit = limit or self.METAVAR_LIMIT
+        shown = ', '.join(repr(value) for value in self.values[:limit])
+        if len(self.values) > limit:
+            shown += ', ... ({0} choices)'.format(len(self.values))
+        return shown
+
+
+    def metavar(self):
+        """A {a,b,...} metavar listing the first values only"""
+        shown = [str(value) for value in self.values[:self.METAVAR_LIMIT]]
+        if len(self.values) > self.METAVAR_LIMIT:
+            shown.append('...')
+        return '{' + ','.join(shown) + '}'
+
+
+    def error(self, value):
+        """The message for value, not a valid choice"""
+        suggestions = self.suggest(value)
+        if suggestions:
+            return 'invalid choice: {0!r} (did you mean {1}?)'.format(value, ', '.join(map(repr, suggestions)))
+        return 'invalid choice: {0!r} (choose from {1})'.format(value, self.summary())
+
+
+
+def edits(word, alphabet):
+    """The strings one deletion, transposition, substitution or insertion away from word"""
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    for left, right in splits:
+        if right:
+            yield left + right[1:]
+            for c in alphabet:
+                yield left + c + right[1:]
+        if len(right) > 1:
+            yield left + right[1] + right[0] + right[2:]
+        for c in alphabet:
+            yield left + c + right
+
+
+EDIT_BUDGET = 1 << 20 # candidate strings generated by Choices.suggest() per distance
+CHOICES_INDEX_SIZE = 16 # populate_from indexes the choices sets from this size
+
+_indexed = {} # id(choices) -> (choices, their length, Choices): annotations are shared, so are their indexes
+_indexed_lock = threading.Lock()
+
+
+def indexed_choices(choices):
+    """
+    choices as a Choices when it is large enough to benefit from the index,
+    or has no len() (an iterator is read once). Converted once per choices
+    object, and again if the length of a list of choices changes.
+    """
+    if choices is None or isinstance(choices, Choices):
+        return choices
+    try:
+        size = len(choices)
+    except TypeError:
+        size = None
+    else:
+        if size < CHOICES_INDEX_SIZE:
+            return choices
+    with _indexed_lock:
+        entry = _indexed.get(id(choices))
+        if entry is not None and entry[0] is choices and entry[1] == size:
+            return entry[2]
+        indexed = Choices(choices)
+        if size is None or len(_indexed) < INTERN_LIMIT: # the values of an iterator are only left here
+            _indexed[id(choices)] = (choices, size, indexed) # choices kept alive: its id is not reused
+    return indexed
+
+
+
+class ParserError(Exception):
+    """Raised instead of exiting by a parser built with raise_errors=True"""
+    def __init__(self, message, usage=None):
+        super(ParserError, self).__init__(message)
+        self.message = message
+        self.usage = usage
+
+
+
+class CommandError(Exception):
+    """Failure of a single argument list run by a dispatcher"""
+    def __init__(self, arg_list, exit_code, error):
+        super(CommandError, self).__init__('{0}: {1}'.format(' '.join(arg_list), error))
+        self.arg_list = arg_list
+        self.exit_code = exit_code
+        self.error = error
+
+
+
+KEY_VALUE = re.compile(r'([a-zA-Z_]\w*)=')
+
+
+def split_kwargs(values):
+    """
+    Splits values in a single pass into a list of plain values and a dict
+    of the name=value ones.
+    """
+    args, kwargs = [], {}
+    match = KEY_VALUE.match
+    for value in values:
+        m = '=' in value and match(value)
+        if m:
+            kwargs[m.group(1)] = value[m.end():]
+        else:
+            args.append(value)
+    return args, kwargs
+
+
+def convert_values(action, convert, values):
+    """
+    Applies convert to all the values at once. The first value which
+    fails is reported like argparse reports a bad argument.
+    """
+    if convert is None:
+        return values
+    try:
+        return [convert(value) for value in values]
+    except (argparse.ArgumentTypeError, TypeError, ValueError):
+        pass
+    for value in values:
+        try:
+            convert(value)
+        except argparse.ArgumentTypeError as e:
+            raise argparse.ArgumentError(action, str(e))
+        except (TypeError, ValueError):
+            name = getattr(convert, '__name__', repr(convert))
+            raise argparse.ArgumentError(action, 'invalid {0} value: {1!r}'.format(name, value))
+
+
+
+def array_typecodes():
+    """The typecodes of array.array, probed as array.typecodes is Python 3 only ('q' from 3.3)"""
+    codes = ''
+    for typecode in 'bBhHiIlLqQfd': # numeric only
+        try:
+            array.array(typecode)
+            codes += typecode
+        except ValueError:
+            pass
+    return codes
+
+
+TYPECODES = array_typecodes()
+ARRAY_TYPECODES = {int: 'q' if 'q' in TYPECODES else 'l', float: 'd'}
+NUMPY_DTYPES = {int: 'int64', float: 'float64'}
+
+
+def container_factory(container, type=None):
+    """
+    Returns (convert, build): build(values) makes the container of the
+    strings values at once, convert is the type applied to each of them.
+    """
+    if container == 'numpy':
+        import numpy
+        convert = type or float
+        dtype = NUMPY_DTYPES.get(convert)
+        if dtype is None:
+            raise TypeError("container='numpy' needs type int or float, got {0!r}".format(type))
+        return convert, lambda values: numpy.array(values).astype(dtype)
+    if container == 'array':
+        typecode = ARRAY_TYPECODES.get(type or float)
+        if typecode is None:
+            raise TypeError("container='array' needs type int or float, got {0!r}".format(type))
+    elif container in tuple(TYPECODES):
+        typecode = container
+    else:
+        raise ValueError('Unknown container {0!r}'.format(container))
+    convert = type or (float if typecode in 'fd' else int)
+    return convert, lambda values: array.array(typecode, map(convert, values))
+
+
+
 class DictType(object):
     def __init__(self, value_type=None):
         self.value_type = value_type or (lambda x:x)
 
 
     def __call__(self, string):
-        match = re.match(r'([a-zA-Z_]\w*)=', string)
+        match = KEY_VALUE.match(string)
         if match:
-            name = match.group(1)
-            value = string[len(name)+1:]
-            return name, (self.value_type(value) if self.value_type else value)
+            value = string[match.end():]
+            return match.group(1), self.value_type(value)
         else:
             msg = "{0!r} is not a key=value".format(string)
             raise argparse.ArgumentTypeError(msg)
@@ -119,6 +423,11 @@ class DictType(object):
 
 
 class ArgsAction(argparse.Action):
+    """
+    Collects *args. With **kwargs (const is its dest) the name=value
+    values go to kwargs. The types are applied here, to all the values at
+    once, rather than by argparse one value at a time.
+    """
     def __init__(self,
                  option_strings,
                  dest,
@@ -136,36 +445,69 @@ class ArgsAction(argparse.Action):
                                  nargs=nargs,
                                  const=None,
                                  default=default,
-                                 type=type,
+                                 type=None,
                                  choices=choices,
                                  required=required,
                                  help=help,
                                  metavar=metavar,
                                  )
         self.varkw = const
+        self.value_type = type
+        self.kwargs_type = None # type of the **kwargs values
 
 
     def __call__(self, parser, namespace, values, option_string=None):
-        # Do some arbitrary processing of the input values
-        dict_type = DictType()
-        args = []
-        kwargs = []
-        for value in values:
-            try:
-                kwargs.append(dict_type(value))
-            except argparse.ArgumentTypeError:
-                args.append(value)
+        if self.varkw is None:
+            args, kwargs = values, None
+        else:
+            args, kwargs = split_kwargs(values)
+        setattr(namespace, self.dest, convert_values(self, self.value_type, list(args)))
+        if kwargs:
+            # copy: the namespace may still hold the action default, which is
+            # shared by every parse made with the same parser
+            kwargs_values = dict(getattr(namespace, self.varkw, {}))
+            kwargs_values.update(zip(kwargs, convert_values(self, self.kwargs_type, list(kwargs.values()))))
+            setattr(namespace, self.varkw, kwargs_values)
+
+
 
-        # Save the results in the namespace using the destination
-        # variable given to our constructor.
-        setattr(namespace, self.dest, args)
-        kwargs_values = getattr(namespace, self.varkw, {})
-        kwargs_values.update(dict(kwargs))
-        setattr(namespace, self.varkw, kwargs_values)
+class ArrayAction(argparse.Action):
+    """Collects the values of a Positional with a container"""
+    def __init__(self, option_strings, dest, nargs=None, default=None, type=None, choices=None, required=False,
+                 help=None, metavar=None, container='array'):
+        argparse.Action.__init__(self, option_strings=option_strings, dest=dest, nargs=nargs, default=default,
+                                 required=required, help=help, metavar=metavar)
+        self.convert, self.build = container_factory(container, type)
+        self.valid = frozenset(choices) if choices is not None else None
+
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        if values is self.default:
+            return setattr(namespace, self.dest, values)
+        try:
+            result = self.build(values)
+        except (TypeError, ValueError, OverflowError):
+            result = None
+        if result is None or self.valid is not None and not self.valid.issuperset(result):
+            raise argparse.ArgumentError(self, self.first_error(values))
+        setattr(namespace, self.dest, result)
+
+
+    def first_error(self, values):
+        name = getattr(self.convert, '__name__', repr(self.convert))
+        for i, value in enumerate(values):
+            try:
+                item = self.convert(value)
+            except (argparse.ArgumentTypeError, TypeError, ValueError):
+                return 'invalid {0} value: {1!r} (item {2})'.format(name, value, i)
+            if self.valid is not None and item not in self.valid:
+                return 'invalid choice: {0!r} (item {1})'.format(item, i)
+        return 'values out of range for {0}'.format(name)
 
 
 
 class KwargsAction(argparse.Action):
+    """Collects **kwargs from name=value values, converted by type"""
     def __init__(self,
                  option_strings,
                  dest,
@@ -183,24 +525,23 @@ class KwargsAction(argparse.Action):
                                  nargs=nargs,
                                  const=const,
                                  default=default,
-                                 type=type,
+                                 type=None,
                                  choices=choices,
                                  required=required,
                                  help=help,
                                  metavar=metavar,
                                  )
+        self.value_type = type
 
 
     def __call__(self, parser, namespace, values, option_string=None):
-        # Do some arbitrary processing of the input values
-        if isinstance(values, list):
-            values = dict(values)
-        elif not isinstance(values, dict):
-            values = dict([values])
-        # Save the results in the namespace using the destination
-        # variable given to our constructor.
-        kwargs_values = getattr(namespace, self.dest, {})
-        kwargs_values.update(values)
+        if isinstance(values, dict): # the default
+            return
+        args, kwargs = split_kwargs(values)
+        if args:
+            raise argparse.ArgumentError(self, '{0!r} is not a key=value'.format(args[0]))
+        kwargs_values = dict(getattr(namespace, self.dest, {}))
+        kwargs_values.update(zip(kwargs, convert_values(self, self.value_type, list(kwargs.values()))))
         setattr(namespace, self.dest, kwargs_values)
 
 
@@ -208,29 +549,34 @@ class KwargsAction(argparse.Action):
 
 
 class CallableCommandSpec(object):
+    __slots__ = ('obj', 'defaults', 'vars', 'varargs', 'varkw', 'memo', 'annotations')
     NONE = object()
 
-    def __init__(self, obj):
-        self.arg_spec = self.get_arg_spec(obj)
+    @timed('spec')
+    def __init__(self, obj, unbound=False):
+        arg_spec = self.get_arg_spec(obj, unbound)
         self.obj = obj
 
-        defaults = self.arg_spec.defaults or ()
-        n_args = len(self.arg_spec.args)
+        defaults = arg_spec.defaults or ()
+        n_args = len(arg_spec.args)
         n_defaults = len(defaults)
 
-        self.defaults = (self.NONE,) * (n_args - n_defaults) + defaults
-        self.vars = self.arg_spec.args
-        self.varargs = self.arg_spec.varargs
-        self.varkw = self.arg_spec.varkw
+        self.defaults = (self.NONE,) * (n_args - n_defaults) + tuple(defaults)
+        self.vars = tuple(arg_spec.args)
+        self.varargs = arg_spec.varargs
+        self.varkw = arg_spec.varkw
+        self.memo = getattr(obj, 'memo_cache', None) # see pyclap.memo.memoize
         self.annotations = dict()
-        for key in self.vars + [self.varargs] + [self.varkw]:
+        for key in self.vars + (self.varargs, self.varkw):
             if key:
-                self.annotations[key] = Annotation.from_(self.arg_spec.annotations.get(key, ()))
+                self.annotations[key] = Annotation.from_(arg_spec.annotations.get(key, ()))
 
 
-    def get_arg_spec(self, obj):
+    def get_arg_spec(self, obj, unbound=False):
         if inspect.isfunction(obj):
             arg_spec = getfullargspec(obj)
+            if unbound: # method taken from its class on Python 3
+                del arg_spec.args[0]
         elif inspect.ismethod(obj):
             arg_spec = getfullargspec(obj)
             del arg_spec.args[0] # remove first argument
@@ -245,6 +591,8 @@ class CallableCommandSpec(object):
 
 
     def __getattr__(self, item):
+        if item in CallableCommandSpec.__slots__: # not set yet
+            raise AttributeError(item)
         return getattr(self.obj, item)
 
 
@@ -288,11 +636,7 @@ class ObjectCommandsSpec(object):
     def __init__(self, obj, commands):
         self.commands = commands
         self.obj = obj
-        self.instances_cache = {}
         self.command_spec_cache = {}
-        if not hasattr(self.obj, '__enter__'):
-            self.obj.__enter__ = lambda : None
-            self.obj.__exit__ = lambda et, ex, tb: None
 
 
     def _get_command_spec(self, command):
@@ -305,9 +649,10 @@ class ObjectCommandsSpec(object):
         if item not in self.commands:
             return getattr(self.obj, item)
         else:
-            def wrapper(*args, **kwargs):
+            def run(ns, args, kwargs):
                 method = getattr(self.obj, item)
-                with self.obj:
+                args, kwargs = resolve_lazy(args, kwargs, self.obj, ns)
+                with command_scope(self.obj):
                     result = method(*args, **kwargs)
                     if iterable(result):
                         for res in result:
@@ -315,6 +660,9 @@ class ObjectCommandsSpec(object):
                     else:
                         yield result
 
+            def wrapper(*args, **kwargs):
+                return run(current_namespace(), args, kwargs) # run is only started when iterated
+
             wrapper.callable_spec = self._get_command_spec(item)
 
             return wrapper
@@ -324,10 +672,12 @@ class ClassCommandsSpec(object):
     def __init__(self, klass, commands):
         self.commands = commands
         self.klass = klass
-        self.instances_cache = {}
+        self.instances = InstancePool(klass,
+                                      maxsize=getattr(klass, 'instance_pool_size', InstancePool.MAXSIZE),
+                                      ttl=getattr(klass, 'instance_pool_ttl', None))
         self.command_spec_cache = {}
         self.arg_spec = self.get_arg_spec(klass)
-        self.common_meta = CallableCommandSpec(klass.__init__)
+        self.common_meta = constructor_spec(klass)
 
 
     def get_arg_spec(self, obj):
@@ -346,18 +696,13 @@ class ClassCommandsSpec(object):
 
 
     def _get_instance(self, constructor_args):
-        if constructor_args not in self.instances_cache:
-            obj = self.klass(*constructor_args)
-            if not hasattr(obj, '__enter__'):
-                self.klass.__enter__ = lambda s: None
-                self.klass.__exit__ = lambda s, et, ex, tb: None
-            self.instances_cache[constructor_args] = obj
-        return self.instances_cache[constructor_args]
+        return self.instances.get(constructor_args)
 
 
     def _get_command_spec(self, command):
         if command not in self.command_spec_cache:
-            self.command_spec_cache[command] = CallableCommandSpec(getattr(self.klass, command))
+            self.command_spec_cache[command] = CallableCommandSpec(getattr(self.klass, command),
+                                                                   unbound_function(self.klass, command))
         return self.command_spec_cache[command]
 
 
@@ -365,19 +710,22 @@ class ClassCommandsSpec(object):
         if item not in self.commands:
             return getattr(self.klass, item)
         else:
-            def wrapper(*args, **kwargs):
-                constructor_args = args[:len(self.common_meta.vars)]
+            def run(ns, args, kwargs):
+                constructor_args = tuple(args[:len(self.common_meta.vars)])
                 rest_args = args[len(self.common_meta.vars):]
-                obj = self._get_instance(constructor_args)
-                method = getattr(obj, item)
-                with obj:
-                    result = method(*rest_args, **kwargs)
-                    if iterable(result):
-                        for res in result:
-                            yield res
-                    else:
-                        yield result
+                with self.instances.using(constructor_args) as obj:
+                    method = getattr(obj, item)
+                    rest_args, kwargs = resolve_lazy(rest_args, kwargs, obj, ns)
+                    with command_scope(obj):
+                        result = method(*rest_args, **kwargs)
+                        if iterable(result):
+                            for res in result:
+                                yield res
+                        else:
+                            yield result
 
+            def wrapper(*args, **kwargs):
+                return run(current_namespace(), args, kwargs) # run is only started when iterated
 
             wrapper.callable_spec = self._get_command_spec(item)
 
@@ -385,6 +733,250 @@ class ClassCommandsSpec(object):
 
 
 
+class InstancePool(object):
+    """
+    Thread-safe LRU pool of the instances built by factory, keyed by
+    constructor arguments. When the pool holds more than maxsize instances
+    (None for no limit), or an instance is older than ttl seconds, it is
+    evicted and passed to on_evict (which calls its close() method by
+    default); instances in use are only handed to on_evict once released.
+    Instances are built outside the lock, once per key: the threads asking
+    for the same key meanwhile wait for it, the others are not held up.
+    """
+    MAXSIZE = 128
+
+    def __init__(self, factory, maxsize=MAXSIZE, ttl=None, on_evict=None):
+        self.factory = factory
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict or close_instance
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._instances = OrderedDict() # key -> (instance, creation time)
+        self._users = {} # id(instance) -> number of users
+        self._retired = {} # id(instance) -> instance evicted while in use
+        self._building = {} # key -> PendingInstance, while its factory runs
+        self._lock = threading.RLock()
+
+
+    def get(self, key):
+        """Returns the instance for key, building it on a miss"""
+        evicted = []
+        try:
+            return self._lookup(key, False, evicted)
+        finally:
+            self._evict(evicted)
+
+
+    def acquire(self, key):
+        """get() and mark the instance as used until release()"""
+        evicted = []
+        try:
+            return self._lookup(key, True, evicted)
+        finally:
+            self._evict(evicted)
+
+
+    def release(self, obj):
+        with self._lock:
+            users = self._users.pop(id(obj)) - 1
+            if users:
+                self._users[id(obj)] = users
+                return
+            obj = self._retired.pop(id(obj), None)
+        if obj is not None:
+            self.on_evict(obj)
+
+
+    @contextmanager
+    def using(self, key):
+        obj = self.acquire(key)
+        try:
+            yield obj
+        finally:
+            self.release(obj)
+
+
+    def clear(self):
+        """Evicts every instance"""
+        with self._lock:
+            evicted = [obj for obj, created in self._instances.values()]
+            self._instances.clear()
+        self._evict(evicted)
+
+
+    def stats(self):
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                        size=len(self._instances), in_use=len(self._users))
+
+
+    def _lookup(self, key, use, evicted):
+        """The instance of key, marked as used if use; appends the instances to evict to evicted"""
+        while True:
+            with self._lock:
+                entry = self._instances.pop(key, None)
+                if entry is not None and self.ttl is not None and time.time() - entry[1] > self.ttl:
+                    evicted.append(entry[0])
+                    entry = None
+                if entry is not None:
+                    self.hits += 1
+                    return self._insert(key, entry, use, evicted)
+                pending = self._building.get(key)
+                if pending is None: # built by this thread
+                    pending = self._building[key] = PendingInstance()
+                    self.misses += 1
+                    break
+            pending.wait() # built by another thread, then looked up again
+        try:
+            entry = (self.factory(*key), time.time())
+        except BaseException as e:
+            with self._lock:
+                del self._building[key]
+            pending.finish(e)
+            raise
+        with self._lock:
+            del self._building[key]
+            obj = self._insert(key, entry, use, evicted)
+        pending.finish()
+        return obj
+
+
+    def _insert(self, key, entry, use, evicted):
+        """Called with the lock held"""
+        self._instances[key] = entry
+        if use:
+            self._users[id(entry[0])] = self._users.get(id(entry[0]), 0) + 1
+        if self.maxsize is not None:
+            while len(self._instances) > self.maxsize:
+                evicted.append(self._instances.popitem(last=False)[1][0])
+        return entry[0]
+
+
+    def _evict(self, evicted):
+        """Hands the evicted instances which are not in use to on_evict"""
+        with self._lock:
+            self.evictions += len(evicted)
+            ready = []
+            for obj in evicted:
+                if id(obj) in self._users:
+                    self._retired[id(obj)] = obj # handed over by release()
+                else:
+                    ready.append(obj)
+        for obj in ready:
+            self.on_evict(obj)
+
+
+    def __len__(self):
+        return len(self._instances)
+
+
+
+class PendingInstance(object):
+    """An instance of InstancePool being built, and the error of its factory if it failed"""
+
+    def __init__(self):
+        self.error = None
+        self._done = threading.Event()
+
+
+    def finish(self, error=None):
+        self.error = error
+        self._done.set()
+
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+
+
+
+def close_instance(obj):
+    """Default eviction callback of InstancePool"""
+    close = getattr(obj, 'close', None)
+    if close is not None:
+        close()
+
+
+
+class NullScope(object):
+    def __enter__(self):
+        return None
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+
+class ReentrantScope(object):
+    """
+    Enters obj, a context manager, only in the outermost of nested scopes
+    of the same thread, so that chained commands share one __enter__/__exit__.
+    """
+    _local = threading.local()
+
+    def __init__(self, obj):
+        self.obj = obj
+
+
+    def _depths(self):
+        depths = getattr(self._local, 'depths', None)
+        if depths is None:
+            depths = self._local.depths = {}
+        return depths
+
+
+    def __enter__(self):
+        depths = self._depths()
+        depth = depths.get(id(self.obj), 0)
+        if not depth:
+            self.obj.__enter__()
+        depths[id(self.obj)] = depth + 1
+        return self.obj
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        depths = self._depths()
+        depth = depths.pop(id(self.obj)) - 1
+        if depth:
+            depths[id(self.obj)] = depth
+            return False
+        return self.obj.__exit__(exc_type, exc_val, exc_tb)
+
+
+
+def command_scope(obj):
+    """The context manager wrapped around commands of obj: obj itself, entered once, if it is one"""
+    if hasattr(type(obj), '__enter__') and hasattr(type(obj), '__exit__'):
+        return ReentrantScope(obj)
+    return NullScope()
+
+
+
+def constructor_spec(klass):
+    """CallableCommandSpec of the constructor of klass, without the instance argument"""
+    init = klass.__init__
+    if init is object.__init__: # to avoid an error
+        init = lambda self: None
+    return CallableCommandSpec(init, inspect.isfunction(init))
+
+
+
+def unbound_function(klass, name):
+    """
+    True if klass.name is a plain function expecting the instance as
+    first argument, which is what methods taken from a class are on Python 3.
+    """
+    for base in inspect.getmro(klass):
+        if name in vars(base):
+            return inspect.isfunction(vars(base)[name]) and inspect.isfunction(getattr(klass, name))
+    return False
+
+
+
 class BaseParserBuilder(object):
     def can_build(self, obj):
         raise NotImplementedError()
@@ -395,22 +987,38 @@ class BaseParserBuilder(object):
         self.parser_conf = ArgumentParser.get_conf(obj)
         conf = self.parser_conf.copy()
         conf.update(conf_params)
+        case_sensitive = conf.pop('case_sensitive', getattr(self.obj, 'case_sensitive', True))
+        lazy_subcommands = conf.pop('lazy_subcommands', getattr(self.obj, 'lazy_subcommands', False))
+        fast_parse = conf.pop('fast_parse', getattr(self.obj, 'fast_parse', False))
+        argfile_prefix = conf.pop('argfile_prefix', getattr(self.obj, 'argfile_prefix', None))
+        config_defaults = conf.pop('config_defaults', getattr(self.obj, 'config_defaults', None))
         parser = ArgumentParser(**conf)
-        parser.CASE_SENSITIVE = conf_params.get('case_sensitive', getattr(self.obj, 'case_sensitive', True))
+        parser.CONFIG_DEFAULTS = config_defaults
+        parser.CASE_SENSITIVE = case_sensitive
+        parser.LAZY_SUBCOMMANDS = lazy_subcommands
+        parser.FAST_PARSE = fast_parse
+        if argfile_prefix:
+            if argfile_prefix in parser.prefix_chars:
+                raise ValueError('The prefix {0!r} is already taken!'.format(argfile_prefix))
+            parser.ARGFILE_PREFIX = argfile_prefix
+        self.populate(parser, obj)
         return parser
 
 
+    def populate(self, parser, obj):
+        """Adds the arguments and commands of obj to parser"""
+        raise NotImplementedError()
+
+
 
 class CallableParserBuilder(BaseParserBuilder):
     def can_build(self, obj):
         return inspect.isfunction(obj) or inspect.ismethod(obj)
 
 
-    def build_parser(self, obj, **conf_params):
-        parser = super(CallableParserBuilder, self).build_parser(obj, **conf_params)
-        parser.set_defaults(_cmd_func_=self.obj)
-        parser.populate_from(CallableCommandSpec(self.obj))
-        return parser
+    def populate(self, parser, obj):
+        parser.set_defaults(_cmd_func_=obj)
+        parser.populate_from(CallableCommandSpec(obj))
 
 
 
@@ -418,11 +1026,9 @@ class ObjectParserBuilder(BaseParserBuilder):
     def can_build(self, obj):
         return not inspect.isclass(obj) and hasattr(obj, 'commands')
 
-    def build_parser(self, obj,  **conf_params):
-        parser = super(ObjectParserBuilder, self).build_parser(obj, **conf_params)
+    def populate(self, parser, obj):
         parser.populate_subcommands(obj.commands, ObjectCommandsSpec(obj, obj.commands))
         parser.set_defaults(_cmd_func_=None)
-        return parser
 
 
 
@@ -430,15 +1036,13 @@ class ClassParserBuilder(BaseParserBuilder):
     def can_build(self, obj):
         return inspect.isclass(obj) and hasattr(obj, 'commands')
 
-    def build_parser(self, obj, **conf_params):
-        parser = super(ClassParserBuilder, self).build_parser(obj, **conf_params)
-        callable_spec = CallableCommandSpec(obj.__init__)
+    def populate(self, parser, obj):
+        callable_spec = constructor_spec(obj)
         if callable_spec.varargs or callable_spec.varkw:
             raise TypeError('*args and **kwargs are not allowed in constructor')
         parser.populate_from(callable_spec)
         parser.populate_subcommands(obj.commands, ClassCommandsSpec(obj, obj.commands))
         parser.set_defaults(_cmd_func_=None)
-        return parser
 
 
 
@@ -447,11 +1051,9 @@ class ModuleParserBuilder(BaseParserBuilder):
         return inspect.ismodule(obj) and hasattr(obj, 'commands')
 
 
-    def build_parser(self, obj, **conf_params):
-        parser = super(ModuleParserBuilder, self).build_parser(obj, **conf_params)
-        parser.populate_subcommands(self.obj.commands, ModuleCommandsSpec(self.obj, self.obj.commands))
+    def populate(self, parser, obj):
+        parser.populate_subcommands(obj.commands, ModuleCommandsSpec(obj, obj.commands))
         parser.set_defaults(_cmd_func_= None)
-        return parser
 
 
 
@@ -469,13 +1071,282 @@ class ParserFactory(object):
         self.builder_list = [k() for k in reversed(self.builder_list)]
 
 
-    def build_parser(self, obj, **conf_params):
+    def builder_for(self, obj):
         for builder in self.builder_list:
             if builder.can_build(obj):
-                return builder.build_parser(obj, **conf_params)
+                return builder
         raise ValueError("Parser builder for the object not found")
 
 
+    @timed('build')
+    def build_parser(self, obj, **conf_params):
+        return self.builder_for(obj).build_parser(obj, **conf_params)
+
+
+
+class CommandGroup(object):
+    """
+    A command whose subcommands are the commands of target: an object, or
+    the dotted path 'package.module' or 'package.module:attribute' of one,
+    imported only when the command is selected. A function target makes a
+    single lazily imported command.
+    """
+
+    def __init__(self, name, target, help=None):
+        self.name = name
+        self.target = target
+        self.help = help
+        self._resolved = None if isinstance(target, basestring) else target
+
+
+    def resolve(self):
+        if self._resolved is None:
+            import importlib
+            module_name, _, attribute = self.target.partition(':')
+            try:
+                obj = importlib.import_module(module_name)
+            except ImportError:
+                if attribute or '.' not in module_name:
+                    raise
+                module_name, _, attribute = module_name.rpartition('.') # package.module.attribute
+                obj = importlib.import_module(module_name)
+            for part in attribute.split('.') if attribute else ():
+                obj = getattr(obj, part)
+            self._resolved = obj
+        return self._resolved
+
+
+    def __repr__(self):
+        return 'group({0!r}, {1!r})'.format(self.name, self.target)
+
+
+
+def group(name, target, help=None):
+    """Entry of a commands list standing for the commands of target, see CommandGroup"""
+    return CommandGroup(name, target, help)
+
+
+def as_group(entry):
+    """The CommandGroup of an entry of a commands list, None for a plain command name"""
+    if isinstance(entry, CommandGroup):
+        return entry
+    if '.' in entry or ':' in entry: # dotted path, named after its last part
+        return CommandGroup(re.split('[.:]', entry)[-1], entry)
+    return None
+
+
+def command_names(commands):
+    """The names of the entries of a commands list"""
+    names = []
+    for entry in commands:
+        g = as_group(entry)
+        names.append(g.name if g is not None else entry)
+    return names
+
+
+
+class CommandIndex(object):
+    """
+    Sorted index of command names resolving exact names and abbreviations
+    with a binary search instead of scanning all the commands.
+    """
+
+    def __init__(self, commands, case_sensitive=True):
+        self.commands = commands
+        self.case_sensitive = case_sensitive
+        self.size = len(commands)
+        self.names = {}
+        for name in commands:
+            self.names.setdefault(self.fold(name), []).append(name)
+        self.keys = sorted(self.names)
+
+
+    def fold(self, name):
+        return name if self.case_sensitive else name.upper()
+
+
+    def match(self, abbrev):
+        """Returns the command matching abbrev, None if no command matches"""
+        key = self.fold(abbrev)
+        perfect_matches = self.names.get(key, ())
+        if len(perfect_matches) == 1:
+            return perfect_matches[0]
+
+        keys = self.keys
+        i = bisect_left(keys, key)
+        if i == len(keys) or not keys[i].startswith(key):
+            return None
+        matches = self.names[keys[i]]
+        if len(matches) == 1 and (i + 1 == len(keys) or not keys[i + 1].startswith(key)):
+            return matches[0]
+
+        raise NameError('Ambiguous command {0!r}: matching {1}'.format(abbrev, self.complete(abbrev)))
+
+
+    def complete(self, prefix):
+        """Returns the commands starting with prefix"""
+        key = self.fold(prefix)
+        keys = self.keys
+        i = bisect_left(keys, key)
+        matches = []
+        while i < len(keys) and keys[i].startswith(key):
+            matches.extend(self.names[keys[i]])
+            i += 1
+        return matches
+
+
+
+class LazyParserMap(dict):
+    """
+    Name to sub-parser map of a subparsers action. Sub-parsers registered
+    with add_lazy() are only built when they are looked up, so parsing a
+    single command does not pay for introspecting all the others.
+    """
+
+    def __init__(self):
+        dict.__init__(self)
+        self.names = []
+        self.stubs = {}
+        self.groups = set()
+        self.building = None
+
+
+    def add_lazy(self, name, build, group=False):
+        """Registers name, build() must add the sub-parser for it"""
+        self.names.append(name)
+        self.stubs[name] = build
+        if group:
+            self.groups.add(name)
+        dict.__setitem__(self, name, None)
+
+
+    def materialize(self, name):
+        build = self.stubs.pop(name, None)
+        if build is not None:
+            self.building = name # hide the stub from the add_parser conflict check
+            try:
+                build()
+            finally:
+                self.building = None
+
+
+    def materialize_all(self, skip=()):
+        for name in list(self.names):
+            if name not in skip:
+                self.materialize(name)
+
+
+    def __contains__(self, name):
+        return name != self.building and dict.__contains__(self, name)
+
+
+    def __getitem__(self, name):
+        self.materialize(name)
+        return dict.__getitem__(self, name)
+
+
+    def get(self, name, default=None):
+        if name in self:
+            return self[name]
+        return default
+
+
+    def values(self):
+        self.materialize_all()
+        return dict.values(self)
+
+
+    def items(self):
+        self.materialize_all()
+        return dict.items(self)
+
+
+
+class ParserCache(object):
+    """
+    LRU cache of built parsers, keyed on the identity of the target object
+    and on the parser configuration. An entry is rebuilt when the target's
+    parser configuration (commands, docstring, ArgumentParser attributes,
+    annotations) no longer matches the one it was built from.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def fingerprint(obj):
+        """Returns the part of obj the built parser depends on"""
+        commands = getattr(obj, 'commands', None)
+        return (tuple(commands) if commands is not None else None,
+                ArgumentParser.get_conf(obj),
+                getattr(obj, '__annotations__', None))
+
+
+    def get(self, obj, **conf_params):
+        """Returns a parser for obj, building it on a miss"""
+        key = (id(obj), tuple(sorted(conf_params.items())))
+        try:
+            hash(key)
+        except TypeError: # e.g. parents=[...]: not cacheable
+            return ArgumentParser.parser_from(obj, **conf_params)
+
+        fingerprint = self.fingerprint(obj)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is obj and entry[1] == fingerprint:
+                self._entries[key] = self._entries.pop(key) # mark as recently used
+                self.hits += 1
+                count('parser_cache.hits')
+                return entry[2]
+
+        parser = ArgumentParser.parser_from(obj, **conf_params)
+        count('parser_cache.misses')
+        with self._lock:
+            self.misses += 1
+            self._entries.pop(key, None)
+            self._entries[key] = (obj, fingerprint, parser)
+            self._trim()
+        return parser
+
+
+    def invalidate(self, obj):
+        """Drops every parser built for obj"""
+        with self._lock:
+            for key in [k for k, v in self._entries.items() if v[0] is obj]:
+                del self._entries[key]
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+    def resize(self, maxsize):
+        """Changes the bound of the cache, None means unbounded"""
+        with self._lock:
+            self.maxsize = maxsize
+            self._trim()
+
+
+    def _trim(self):
+        if self.maxsize is not None:
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+
+parser_cache = ParserCache()
+
 
 
 class ArgumentParser(argparse.ArgumentParser):
@@ -484,6 +1355,10 @@ class ArgumentParser(argparse.ArgumentParser):
     .commands and .subparsers.
     """
     CASE_SENSITIVE = True
+    LAZY_SUBCOMMANDS = False
+    FAST_PARSE = False
+    ARGFILE_PREFIX = None
+    CONFIG_DEFAULTS = None
     PARSER_CFG = getfullargspec(argparse.ArgumentParser.__init__).args[1:]
     NONE = object()
 
@@ -511,31 +1386,187 @@ class ArgumentParser(argparse.ArgumentParser):
     def __init__(self, ignore_errors=False, *args, **kwargs):
         self.ignore_errors = ignore_errors
         self.ignored_errors = []
+        self.raise_errors = kwargs.pop('raise_errors', False)
+        self._fast_parser = None
+        self._help_cache = {} # (kind, prefix, terminal width) -> text, for the _help_state below
+        self._help_state = None
+        self.command_path = () # the names of the commands leading to this parser, for CONFIG_DEFAULTS
         super(ArgumentParser, self).__init__(*args, **kwargs)
 
 
+    @timed('subcommands')
     def populate_subcommands(self, commands, commands_spec, title='subcommands', cmd_prefix=''):
         """Extract a list of sub-commands from obj and add them to the parser"""
 
         if hasattr(commands_spec, 'cmd_prefix') and commands_spec.cmd_prefix in self.prefix_chars:
             raise ValueError('The prefix {0!r} is already taken!'.format(cmd_prefix))
 
+        groups = [as_group(entry) for entry in commands]
         if not hasattr(self, 'subparsers'):
             self.subparsers = self.add_subparsers(title=title)
+            if self.LAZY_SUBCOMMANDS or any(groups): # groups are only imported when selected
+                self.subparsers._name_parser_map = self.subparsers.choices = LazyParserMap()
         elif title:
             self.add_argument_group(title=title) # populate ._action_groups
 
+        self.commands_spec = commands_spec
         prefix_len = len(getattr(commands_spec, 'cmd_prefix', ''))
         add_help = getattr(commands_spec, 'add_help', True)
+        parser_map = self.subparsers._name_parser_map
+        lazy = isinstance(parser_map, LazyParserMap)
+
+        for cmd, g in zip(commands, groups):
+            if g is not None and lazy:
+                parser_map.add_lazy(g.name, lambda g=g: self._add_group_subparser(g, add_help), group=True)
+                self.subparsers._choices_actions.append(argparse.Action([], g.name, help=g.help, metavar=g.name))
+            elif g is not None:
+                self._add_group_subparser(g, add_help)
+            elif lazy:
+                parser_map.add_lazy(cmd, lambda cmd=cmd: self._add_subparser(cmd, commands_spec, prefix_len, add_help))
+            else:
+                self._add_subparser(cmd, commands_spec, prefix_len, add_help)
+
+
+    def _add_subparser(self, cmd, commands_spec, prefix_len, add_help):
+        func = getattr(commands_spec, cmd[prefix_len:]) # strip the prefix
+        sub_parser = self.subparsers.add_parser(
+                            cmd, add_help=add_help, help=func.__doc__, raise_errors=self.raise_errors,
+                            **self.get_conf(func))
+        sub_parser.set_defaults(_cmd_name_=cmd[prefix_len:], _cmd_func_=func)
+        sub_parser.CONFIG_DEFAULTS = self.CONFIG_DEFAULTS
+        sub_parser.command_path = self.command_path + (cmd[prefix_len:],)
+        sub_parser.populate_from(func.callable_spec)
+        self._help_cache.clear()
+        return sub_parser
+
+
+    def _add_group_subparser(self, g, add_help):
+        target = g.resolve()
+        conf = self.get_conf(target)
+        if not isinstance(self._get_subparsers(), LazyParserMap): # else the entry is added by populate_subcommands
+            conf['help'] = g.help
+        sub_parser = self.subparsers.add_parser(
+                            g.name, add_help=add_help, raise_errors=self.raise_errors, **conf)
+        sub_parser.CASE_SENSITIVE = getattr(target, 'case_sensitive', self.CASE_SENSITIVE)
+        sub_parser.LAZY_SUBCOMMANDS = getattr(target, 'lazy_subcommands', self.LAZY_SUBCOMMANDS)
+        config = getattr(target, 'config_defaults', None)
+        if config is not None: # the group's own configuration, rooted at the group
+            sub_parser.CONFIG_DEFAULTS = config
+        else:
+            sub_parser.CONFIG_DEFAULTS = self.CONFIG_DEFAULTS
+            sub_parser.command_path = self.command_path + (g.name,)
+        sub_parser.set_defaults(_cmd_name_=g.name)
+        ParserFactory().builder_for(target).populate(sub_parser, target)
+        self._help_cache.clear()
+        return sub_parser
+
+
+    def format_help(self, prefix=None):
+        """The help, listing only the commands starting with prefix if given. Cached per terminal width."""
+        key = ('help', prefix, terminal_width())
+        text = self._cached_help(key)
+        if text is None:
+            if prefix is None:
+                self._prepare_command_help(None)
+                text = super(ArgumentParser, self).format_help()
+            else:
+                text = self._format_filtered_help(prefix)
+            self._cache_help(key, text)
+        return text
+
 
-        for cmd in commands:
-            func = getattr(commands_spec, cmd[prefix_len:]) # strip the prefix
-            sub_parser = self.subparsers.add_parser(
-                                cmd, add_help=add_help, help=func.__doc__, **self.get_conf(func))
-            sub_parser.set_defaults(_cmd_name_=cmd[prefix_len:], _cmd_func_=func)
-            sub_parser.populate_from(func.callable_spec)
+    def format_usage(self):
+        key = ('usage', None, terminal_width())
+        text = self._cached_help(key)
+        if text is None:
+            text = self._cache_help(key, super(ArgumentParser, self).format_usage())
+        return text
 
 
+    def _cached_help(self, key):
+        """The cached text of key, None if the parser changed since (arguments, also added through groups, or texts)"""
+        if self._help_fingerprint() != self._help_state:
+            return None
+        return self._help_cache.get(key)
+
+
+    def _cache_help(self, key, text):
+        state = self._help_fingerprint() # after building the sub-parsers listed by text
+        if state != self._help_state:
+            self._help_cache.clear()
+            self._help_state = state
+        self._help_cache[key] = text
+        return text
+
+
+    def _help_fingerprint(self):
+        subparsers = getattr(self, 'subparsers', None)
+        return (len(self._actions), len(self._action_groups), self.prog, self.usage, self.description, self.epilog,
+                len(subparsers._choices_actions) if subparsers is not None else 0)
+
+
+    def print_help(self, file=None, prefix=None):
+        self._print_message(self.format_help(prefix), file or sys.stdout)
+
+
+    def _prepare_command_help(self, names):
+        """Builds the sub-parsers of names (all but the groups if None) and sorts their help entries"""
+        subparsers = self._get_subparsers()
+        if isinstance(subparsers, LazyParserMap):
+            for name in subparsers.names if names is None else names:
+                if name not in subparsers.groups: # groups are listed without importing them
+                    subparsers.materialize(name)
+            # sub-parsers add their help entry when built: restore the command order
+            position = dict((name, i) for i, name in enumerate(subparsers.names))
+            self.subparsers._choices_actions.sort(key=lambda a: position.get(a.dest, len(position)))
+
+
+    def _format_filtered_help(self, prefix):
+        """The help listing the commands starting with prefix only, without building the others"""
+        subparsers = self._get_subparsers()
+        names = self._command_index(subparsers).complete(prefix) if subparsers is not None else []
+        self._prepare_command_help(names)
+        action = self.subparsers
+        choices, choices_actions = action.choices, action._choices_actions
+        selected = set(names)
+        action.choices = OrderedDict((name, None) for name in names)
+        action._choices_actions = [a for a in choices_actions if a.dest in selected]
+        try:
+            text = super(ArgumentParser, self).format_help()
+        finally:
+            action.choices, action._choices_actions = choices, choices_actions
+        if not names:
+            text += '\nNo command starts with {0!r}\n'.format(prefix)
+        return text
+
+
+    def _check_value(self, action, value):
+        choices = action.choices
+        if isinstance(choices, Choices):
+            if value not in choices:
+                raise argparse.ArgumentError(action, choices.error(value))
+        else:
+            super(ArgumentParser, self)._check_value(action, value)
+
+
+    def _help_prefix(self, arg_list):
+        """
+        The PREFIX of a final '-h PREFIX' asking for the help of some
+        commands only, else None: after a command, -h is its own help.
+        """
+        if len(arg_list) < 2 or arg_list[-1].startswith(self.prefix_chars[0]):
+            return None
+        for action in self._actions:
+            if isinstance(action, argparse._HelpAction) and arg_list[-2] in action.option_strings:
+                try:
+                    cmd = self._find_cmd(arg_list[:-2], self._get_subparsers())[1]
+                except NameError: # an ambiguous command is still a command
+                    return None
+                return arg_list[-1] if cmd is None else None
+        return None
+
+
+    @timed('populate')
     def populate_from(self, callable_spec):
         """
         return a populated ArgumentParser instance.
@@ -543,79 +1574,156 @@ class ArgumentParser(argparse.ArgumentParser):
 
         prefix = self.prefix = getattr(callable_spec, 'prefix_chars', '-')[0]
         self.callable_spec = callable_spec
+        config = self.CONFIG_DEFAULTS
 
         for name, default in zip(callable_spec.vars, callable_spec.defaults):
             a = callable_spec.annotations[name]
+            if a.kind == 'flag' and default is not callable_spec.NONE and default is not False:
+                raise TypeError('Flag {0!r} wants default False, got {1!r}'.format(name, default))
+            if config is not None: # the configured value replaces the default
+                default = config.default(self.command_path, name, default, a.kind)
             metavar = a.metavar
+            help = a.help # annotations are shared: never modified
+            choices = indexed_choices(a.choices)
+            if metavar is None and isinstance(choices, Choices) and len(choices) > choices.METAVAR_LIMIT:
+                metavar = choices.metavar()
 
             if default is callable_spec.NONE:
                 dflt = None
             else:
                 dflt = default
-                if a.help is None and  a.kind != 'flag':
-                    a.help = '[{0}]'.format(dflt)
-                elif a.help:
-                    a.help = a.help.format(default=dflt)
+                if help is None and  a.kind != 'flag':
+                    help = '[{0}]'.format(dflt)
+                elif help:
+                    help = help.format(default=dflt)
 
             if a.kind in ('option', 'flag'):
                 if a.abbrev:
                     short_long = (prefix + a.abbrev, prefix * 2 + name_from_python(name))
                 else:
                     short_long = (prefix * 2 + name_from_python(name), )
+            elif getattr(a, 'container', None):
+                self.add_argument(name, nargs='+' if default is callable_spec.NONE else '*', help=help,
+                                  default=dflt, type=a.type, choices=choices, metavar=metavar,
+                                  action=ArrayAction, container=a.container)
             elif default is callable_spec.NONE: # required argument
-                self.add_argument(name, help=a.help, type=a.type,
-                                   choices=a.choices, metavar=metavar)
+                self.add_argument(name, help=help, type=a.type,
+                                   choices=choices, metavar=metavar)
             else: # default argument
                 self.add_argument(
-                    name, nargs='?', help=a.help, default=dflt,
-                    type=a.type, choices=a.choices, metavar=metavar)
+                    name, nargs='?', help=help, default=dflt,
+                    type=a.type, choices=choices, metavar=metavar)
 
             if a.kind == 'option':
                 self.add_argument(dest=name,
-                    help=a.help, default=dflt, type=a.type,
-                    choices=a.choices, metavar=metavar, *short_long)
+                    help=help, default=dflt, type=a.type,
+                    choices=choices, metavar=metavar, *short_long)
             elif a.kind == 'flag':
-                if default is not callable_spec.NONE and default is not False:
-                    raise TypeError('Flag {0!r} wants default False, got {1!r}'.format(name, default))
-                self.add_argument(action='store_true', dest=name, help=a.help, *short_long)
+                self.add_argument(action='store_true', dest=name, help=help, default=bool(dflt), *short_long)
 
         if callable_spec.varargs:
             a =callable_spec.annotations[callable_spec.varargs]
-            self.add_argument(callable_spec.varargs, nargs='*', help=a.help, default=[], action=ArgsAction,
-                               const=callable_spec.varkw, type=a.type, metavar=a.metavar)
+            if getattr(a, 'container', None):
+                raise TypeError('*{0} is passed as a tuple: use a Positional with a container on a regular '
+                                'argument instead'.format(callable_spec.varargs))
+            action = self.add_argument(callable_spec.varargs, nargs='*', help=a.help, default=[], action=ArgsAction,
+                                       const=callable_spec.varkw, type=a.type, metavar=a.metavar)
+            if callable_spec.varkw:
+                action.kwargs_type = callable_spec.annotations[callable_spec.varkw].type
         if callable_spec.varkw:
             a = callable_spec.annotations[callable_spec.varkw]
             self.add_argument(callable_spec.varkw, nargs='*', help=a.help, default={}, action=KwargsAction,
-                               type=DictType(a.type), metavar=a.metavar)
+                               type=a.type, metavar=a.metavar)
 
 
+    @timed('consume')
     def consume(self, arg_list, only_known_args=False):
         """Call the underlying function with the args. Works also for
         command containers, by dispatching to the right sub-parser."""
         args, varargs, kwargs, func, ns = self.smart_parse_args(arg_list, only_known_args)
 
-        return ns, func(*(args + varargs), **kwargs)
+        return ns, self.call_command(func, args + varargs, kwargs, ns)
+
+
+    def call_command(self, func, args, kwargs, ns=None):
+        """
+        Calls func, a command of this parser, with parsed arguments. The
+        LazyDefault values are resolved, and stored back into ns if given.
+        """
+        memo = self._get_memo(func)
+        args, kwargs = resolve_lazy(args, kwargs, ns=ns) # those of instance attributes are left to the wrappers
+        with phase('command'), calling(ns):
+            if memo is not None:
+                return memo.call(func, args, kwargs)
+            return func(*args, **kwargs)
+
+
+    def command_spec(self, func):
+        """The CallableCommandSpec of func, a command of this parser"""
+        return getattr(func, 'callable_spec', None) or getattr(self, 'callable_spec', None)
+
+
+    def _get_memo(self, func):
+        """The MemoCache of the command func, if it is memoized"""
+        if func is None or is_async_command(func):
+            return None
+        return getattr(self.command_spec(func), 'memo', None)
 
 
+    def memo_stats(self):
+        """Maps the memoized commands built so far (None for the parser's own function) to their cache stats"""
+        stats = {}
+        memo = self._get_memo(self._defaults.get('_cmd_func_'))
+        if memo is not None:
+            stats[None] = memo.stats()
+        subparsers = self._get_subparsers()
+        items = dict.items(subparsers) if isinstance(subparsers, LazyParserMap) else (subparsers or {}).items()
+        for name, subparser in items:
+            memo = subparser._get_memo(subparser._defaults.get('_cmd_func_'))
+            if memo is not None:
+                stats[name] = memo.stats()
+        return stats
+
+
+    @timed('parse')
     def smart_parse_args(self, arg_list, only_known_args=False):
         cmd, subparser = None, None
+        owner = self # the parser of the selected command, deeper than self in nested groups
+
+        if self.ARGFILE_PREFIX:
+            arg_list = self._expand_argfiles(arg_list)
 
         if hasattr(self, 'subparsers'):
+            prefix = self._help_prefix(arg_list)
+            if prefix is not None:
+                self.print_help(prefix=prefix)
+                self.exit()
             subparsers = self._get_subparsers()
             cmd, arg_list = self._extract_cmd(arg_list, subparsers)
             subparser = subparsers.get(cmd)
-
-        if only_known_args:
+            position = arg_list.index(cmd) if cmd else None
+            while subparser is not None and hasattr(subparser, 'subparsers'): # a group: select its command
+                i, nested = subparser._find_cmd(arg_list[position + 1:], subparser._get_subparsers())
+                if nested is None:
+                    break
+                position += i + 1
+                arg_list[position] = nested
+                owner, cmd, subparser = subparser, nested, subparser._get_subparsers().get(nested)
+
+        ns = None
+        if self.FAST_PARSE and not only_known_args and owner is self:
+            ns = self._fast_parse(arg_list, cmd, subparser)
+        if ns is None and only_known_args:
             ns = vars(self.parse_known_args(arg_list))
-        else:
+        elif ns is None:
             ns = vars(self.parse_args(arg_list))
 
         func = self._defaults['_cmd_func_']
 
-        if hasattr(self, 'callable_spec'):
-            args = [ns[a] for a in self.callable_spec.vars]
-            varargs = ns.get(self.callable_spec.varargs or '', [])
-            kwargs = ns.get(self.callable_spec.varkw or '', {})
+        if hasattr(owner, 'callable_spec'):
+            args = [ns[a] for a in owner.callable_spec.vars]
+            varargs = ns.get(owner.callable_spec.varargs or '', [])
+            kwargs = ns.get(owner.callable_spec.varkw or '', {})
         else:
             args = []
             varargs = []
@@ -623,27 +1731,79 @@ class ArgumentParser(argparse.ArgumentParser):
 
         #TODO review this code.. should write tests
 		#Should we analize collisions?
-        if subparser:
+        if subparser and hasattr(subparser, 'callable_spec'):
             parser_args = [ns[a] for a in subparser.callable_spec.vars]
             parser_varargs = ns.get(subparser.callable_spec.varargs or '', [])
             parser_kwargs = ns.get(subparser.callable_spec.varkw or '', {})
+        else:
+            parser_args, parser_varargs, parser_kwargs = [], [], {}
 
         if subparser is None and cmd is not None:
-            return  ns, self.missing(cmd)
+            return  ns, owner.missing(cmd)
         elif subparser is not None: # use the sub parser
             func = subparser._defaults['_cmd_func_']
+            if func is None and hasattr(subparser, 'subparsers'):
+                subparser.error('A command is required')
             ns['_cmd_func_'] = func
 
         if subparser:
-            #noinspection PyUnboundLocalVariable
             kwargs.update(parser_kwargs)
-            #noinspection PyUnboundLocalVariable
             return args + parser_args, varargs + parser_varargs, kwargs, func, ns
 
         return args, varargs, kwargs, func, ns
 
 
 
+    def _expand_argfiles(self, arg_list):
+        """Replaces the @file arguments by the arguments in the files"""
+        prefix = self.ARGFILE_PREFIX
+        if not any(arg[:1] in prefix and len(arg) > 1 for arg in arg_list):
+            return arg_list
+        from .argfile import expand_args
+        try:
+            return list(expand_args(arg_list, prefix))
+        except (IOError, OSError) as e:
+            self.error(str(e))
+            return arg_list
+
+
+    def _fast_parse(self, arg_list, cmd, subparser):
+        """The namespace of arg_list built by the fast path, None when argparse has to parse it"""
+        from .fastpath import FastPathFallback
+        if hasattr(self, 'subparsers'):
+            if subparser is None:
+                return None
+            i = arg_list.index(cmd)
+            parts = [(self, arg_list[:i]), (subparser, arg_list[i + 1:])]
+        else:
+            parts = [(self, arg_list)]
+        ns = {}
+        try:
+            for parser, args in parts:
+                fast_parser = parser._get_fast_parser()
+                if not fast_parser:
+                    return None
+                ns.update(fast_parser.parse(args))
+        except FastPathFallback:
+            return None
+        return ns
+
+
+    def _get_fast_parser(self):
+        """The FastParser compiled from the actions, False when they are not supported"""
+        if self._fast_parser is None:
+            from .fastpath import FastParser
+            self._fast_parser = FastParser.compile(self, skip_subparsers=hasattr(self, 'subparsers')) or False
+        return self._fast_parser
+
+
+    def command_func(self, name=None):
+        """Returns the function called for the command name, or for the parser itself"""
+        if name is None:
+            return self._defaults['_cmd_func_']
+        return self._get_subparsers()[name]._defaults['_cmd_func_']
+
+
     def _get_subparsers(self):
         if hasattr(self, 'subparsers'):
             return self.subparsers._name_parser_map
@@ -653,46 +1813,41 @@ class ArgumentParser(argparse.ArgumentParser):
 
     def _match_cmd(self, abbrev, commands):
         """Extract the command name from an abbreviation or raise a NameError"""
-        if not self.CASE_SENSITIVE:
-            abbrev = abbrev.upper()
-            commands = [c.upper() for c in commands]
+        return self._command_index(commands).match(abbrev)
 
-        perfect_matches = [name for name in commands if name == abbrev]
-        if len(perfect_matches) == 1:
-            return perfect_matches[0]
-        matches = [name for name in commands if name.startswith(abbrev)]
-        n = len(matches)
-        if n == 1:
-            return matches[0]
-        elif n > 1:
-            raise NameError('Ambiguous command {0!r}: matching {1}'.format(abbrev, matches))
 
+    def _command_index(self, commands):
+        index = getattr(self, '_cmd_index', None)
+        if (index is None or index.commands is not commands or index.size != len(commands)
+                or index.case_sensitive != self.CASE_SENSITIVE):
+            index = self._cmd_index = CommandIndex(commands, self.CASE_SENSITIVE)
+        return index
 
+
+    @timed('extract')
     def _extract_cmd(self, arg_list, commands):
         """Extract the right sub-parser from the first recognized argument"""
+        i, cmd = self._find_cmd(arg_list, commands)
+        if cmd:
+            arg_list[i] = cmd
+        return cmd, arg_list
+
+
+    def _find_cmd(self, arg_list, commands):
+        """Returns the position and the name of the first recognized command, (None, None) without one"""
         opt_prefix = self.prefix_chars[0]
         for i, arg in enumerate(arg_list):
             if not arg.startswith(opt_prefix):
                 cmd = self._match_cmd(arg, commands)
                 if cmd:
-                    arg_list[i] = cmd
-                    return  cmd, arg_list
-        return None, arg_list
+                    return i, cmd
+        return None, None
 
 
     def _extract_kwargs(self, args):
-        """Returns two lists: regular args and name=value args"""
-        arg_list = []
+        """Returns the regular args and a dict of the name=value args"""
         if hasattr(self, 'callable_spec') and self.callable_spec.varkw:
-            kwargs = {}
-            for arg in args:
-                match = re.match(r'([a-zA-Z_]\w*)=', arg)
-                if match:
-                    name = match.group(1)
-                    kwargs[name] = arg[len(name)+1:]
-                else:
-                    arg_list.append(arg)
-            return arg_list, kwargs
+            return split_kwargs(args)
         return args, {}
 
 
@@ -710,16 +1865,36 @@ class ArgumentParser(argparse.ArgumentParser):
 
     #noinspection PyUnresolvedReferences
     def error(self, message):
-        if not self.ignore_errors:
-            super(ArgumentParser, self).error(message)
-        else:
+        if self.ignore_errors:
             self.ignored_errors.append(message)
+        elif self.raise_errors:
+            raise ParserError(message, self.format_usage())
+        else:
+            super(ArgumentParser, self).error(message)
+
+
+def terminal_width():
+    """The width argparse formats the help for"""
+    get_terminal_size = getattr(shutil, 'get_terminal_size', None)
+    if get_terminal_size is not None:
+        return get_terminal_size().columns
+    try:
+        return int(os.environ['COLUMNS']) # Python 2 argparse
+    except (KeyError, ValueError):
+        return 80
 
 
 def iterable(obj):
     """Any object with an __iter__ method which is not a string"""
     return hasattr(obj, '__iter__') and not isinstance(obj, basestring)
 
+def is_async_command(func):
+    """True if func, or the command it wraps, is a coroutine or async generator function"""
+    spec = getattr(func, 'callable_spec', None)
+    target = spec.obj if spec is not None else func
+    return (getattr(inspect, 'iscoroutinefunction', lambda f: False)(target) or
+            getattr(inspect, 'isasyncgenfunction', lambda f: False)(target))
+
 def name_from_python(name):
     if name is not None:
         if name.endswith('_') and keyword.iskeyword(name[:-1]):
@@ -733,14 +1908,33 @@ def name_to_python(name):
         return name.replace('-','_')
 
 
-def call(obj=None, arg_list=sys.argv[1:], greedy=False, only_known_args=False, **parser_params):
+def call(obj=None, arg_list=sys.argv[1:], greedy=False, only_known_args=False, use_cache=True, **parser_params):
     """
+    Parses arg_list with a parser built for obj and calls the selected command.
+    With use_cache the parser is taken from parser_cache, so repeated calls
+    against the same object do not rebuild it.
     """
     obj = obj or inspect.getmodule(inspect.currentframe().f_back)
-    ns, result = ArgumentParser.parser_from(obj, **parser_params).consume(arg_list, only_known_args)
+    if os.environ.get('PYCLAP_COMPLETE'): # asked by a shell completion script: never run a command
+        from .completion import complete_call, requested
+        if not requested(parser_params.get('prog') or getattr(obj, 'prog', None)):
+            sys.exit(0) # for another program
+        sys.exit(complete_call(obj, arg_list, **parser_params))
+    if use_cache:
+        parser = parser_cache.get(obj, **parser_params)
+    else:
+        parser = ArgumentParser.parser_from(obj, **parser_params)
+    ns, result = parser.consume(arg_list, only_known_args)
+
+    if is_async_command(ns.get('_cmd_func_')):
+        from .aio import run_result
+        with phase('results'):
+            return ns, run_result(result, greedy)
 
     if iterable(result) and not greedy:
-        return ns, list(result)
+        with phase('results'):
+            result = list(result)
+        count('result_items', len(result))
 
     return ns, result
 
@@ -0,0 +1,295 @@
+"""
+Daemon mode: a resident process keeps a command module imported and its
+parser built, and runs the command lines forwarded by clients.
+
+    python -m pyclap.daemon mytool            # serve mytool (Unix only)
+
+    # mytool's launcher script
+    import sys
+    from pyclap.daemon import forward
+    sys.exit(forward('mytool'))
+
+forward() sends argv, environment and working directory over a Unix
+socket, with its stdin, stdout and stderr file descriptors. The daemon
+forks a child per request which takes over these descriptors, runs the
+command and writes its result one item per line, then the daemon sends
+the exit code back. When no daemon answers, forward() starts one in the
+background and runs the command in-process.
+
+The socket lives in a directory of mode 0700 owned by the user, and both
+ends check the user of their peer where SO_PEERCRED is available, as
+the request carries the environment and the terminal of the client.
+
+The daemon reloads the module when its source changes, and exits after
+idle_timeout seconds without requests.
+"""
+
+__all__ = ['Daemon', 'forward', 'execute', 'socket_path']
+
+import io, os, sys, json, stat, time, array, errno, select, socket, struct, tempfile, importlib, traceback, subprocess
+
+from .core import ArgumentParser, annotations, call, is_async_command, Positional, Option
+from .output import LineSink, emit
+
+HEADER = struct.Struct('!I')
+PEERCRED = struct.Struct('3i') # pid, uid, gid
+STDIO = (0, 1, 2)
+reload_module = getattr(importlib, 'reload', None) or reload # Python 2
+
+
+def socket_path(module_name):
+    """Default socket of the daemon serving module_name, in a directory private to the user"""
+    directory = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+                             'pyclap-{0}'.format(os.getuid()))
+    try:
+        os.mkdir(directory, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    return os.path.join(directory, '{0}.sock'.format(module_name))
+
+
+def check_directory(path):
+    """Refuses a socket path whose directory other users could write to"""
+    directory = os.path.dirname(os.path.abspath(path))
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o700:
+        raise IOError('{0} must be a directory of the user with mode 0700'.format(directory))
+
+
+def check_peer(conn):
+    """Refuses a connection to or from another user, where SO_PEERCRED is available"""
+    option = getattr(socket, 'SO_PEERCRED', None)
+    if option is None:
+        return # the private directory alone protects the socket
+    pid, uid, gid = PEERCRED.unpack(conn.getsockopt(socket.SOL_SOCKET, option, PEERCRED.size))
+    if uid != os.getuid():
+        raise IOError('peer process {0} belongs to user {1}'.format(pid, uid))
+
+
+def execute(parser, argv):
+    """Runs argv like a script would, writes the result to stdout and returns the exit code"""
+    try:
+        ns, result = parser.consume(list(argv))
+        if is_async_command(ns.get('_cmd_func_')):
+            from .aio import run_result
+            result = run_result(result, greedy=True)
+        emit(result, LineSink(sys.stdout))
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        sys.stderr.write('{0}\n'.format(e.code))
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+
+class Daemon(object):
+    def __init__(self, module_name, path=None, idle_timeout=600, **parser_params):
+        self.module_name = module_name
+        self.path = path or socket_path(module_name)
+        self.idle_timeout = idle_timeout
+        parser_params.setdefault('prog', module_name.rpartition('.')[2])
+        self.parser_params = parser_params
+        self.module = importlib.import_module(module_name)
+        self.parser = ArgumentParser.parser_from(self.module, **parser_params)
+        self.stamp = self.source_stamp()
+        self.children = set()
+
+
+    def source_stamp(self):
+        from .spec_cache import source_file
+        try:
+            st = os.stat(source_file(self.module.__file__))
+        except (AttributeError, TypeError, OSError):
+            return None
+        return st.st_size, st.st_mtime
+
+
+    def reload(self):
+        """Reimports the module and rebuilds the parser if the source changed"""
+        stamp = self.source_stamp()
+        if stamp == self.stamp:
+            return
+        self.stamp = stamp
+        self.module = reload_module(self.module)
+        self.parser = ArgumentParser.parser_from(self.module, **self.parser_params)
+
+
+    def serve(self):
+        listener = self.listen()
+        try:
+            last = time.time()
+            while True:
+                self.reap()
+                timeout = self.idle_timeout - (time.time() - last) if self.idle_timeout else None
+                if timeout is not None and timeout <= 0:
+                    if not self.children:
+                        break
+                    timeout = 1
+                ready = select.select([listener], [], [], min(timeout, 1) if timeout else 1)[0]
+                if ready:
+                    conn = listener.accept()[0]
+                    try:
+                        check_peer(conn)
+                        self.handle(conn)
+                    except Exception:
+                        traceback.print_exc() # a broken request does not stop the daemon
+                    finally:
+                        conn.close()
+                    last = time.time()
+        finally:
+            listener.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+    def listen(self):
+        check_directory(self.path)
+        if os.path.exists(self.path):
+            os.remove(self.path) # stale: the socket of a live daemon answers before a new one is started
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077)
+        try:
+            listener.bind(self.path)
+        finally:
+            os.umask(umask)
+        listener.listen(16)
+        return listener
+
+
+    def reap(self):
+        for pid in list(self.children):
+            if os.waitpid(pid, os.WNOHANG)[0]:
+                self.children.discard(pid)
+
+
+    def handle(self, conn):
+        request, fds = receive(conn)
+        try:
+            try:
+                self.reload()
+            except Exception:
+                os.write(fds[2], traceback.format_exc().encode('utf-8', 'replace'))
+                conn.sendall(HEADER.pack(1))
+                return
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    code = self.run(conn, request, fds)
+                finally:
+                    try:
+                        conn.sendall(HEADER.pack(code & 0xff))
+                    finally:
+                        os._exit(0)
+            self.children.add(pid)
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+
+    def run(self, conn, request, fds):
+        """In the child: takes over the client's stdio and environment, then runs the command"""
+        for fd, target in zip(fds, STDIO):
+            os.dup2(fd, target)
+        sys.stdin, sys.stdout, sys.stderr = [io.open(fd, mode, closefd=False) for fd, mode in zip(STDIO, 'rww')]
+        os.environ.clear()
+        os.environ.update(request['env'])
+        os.chdir(request['cwd'])
+        sys.argv = [self.module_name] + request['argv']
+        return execute(self.parser, request['argv'])
+
+
+
+def send(conn, message, fds=()):
+    data = json.dumps(message).encode('utf-8')
+    data = HEADER.pack(len(data)) + data
+    if fds:
+        conn.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+    else:
+        conn.sendall(data)
+
+
+def receive(conn):
+    """Returns the message and the file descriptors sent by send()"""
+    fds = array.array('i')
+    data, ancdata, flags, address = conn.recvmsg(1 << 16, socket.CMSG_LEN(len(STDIO) * fds.itemsize))
+    for level, type, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and type == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg_data[:len(cmsg_data) - len(cmsg_data) % fds.itemsize])
+    if len(data) < HEADER.size:
+        raise IOError('truncated request')
+    size = HEADER.unpack(data[:HEADER.size])[0]
+    data = data[HEADER.size:]
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise IOError('truncated request')
+        data += chunk
+    return json.loads(data.decode('utf-8')), list(fds)
+
+
+def forward(module_name, argv=None, path=None, spawn=True, **parser_params):
+    """
+    Runs argv (sys.argv[1:] by default) through the daemon serving
+    module_name and returns the exit code. Without a daemon the command
+    runs in-process, after starting one in the background with spawn.
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if hasattr(socket, 'AF_UNIX') and hasattr(os, 'fork'):
+        path = path or socket_path(module_name)
+        check_directory(path) # the environment and the terminal are only handed to ourselves
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(path)
+        except (IOError, OSError) as e:
+            conn.close()
+            if e.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+                raise
+            if spawn:
+                start(module_name, path)
+        else:
+            try:
+                check_peer(conn)
+                send(conn, dict(argv=argv, env=dict(os.environ), cwd=os.getcwd()), STDIO)
+                reply = b''
+                while len(reply) < HEADER.size:
+                    chunk = conn.recv(HEADER.size - len(reply))
+                    if not chunk:
+                        raise IOError('the daemon closed the connection')
+                    reply += chunk
+                return HEADER.unpack(reply)[0]
+            finally:
+                conn.close()
+    parser_params.setdefault('prog', module_name.rpartition('.')[2])
+    return execute(ArgumentParser.parser_from(importlib.import_module(module_name), **parser_params), argv)
+
+
+def start(module_name, path):
+    """Starts a detached daemon for module_name"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p or os.curdir for p in sys.path)) # same imports
+    with open(os.devnull, 'r+b') as null:
+        subprocess.Popen([sys.executable, '-m', 'pyclap.daemon', module_name, '--socket', path],
+                         stdin=null, stdout=null, stderr=null, env=env, close_fds=True, preexec_fn=os.setsid)
+
+
+@annotations(module=Positional("Module with the commands to serve"),
+             socket=Option("Path of the Unix socket (default: private per user and module)", 's'),
+             idle_timeout=Option("Exit after this many seconds without request, 0 for never (default {default})",
+                                 't', type=float))
+def main(module, socket=None, idle_timeout=600):
+    """Serves the commands of module to pyclap.daemon.forward() clients"""
+    Daemon(module, socket, idle_timeout).serve()
+
+
+if __name__ == '__main__':
+    call(main, arg_list=sys.argv[1:], use_cache=False)
@@ -0,0 +1,223 @@
+"""
+Defaults of the arguments from a configuration file and the environment,
+layered over the signature defaults and under the command line:
+
+    class Tool(object):
+        commands = ['deploy']
+        config_defaults = ConfigDefaults('~/.tool.toml', env_prefix='TOOL')
+
+        def __init__(self, host='localhost'):    # [main] host=... or TOOL_HOST
+            ...
+        def deploy(self, target, retries=3):     # [deploy] retries=... or TOOL_DEPLOY_RETRIES
+            ...
+
+The file is INI, JSON or TOML, after its extension. Its top level holds
+the parameters of the target itself (the [main] or [DEFAULT] section of
+an INI file)
+and one section or table per command, nested groups being named
+group.command in INI files and nested tables elsewhere. Values read as
+strings are converted by the argument type like command line values.
+Files are read once per process, on the first lookup.
+
+LazyDefault(source) defers a default until the argument is left out:
+source() is called then, or with a string source the attribute of that
+name of the command's instance (for commands of classes and objects) is
+taken, and called if it is a method.
+"""
+
+__all__ = ['ConfigDefaults', 'LazyDefault']
+
+import os, json, threading
+from contextlib import contextmanager
+
+MISSING = object()
+TRUE = frozenset(['1', 'true', 'yes', 'on'])
+FALSE = frozenset(['', '0', 'false', 'no', 'off'])
+FORMATS = {'.ini': 'ini', '.cfg': 'ini', '.conf': 'ini', '.json': 'json', '.toml': 'toml'}
+
+_loaded = {} # (path, format) -> index, shared by the ConfigDefaults of the process
+_lock = threading.Lock()
+_calling = threading.local()
+
+
+class LazyDefault(object):
+    __slots__ = ('source', 'description')
+
+    def __init__(self, source, description=None):
+        self.source = source
+        self.description = description
+
+
+    def resolve(self, instance=None):
+        """The value, MISSING for an attribute default without instance"""
+        if callable(self.source):
+            return self.source()
+        if instance is None:
+            return MISSING
+        value = getattr(instance, self.source)
+        return value() if callable(value) else value
+
+
+    def __str__(self):
+        if self.description:
+            return self.description
+        return getattr(self.source, '__name__', None) or str(self.source)
+
+
+
+def resolve_lazy(args, kwargs, instance=None, ns=None):
+    """
+    args and kwargs with their LazyDefault values resolved (those which
+    can be), the resolved values being stored back into the namespace ns.
+    """
+    resolved = {}
+    if any(isinstance(value, LazyDefault) for value in args):
+        args = [resolve_value(value, instance, resolved) for value in args]
+    if any(isinstance(value, LazyDefault) for value in kwargs.values()):
+        kwargs = dict((key, resolve_value(value, instance, resolved)) for key, value in kwargs.items())
+    if resolved and ns is not None:
+        for key, value in list(ns.items()):
+            if isinstance(value, LazyDefault) and value in resolved:
+                ns[key] = resolved[value]
+    return args, kwargs
+
+
+def resolve_value(value, instance, resolved):
+    if isinstance(value, LazyDefault):
+        if value not in resolved:
+            result = value.resolve(instance)
+            if result is MISSING:
+                return value
+            resolved[value] = result
+        return resolved[value]
+    return value
+
+
+def current_namespace():
+    """The namespace of the command being called on this thread, for the wrappers resolving LazyDefault values"""
+    return getattr(_calling, 'ns', None)
+
+
+@contextmanager
+def calling(ns):
+    previous = current_namespace()
+    _calling.ns = ns
+    try:
+        yield
+    finally:
+        _calling.ns = previous
+
+
+def as_flag(value):
+    """The boolean of a configured flag value"""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE:
+        return True
+    if text in FALSE:
+        return False
+    raise ValueError('Not a boolean: {0!r}'.format(value))
+
+
+
+class ConfigDefaults(object):
+    """
+    Defaults read from the file path (missing files are ignored) and from
+    the environment variables named env_prefix + '_' + command path and
+    parameter, in upper case.
+    """
+    ROOT_SECTION = 'main'
+
+    def __init__(self, path=None, env_prefix=None, format=None):
+        self.path = path
+        self.env_prefix = env_prefix
+        self.format = format
+        self._index = None
+
+
+    def lookup(self, command_path, name):
+        """The value configured for the parameter name of the command at command_path, MISSING if none"""
+        if self.env_prefix:
+            key = '_'.join((self.env_prefix,) + tuple(command_path) + (name,)).upper().replace('-', '_')
+            value = os.environ.get(key)
+            if value is not None:
+                return value
+        if self._index is None:
+            self._index = self.load()
+        return self._index.get(tuple(command_path), {}).get(name, MISSING)
+
+
+    def default(self, command_path, name, default, kind):
+        """The default of an argument: the configured value if any, else default"""
+        value = self.lookup(command_path, name)
+        if value is MISSING:
+            return default
+        return as_flag(value) if kind == 'flag' else value
+
+
+    def load(self):
+        """The index {command path: {parameter: value}} of the file, read once per process"""
+        if not self.path:
+            return {}
+        path = os.path.abspath(os.path.expanduser(self.path))
+        format = self.format or FORMATS.get(os.path.splitext(path)[1].lower(), 'ini')
+        with _lock:
+            index = _loaded.get((path, format))
+            if index is None:
+                index = _loaded[path, format] = read_index(path, format) if os.path.exists(path) else {}
+        return index
+
+
+    def to_dict(self):
+        """The arguments of the constructor"""
+        return dict(path=self.path, env_prefix=self.env_prefix, format=self.format)
+
+
+
+def read_index(path, format):
+    if format == 'ini':
+        return ini_index(path)
+    if format == 'json':
+        with open(path) as f:
+            return tree_index(json.load(f))
+    if format == 'toml':
+        try:
+            import tomllib
+        except ImportError: # before Python 3.11
+            import tomli as tomllib
+        with open(path, 'rb') as f:
+            return tree_index(tomllib.load(f))
+    raise ValueError('Unknown configuration format {0!r}'.format(format))
+
+
+def ini_index(path):
+    try:
+        from configparser import RawConfigParser
+    except ImportError: # Python 2
+        from ConfigParser import RawConfigParser
+    parser = RawConfigParser()
+    parser.optionxform = str # keep the case of the parameter names
+    parser.read(path)
+    index = {(): dict((python_name(k), v) for k, v in parser.defaults().items())}
+    for section in parser.sections():
+        command_path = () if section == ConfigDefaults.ROOT_SECTION else tuple(section.split('.'))
+        options = parser._sections[section] # without the [DEFAULT] options, which are the root's only
+        index.setdefault(command_path, {}).update((python_name(k), v) for k, v in options.items() if k != '__name__')
+    return index
+
+
+def tree_index(tree, command_path=(), index=None):
+    """Indexes nested tables: the tables are commands, the other values parameters"""
+    index = {} if index is None else index
+    values = index.setdefault(command_path, {})
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            tree_index(value, command_path + (key,), index)
+        else:
+            values[python_name(key)] = value
+    return index
+
+
+def python_name(key):
+    return key.replace('-', '_')
@@ -0,0 +1,145 @@
+"""
+Runs one command over many argument lists on a thread or process pool.
+"""
+
+__all__ = ['fanout_call']
+
+import os, inspect, importlib
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from .core import ArgumentParser, CommandError, ParserError, parser_cache, iterable, basestring
+from .isolation import find_command, command_at
+
+
+def run_command(parser, func, args, kwargs):
+    """
+    Calls func through parser (memoization, lazy defaults) and consumes its
+    result in the worker, so the __enter__/__exit__ scope of the command
+    wrappers opens and closes there.
+    """
+    result = parser.call_command(func, args, kwargs)
+    return list(result) if iterable(result) else result
+
+
+def run_remote(target, parser_params, path, args, kwargs):
+    """run_command() for process pools: looks the command at path (names from the root) up in the worker's own parser"""
+    if isinstance(target, basestring):
+        target = importlib.import_module(target)
+    parser = parser_cache.get(target, **parser_params)
+    return run_command(parser, command_at(parser, path), args, kwargs)
+
+
+def fanout_call(obj, arg_lists, executor='thread', max_workers=None, ordered=True, max_pending=None,
+                only_known_args=False, **parser_params):
+    """
+    Parses every argument list of arg_lists with one parser for obj, then
+    runs the commands on executor: 'thread', 'process' or an Executor
+    (left running). At most max_pending commands (twice max_workers by
+    default) are submitted at a time; one of them is needed with an
+    Executor.
+
+    Yields (ns, result) in the order of arg_lists, or as the commands
+    complete when ordered is false. An argument list which fails to parse
+    or whose command raises yields (None, CommandError) instead.
+
+    Process pools need obj to be a module or picklable, and the command
+    results to be picklable.
+    """
+    parser = ArgumentParser.parser_from(obj, raise_errors=True, **parser_params)
+    tasks = [Task.parse(parser, arg_list, only_known_args) for arg_list in arg_lists]
+
+    if isinstance(executor, Executor):
+        if not (max_pending or max_workers):
+            raise ValueError('max_pending or max_workers is needed with an Executor')
+        pool = executor
+    elif executor == 'thread':
+        max_workers = max_workers or 4 * (os.cpu_count() or 1)
+        pool = ThreadPoolExecutor(max_workers)
+    elif executor == 'process':
+        max_workers = max_workers or os.cpu_count() or 1
+        pool = ProcessPoolExecutor(max_workers)
+    else:
+        raise ValueError('Unknown executor {0!r}'.format(executor))
+    target = obj.__name__ if inspect.ismodule(obj) else obj
+    remote = isinstance(pool, ProcessPoolExecutor)
+    max_pending = max_pending or 2 * max_workers
+
+    pending = [] # submission order
+    try:
+        for task in tasks:
+            if task.error is not None:
+                pass
+            elif remote:
+                task.submit(pool, run_remote, target, parser_params, find_command(parser, task.func))
+            else:
+                task.submit(pool, run_command, parser, task.func)
+            pending.append(task)
+            if len(pending) >= max_pending:
+                for result in drain(pending, ordered, len(pending) - max_pending + 1):
+                    yield result
+        for result in drain(pending, ordered, len(pending)):
+            yield result
+    finally:
+        for task in pending:
+            if task.future is not None:
+                task.future.cancel()
+        if pool is not executor:
+            pool.shutdown(wait=True)
+
+
+def drain(pending, ordered, count):
+    """Removes count finished tasks from pending and yields their outcome"""
+    while count > 0:
+        if ordered:
+            task = pending.pop(0)
+        else:
+            done = [i for i, task in enumerate(pending) if task.done()]
+            if not done:
+                wait([task.future for task in pending], return_when=FIRST_COMPLETED)
+                continue
+            task = pending.pop(done[0])
+        count -= 1
+        yield task.outcome()
+
+
+
+class Task(object):
+    """A parsed argument list and the future of its command"""
+
+    def __init__(self, arg_list, ns=None, func=None, args=(), kwargs=None, error=None):
+        self.arg_list = arg_list
+        self.ns = ns
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.error = error
+        self.future = None
+
+
+    @classmethod
+    def parse(cls, parser, arg_list, only_known_args=False):
+        arg_list = list(arg_list)
+        try:
+            args, varargs, kwargs, func, ns = parser.smart_parse_args(list(arg_list), only_known_args)
+        except ParserError as e:
+            return cls(arg_list, error=CommandError(arg_list, 2, e))
+        except SystemExit as e:
+            return cls(arg_list, error=CommandError(arg_list, e.code, e))
+        return cls(arg_list, ns, func, args + varargs, kwargs)
+
+
+    def submit(self, pool, fn, *fn_args):
+        self.future = pool.submit(fn, *(fn_args + (self.args, self.kwargs)))
+
+
+    def done(self):
+        return self.future is None or self.future.done()
+
+
+    def outcome(self):
+        if self.error is not None:
+            return None, self.error
+        try:
+            return self.ns, self.future.result()
+        except Exception as e:
+            return None, CommandError(self.arg_list, 1, e)
@@ -0,0 +1,148 @@
+"""
+Fast path for parsers made only of positionals, options and flags.
+
+FastParser is compiled from the actions of a populated ArgumentParser: it
+dispatches option strings through a dict, converts values with the action
+types and builds the namespace directly. Whatever it does not handle in
+the same way as argparse (help, errors, abbreviated or combined options,
+values starting with a prefix char, ...) raises FastPathFallback, and the
+caller parses the arguments with argparse instead.
+"""
+
+__all__ = ['FastParser', 'FastPathFallback']
+
+import argparse
+
+from .core import basestring
+
+
+class FastPathFallback(Exception):
+    """The arguments have to be parsed by argparse"""
+
+
+
+class FastParser(object):
+    STORE, FLAG = 0, 1
+
+    def __init__(self, prefix_chars, defaults, options, required, optional):
+        self.prefix_chars = prefix_chars
+        self.defaults = defaults # namespace before parsing
+        self.options = options # option string -> (kind, dest, type, choices)
+        self.required = required # [(dest, type, choices)] of the required positionals
+        self.optional = optional # same for the nargs='?' positionals
+
+
+    @classmethod
+    def compile(cls, parser, skip_subparsers=False):
+        """Returns the FastParser of parser, None if its actions are not supported"""
+        if parser.fromfile_prefix_chars or parser.argument_default is not None or \
+                parser._mutually_exclusive_groups:
+            return None
+        defaults, options, required, optional = {}, {}, [], []
+        for action in parser._actions:
+            kind = type(action)
+            if kind is argparse._HelpAction:
+                continue
+            elif kind is argparse._SubParsersAction and skip_subparsers:
+                continue
+            elif kind is argparse._StoreTrueAction:
+                entry = (cls.FLAG, action.dest, None, None)
+            elif kind is argparse._StoreAction and action.nargs in (None, '?'):
+                entry = (cls.STORE, action.dest, action.type, action.choices)
+            else:
+                return None
+            if action.type is not None and not callable(action.type):
+                return None # registered by name
+
+            default = action.default
+            if action.option_strings:
+                if action.required or entry[0] is cls.STORE and action.nargs is not None:
+                    return None
+                for option_string in action.option_strings:
+                    options[option_string] = entry
+                if kind is argparse._StoreAction and isinstance(default, basestring):
+                    try: # argparse converts string defaults of options left out
+                        default = cls.convert(entry, default)
+                    except FastPathFallback:
+                        return None
+            elif skip_subparsers:
+                return None # positionals before the command are matched together with it
+            elif action.nargs is None:
+                required.append(entry[1:])
+            else:
+                if isinstance(default, basestring):
+                    try: # converted and checked by argparse when no argument is given
+                        default = cls.check(entry, cls.convert(entry, default))
+                    except FastPathFallback:
+                        return None
+                optional.append(entry[1:])
+            if default is not argparse.SUPPRESS:
+                defaults[action.dest] = default
+        for dest, default in parser._defaults.items():
+            defaults.setdefault(dest, default)
+        return cls(parser.prefix_chars, defaults, options, required, optional)
+
+
+    @staticmethod
+    def convert(entry, value):
+        type = entry[2]
+        if type is None:
+            return value
+        try:
+            return type(value)
+        except (argparse.ArgumentTypeError, TypeError, ValueError):
+            raise FastPathFallback()
+
+
+    @staticmethod
+    def check(entry, value):
+        choices = entry[3]
+        if choices is not None and value not in choices:
+            raise FastPathFallback()
+        return value
+
+
+    def parse(self, arg_list):
+        """Returns the namespace of arg_list as a dict, or raises FastPathFallback"""
+        ns = dict(self.defaults)
+        options = self.options
+        prefix_chars = self.prefix_chars
+        positionals = []
+        chunks = 0
+        previous = None # kind of the previous argument
+        i, n = 0, len(arg_list)
+        while i < n:
+            arg = arg_list[i]
+            i += 1
+            if arg[:1] not in prefix_chars or arg in prefix_chars or not arg:
+                positionals.append(arg)
+                if previous is not self.STORE:
+                    chunks += 1
+                previous = self.STORE
+                continue
+            previous = None
+
+            entry = options.get(arg)
+            if entry is None:
+                name, eq, value = arg.partition('=')
+                entry = options.get(name) if arg[1:2] in prefix_chars else None
+                if entry is None or not eq or entry[0] is self.FLAG:
+                    raise FastPathFallback() # unknown, abbreviated, combined, help ...
+            elif entry[0] is self.FLAG:
+                ns[entry[1]] = True
+                continue
+            else:
+                if i == n or arg_list[i][:1] in prefix_chars and arg_list[i]:
+                    raise FastPathFallback()
+                value = arg_list[i]
+                i += 1
+            ns[entry[1]] = self.check(entry, self.convert(entry, value))
+
+        required, optional = self.required, self.optional
+        if len(positionals) < len(required) or len(positionals) > len(required) + len(optional):
+            raise FastPathFallback()
+        if optional and chunks > 1: # argparse gives up on '?' positionals after the first chunk
+            raise FastPathFallback()
+        for entry, value in zip(required + optional, positionals):
+            ns[entry[0]] = self.check((None,) + entry, self.convert((None,) + entry, value))
+        return ns
@@ -0,0 +1,385 @@
+"""
+Runs parsed commands in pooled worker processes, so that a runaway command
+can be stopped without taking its dispatcher down:
+
+    pool = IsolatedPool(workers=2, timeout=30, cpu_time=10, memory=512 << 20)
+    for ns, result in batch_call(mymodule, records, executor=pool):
+        ...
+    pool.close()
+
+Arguments are parsed in the parent: a parse error never costs a worker.
+Workers are forked from the parent once its parser is built and reused
+for the following commands; only the command path and the converted
+arguments are sent to them. LazyDefault values with a callable source
+are resolved in the parent, those of instance attributes by the worker,
+which sends them back for the namespace of the command. A command
+running longer than timeout seconds (wall clock) is killed with its
+worker. cpu_time (seconds) and memory (bytes the command may allocate
+beyond the size of the worker at fork) are enforced with RLIMIT_CPU and
+RLIMIT_AS, as Linux ignores RLIMIT_RSS. Iterable results are streamed
+back in pickled batches of batch_size items.
+
+Needs os.fork (Unix). Results and exceptions must be picklable.
+"""
+
+__all__ = ['IsolatedPool', 'CommandTimeout', 'WorkerDied']
+
+import os, sys, time, errno, pickle, select, signal, struct, threading, traceback, weakref
+
+from .core import LazyParserMap, iterable
+from .defaults import LazyDefault, resolve_lazy
+
+HEADER = struct.Struct('>I') # length of the pickled message which follows
+FLUSH_INTERVAL = 0.1 # seconds a partial batch of items may wait in the worker
+clock = getattr(time, 'monotonic', time.time) # Python 3.3+, unaffected by changes of the system time
+
+
+class CommandTimeout(Exception):
+    """The command ran longer than the timeout of its pool"""
+
+
+
+class WorkerDied(Exception):
+    """The worker running the command exited, killed by a resource limit or crashed"""
+
+
+
+class Channel(object):
+    """Length-prefixed pickles over a pair of pipe ends"""
+
+    def __init__(self, read_fd, write_fd):
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+        self.buffer = b''
+
+
+    def send(self, message):
+        data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+        data = HEADER.pack(len(data)) + data
+        while data:
+            data = data[os.write(self.write_fd, data):]
+
+
+    def receive(self, deadline=None):
+        """The next message; raises EOFError when the other end is closed, CommandTimeout after deadline"""
+        size = None
+        while True:
+            if size is None and len(self.buffer) >= HEADER.size:
+                size = HEADER.unpack(self.buffer[:HEADER.size])[0]
+            if size is not None and len(self.buffer) >= HEADER.size + size:
+                data = self.buffer[HEADER.size:HEADER.size + size]
+                self.buffer = self.buffer[HEADER.size + size:]
+                return pickle.loads(data)
+            if deadline is not None:
+                remaining = deadline - clock()
+                if remaining <= 0 or not select.select([self.read_fd], [], [], remaining)[0]:
+                    raise CommandTimeout()
+            try:
+                chunk = os.read(self.read_fd, 1 << 16)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            if not chunk:
+                raise EOFError()
+            self.buffer += chunk
+
+
+    def close(self):
+        for fd in (self.read_fd, self.write_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+
+class Worker(object):
+    """A forked process running the commands of parser"""
+
+    def __init__(self, pool, parser, inherited=()):
+        requests = os.pipe()
+        responses = os.pipe()
+        for stream in (sys.stdout, sys.stderr): # or buffered output is written twice
+            stream.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                os.close(requests[1])
+                os.close(responses[0])
+                for channel in inherited: # so that the other workers see their pipes closed
+                    channel.close()
+                serve(parser, Channel(requests[0], responses[1]), pool.cpu_time, pool.memory, pool.batch_size)
+                code = 0
+            finally:
+                os._exit(code)
+        os.close(requests[0])
+        os.close(responses[1])
+        self.pid = pid
+        self.parser = parser
+        self.channel = Channel(responses[0], requests[1])
+        self.tasks = 0
+
+
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        self.stop()
+
+
+    def stop(self):
+        """Closes the pipes and reaps the process, which exits once its requests pipe is closed"""
+        self.channel.close()
+        try:
+            return os.waitpid(self.pid, 0)[1]
+        except OSError:
+            return None
+
+
+
+class IsolatedPool(object):
+    """
+    At most workers worker processes, each running up to max_tasks commands
+    (no limit if None) before it is replaced.
+    """
+
+    def __init__(self, workers=1, timeout=None, cpu_time=None, memory=None, max_tasks=None, batch_size=64):
+        self.workers = workers
+        self.timeout = timeout
+        self.cpu_time = cpu_time
+        self.memory = memory
+        self.max_tasks = max_tasks
+        self.batch_size = batch_size
+        self.spawned = 0
+        self._idle = []
+        self._busy = set()
+        self._paths = weakref.WeakKeyDictionary() # parser -> {command function: names of the commands leading to it}
+        self._condition = threading.Condition()
+
+
+    def run(self, parser, func, args, kwargs, ns=None):
+        """
+        Returns func(*args, **kwargs) run in a worker, func being a command of
+        parser. An iterable result is returned as an iterator over the items
+        streamed by the worker, which stays busy until it is exhausted. The
+        LazyDefault values of the namespace ns are replaced by their values.
+        """
+        path = self.command_path(parser, func)
+        args, kwargs = resolve_lazy(args, kwargs, ns=ns) # the callable sources, which may not pickle
+        pending = dict((k, v) for k, v in (ns or {}).items() if isinstance(v, LazyDefault))
+        worker = self._acquire(parser)
+        deadline = clock() + self.timeout if self.timeout is not None else None
+        try:
+            worker.channel.send((path, args, kwargs, pending)) # one pickle: pending shares the LazyDefault of kwargs
+            kind, value = self._receive(worker, deadline, ns)
+        except BaseException:
+            self._discard(worker)
+            raise
+        if kind == 'items':
+            return self._stream(worker, value, deadline, ns)
+        self._release(worker, kind)
+        return outcome(kind, value)
+
+
+    def command_path(self, parser, func):
+        paths = self._paths.setdefault(parser, {})
+        path = paths.get(func)
+        if path is None:
+            path = find_command(parser, func)
+            if path is None:
+                raise TypeError('{0!r} is not a command of the parser'.format(func))
+            paths[func] = path
+        return path
+
+
+    def close(self):
+        """Stops the idle workers, and the busy ones when they are released"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self.workers = 0
+            self._condition.notify_all()
+        for worker in idle:
+            worker.stop()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, et, ex, tb):
+        self.close()
+
+
+    def _stream(self, worker, items, deadline, ns):
+        finished = False
+        try:
+            while True:
+                for item in items:
+                    yield item
+                kind, items = self._receive(worker, deadline, ns)
+                if kind != 'items':
+                    break
+            finished = True
+        finally:
+            if not finished: # abandoned or failed while streaming
+                self._discard(worker)
+        self._release(worker, kind)
+        if kind != 'end':
+            outcome(kind, items)
+
+
+    def _receive(self, worker, deadline, ns):
+        """The next message of the command but the resolved defaults, which are stored into ns"""
+        try:
+            while True:
+                kind, value = worker.channel.receive(deadline)
+                if kind != 'ns':
+                    return kind, value
+                if ns is not None:
+                    ns.update(value)
+        except CommandTimeout:
+            raise CommandTimeout('Killed after {0} seconds'.format(self.timeout))
+        except EOFError:
+            status = worker.stop()
+            if status is not None and os.WIFSIGNALED(status):
+                raise WorkerDied('Worker killed by signal {0}'.format(os.WTERMSIG(status)))
+            raise WorkerDied('Worker exited with status {0}'.format(status and os.WEXITSTATUS(status)))
+
+
+    def _acquire(self, parser):
+        with self._condition:
+            while True:
+                for worker in list(self._idle):
+                    if worker.parser is not parser: # forked for another parser
+                        self._idle.remove(worker)
+                        worker.stop()
+                if self._idle:
+                    worker = self._idle.pop()
+                    break
+                if len(self._busy) < max(self.workers, 1):
+                    worker = Worker(self, parser, [w.channel for w in self._busy])
+                    self.spawned += 1
+                    break
+                self._condition.wait()
+            self._busy.add(worker)
+            return worker
+
+
+    def _release(self, worker, kind):
+        worker.tasks += 1
+        retire = (self.max_tasks is not None and worker.tasks >= self.max_tasks) or kind == 'memory'
+        with self._condition:
+            self._busy.discard(worker)
+            if not retire and len(self._idle) + len(self._busy) < self.workers:
+                self._idle.append(worker)
+                worker = None
+            self._condition.notify()
+        if worker is not None:
+            worker.stop()
+
+
+    def _discard(self, worker):
+        worker.kill()
+        with self._condition:
+            self._busy.discard(worker)
+            self._condition.notify()
+
+
+
+def outcome(kind, value):
+    """The result of a command from the final message of its worker"""
+    if kind == 'value':
+        return value
+    if kind == 'exit':
+        raise SystemExit(value)
+    raise value # 'error', 'memory'
+
+
+def find_command(parser, func):
+    """The names of the commands from parser to the sub-parser of func, None if it is not built"""
+    if parser._defaults.get('_cmd_func_') is func:
+        return ()
+    subparsers = parser._get_subparsers()
+    for name, subparser in (dict.items(subparsers) if subparsers is not None else ()):
+        if subparser is not None: # not built yet
+            path = find_command(subparser, func)
+            if path is not None:
+                return (name,) + path
+    return None
+
+
+def command_at(parser, path):
+    for name in path:
+        parser = parser._get_subparsers()[name] # built in the worker if it was not at fork
+    return parser._defaults['_cmd_func_']
+
+
+def limit(cpu_time, memory):
+    """Applies the memory limit of the worker, returns the soft CPU limit of its next command"""
+    import resource
+    if memory is not None:
+        size = 0
+        try:
+            with open('/proc/self/statm') as f:
+                size = int(f.read().split()[0]) * resource.getpagesize()
+        except (IOError, OSError, ValueError):
+            pass
+        resource.setrlimit(resource.RLIMIT_AS, (size + memory, resource.getrlimit(resource.RLIMIT_AS)[1]))
+    if cpu_time is None:
+        return None
+    def next_limit():
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime + cpu_time) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, resource.getrlimit(resource.RLIMIT_CPU)[1]))
+    return next_limit
+
+
+def serve(parser, channel, cpu_time, memory, batch_size):
+    """The loop of a worker: runs the requested commands until its requests pipe is closed"""
+    next_limit = limit(cpu_time, memory)
+    while True:
+        try:
+            path, args, kwargs, ns = channel.receive()
+        except EOFError:
+            return
+        if next_limit is not None:
+            next_limit()
+        try:
+            result = parser.call_command(command_at(parser, path), args, kwargs, ns)
+            if iterable(result):
+                items, flushed = [], clock()
+                for item in result:
+                    items.append(item)
+                    if len(items) >= batch_size or clock() - flushed > FLUSH_INTERVAL:
+                        channel.send(('items', items))
+                        items, flushed = [], clock()
+                channel.send(('items', items))
+                send_resolved(channel, ns)
+                channel.send(('end', None))
+            else:
+                send_resolved(channel, ns)
+                channel.send(('value', result))
+        except SystemExit as e:
+            channel.send(('exit', e.code))
+        except MemoryError as e: # the worker is replaced
+            channel.send(('memory', e))
+        except Exception as e:
+            channel.send(('error', picklable(e)))
+
+
+def send_resolved(channel, ns):
+    """Sends the LazyDefault values of ns resolved by the command (those of instance attributes)"""
+    resolved = dict((k, v) for k, v in ns.items() if not isinstance(v, LazyDefault))
+    if resolved:
+        channel.send(('ns', resolved))
+
+
+def picklable(error):
+    try:
+        pickle.loads(pickle.dumps(error, pickle.HIGHEST_PROTOCOL))
+        return error
+    except Exception:
+        return RuntimeError('{0}\n{1}'.format(repr(error), traceback.format_exc()))
@@ -0,0 +1,255 @@
+"""
+Memoization of the results of commands which are pure functions of their
+arguments.
+
+    @memoize(ttl=3600, directory='~/.cache/mytool')
+    def report(source, month):
+        ...
+
+The dispatcher looks the result up with the parsed and converted
+arguments, and the object of a method, as key: in memory (LRU bounded by
+maxsize entries and max_bytes bytes), then in directory if given, one
+pickle file per result. Entries older than ttl seconds are dropped. A generator result is passed through
+as it is consumed and cached as the list of its items once exhausted; a
+hit then returns an iterator over them. Exceptions are not cached.
+
+ArgumentParser.memo_stats() reports the hits and misses of its commands.
+"""
+
+__all__ = ['MemoCache', 'memoize']
+
+import os, time, pickle, hashlib, inspect, tempfile, threading
+from collections import OrderedDict
+
+from .profiling import count
+
+MISSING = object()
+
+
+class Stream(tuple):
+    """The items of a generator result"""
+
+
+
+class MemoCache(object):
+    """
+    Thread-safe LRU of command results. Sizes are the length of the
+    pickled results, only computed with max_bytes or directory.
+    """
+
+    def __init__(self, maxsize=128, ttl=None, max_bytes=None, directory=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.directory = os.path.expanduser(directory) if directory else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0 # bytes
+        self._entries = OrderedDict() # key -> (value, creation time, bytes)
+        self._lock = threading.Lock()
+
+
+    def call(self, func, args, kwargs, name=None):
+        """Returns func(*args, **kwargs), from the cache when it holds the result"""
+        key = make_key(name or qualified_name(func), args, kwargs, bound_instance(func))
+        if key is None: # unhashable arguments
+            return func(*args, **kwargs)
+        value = self.get(key)
+        if value is not MISSING:
+            return iter(value) if isinstance(value, Stream) else value
+        result = func(*args, **kwargs)
+        if inspect.isgenerator(result):
+            return self._record(key, result)
+        self.put(key, result)
+        return result
+
+
+    def get(self, key):
+        """The cached value of key, MISSING when there is none"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and self._expired(entry[1]):
+                self._drop(entry)
+                entry = None
+            if entry is not None:
+                self._entries[key] = entry # mark as recently used
+                self.hits += 1
+        if entry is None and self.directory:
+            entry = self._load(key)
+            if entry is not None:
+                with self._lock:
+                    self.hits += 1
+                self._store(key, entry)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            count('memo.misses')
+            return MISSING
+        count('memo.hits')
+        return entry[0]
+
+
+    def put(self, key, value):
+        data = None
+        if self.max_bytes is not None or self.directory:
+            try:
+                data = pickle.dumps((key, time.time(), value), pickle.HIGHEST_PROTOCOL)
+            except Exception: # not picklable: kept in memory only
+                data = None
+            if data is None and self.max_bytes is not None:
+                return
+        entry = (value, time.time(), len(data) if data is not None else 0)
+        if self.max_bytes is not None and entry[2] > self.max_bytes:
+            return
+        self._store(key, entry)
+        if self.directory and data is not None:
+            self._save(key, data)
+
+
+    def clear(self):
+        """Drops every result, from memory and from the directory"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.pickle'):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+
+
+    def stats(self):
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                        size=len(self._entries), bytes=self.size)
+
+
+    def _record(self, key, iterator):
+        items = []
+        for item in iterator:
+            items.append(item)
+            yield item
+        self.put(key, Stream(items))
+
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+
+    def _store(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            self._entries[key] = entry
+            self.size += entry[2]
+            while self._entries and ((self.maxsize is not None and len(self._entries) > self.maxsize) or
+                                     (self.max_bytes is not None and self.size > self.max_bytes)):
+                self._drop(self._entries.popitem(last=False)[1])
+
+
+    def _drop(self, entry):
+        """Called with the lock held, for an entry removed from _entries"""
+        self.size -= entry[2]
+        self.evictions += 1
+
+
+    def _path(self, key):
+        try:
+            digest = hashlib.sha1(pickle.dumps(key, 2)).hexdigest()
+        except Exception:
+            return None
+        return os.path.join(self.directory, digest + '.pickle')
+
+
+    def _load(self, key):
+        path = self._path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            stored_key, created, value = pickle.loads(data)
+        except Exception: # missing, truncated or written by an incompatible version
+            return None
+        if stored_key != key:
+            return None
+        if self._expired(created):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return value, created, len(data)
+
+
+    def _save(self, key, data):
+        path = self._path(key)
+        if path is None:
+            return
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(temp, path) # atomic: readers never see a partial file
+        except (IOError, OSError):
+            pass # the disk store is best effort
+
+
+
+def freeze(value):
+    """A hashable equivalent of a parsed argument value"""
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(v) for v in value)
+    tobytes = getattr(value, 'tobytes', None) # array.array, numpy.ndarray
+    if tobytes is not None and hasattr(value, 'typecode'):
+        return 'array', value.typecode, tobytes()
+    if tobytes is not None and hasattr(value, 'dtype'):
+        return 'ndarray', str(value.dtype), value.shape, tobytes()
+    hash(value)
+    return value
+
+
+def make_key(name, args, kwargs, instance=None):
+    """The cache key of a call, None when an argument can not be hashed"""
+    try:
+        if instance is not None: # the commands of different objects share the cache of their method
+            hash(instance) # objects defining __eq__ without __hash__ are not
+            return name, instance, freeze(args), freeze(kwargs)
+        return name, freeze(args), freeze(kwargs)
+    except TypeError:
+        return None
+
+
+def bound_instance(func):
+    """The object func, or the method of the command func, is bound to"""
+    spec = getattr(func, 'callable_spec', None)
+    instance = getattr(getattr(spec, 'obj', func), '__self__', None)
+    return None if inspect.ismodule(instance) else instance # builtin functions are bound to their module
+
+
+def qualified_name(func):
+    spec = getattr(func, 'callable_spec', None)
+    target = getattr(spec, 'obj', func)
+    return '{0}:{1}'.format(getattr(target, '__module__', None),
+                            getattr(target, '__qualname__', getattr(target, '__name__', repr(target))))
+
+
+def memoize(func=None, maxsize=128, ttl=None, max_bytes=None, directory=None, cache=None):
+    """
+    Marks a command as memoized, with cache or a new MemoCache built from
+    the other arguments. Usable as @memoize or @memoize(...).
+    """
+    def mark(f):
+        f.memo_cache = cache if cache is not None else MemoCache(maxsize, ttl, max_bytes, directory)
+        return f
+    return mark(func) if func is not None else mark
@@ -0,0 +1,152 @@
+"""
+Output sinks writing command results as they are produced, instead of
+collecting them with list() first.
+"""
+
+__all__ = ['Sink', 'LineSink', 'JsonLinesSink', 'CsvSink', 'SINKS', 'emit', 'stream_call']
+
+import sys, csv, json, inspect
+
+from .core import call, iterable
+
+
+class Sink(object):
+    """
+    Formats items and writes them to stream in chunks of about buffer_size
+    characters. rows and bytes count what has been emitted so far.
+    """
+
+    def __init__(self, stream=None, buffer_size=1 << 16):
+        self.stream = stream or sys.stdout
+        self.encoding = getattr(self.stream, 'encoding', None) or 'utf-8'
+        self.buffer_size = buffer_size
+        self.rows = 0
+        self.bytes = 0
+        self._buffer = []
+        self._buffered = 0
+
+
+    def format(self, item):
+        raise NotImplementedError()
+
+
+    def write(self, item):
+        text = self.format(item)
+        self._buffer.append(text)
+        self._buffered += len(text)
+        self.rows += 1
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+
+    def flush(self):
+        if self._buffer:
+            chunk = ''.join(self._buffer)
+            del self._buffer[:]
+            self._buffered = 0
+            self.stream.write(chunk)
+            self.bytes += len(chunk.encode(self.encoding, 'replace'))
+        if hasattr(self.stream, 'flush'):
+            self.stream.flush()
+
+
+    def close(self):
+        self.flush()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+
+class LineSink(Sink):
+    """One str(item) per line"""
+
+    def format(self, item):
+        return '{0}\n'.format(item)
+
+
+
+class JsonLinesSink(Sink):
+    """One JSON document per line, values JSON does not know are written with str()"""
+
+    def format(self, item):
+        return json.dumps(item, default=str) + '\n'
+
+
+
+class CsvSink(Sink):
+    """
+    One CSV row per item: sequences are written as rows, dicts by
+    fieldnames (taken from the first dict when not given) and anything
+    else as a single column. The fieldnames are written as a header row
+    before the first row.
+    """
+
+    def __init__(self, stream=None, buffer_size=1 << 16, fieldnames=None, **fmtparams):
+        super(CsvSink, self).__init__(stream, buffer_size)
+        self.fieldnames = fieldnames
+        self._header = True # still to write
+        self._row = Collector()
+        self._writer = csv.writer(self._row, **fmtparams)
+
+
+    def format(self, item):
+        if isinstance(item, dict):
+            if self.fieldnames is None:
+                self.fieldnames = list(item)
+            item = [item.get(name, '') for name in self.fieldnames]
+        elif not iterable(item):
+            item = [item]
+        if self._header and self.fieldnames is not None:
+            self._header = False
+            self._writer.writerow(self.fieldnames)
+        self._writer.writerow(item)
+        return self._row.pop()
+
+
+
+class Collector(object):
+    """File-like object keeping what is written until pop()"""
+
+    def __init__(self):
+        self.parts = []
+
+
+    def write(self, text):
+        self.parts.append(text)
+
+
+    def pop(self):
+        text = ''.join(self.parts)
+        del self.parts[:]
+        return text
+
+
+
+SINKS = {'lines': LineSink, 'jsonl': JsonLinesSink, 'csv': CsvSink}
+
+
+def emit(result, sink):
+    """Writes result item by item to sink, returns sink"""
+    if iterable(result):
+        for item in result:
+            sink.write(item)
+    elif result is not None:
+        sink.write(result)
+    sink.flush()
+    return sink
+
+
+def stream_call(obj=None, sink=None, arg_list=sys.argv[1:], only_known_args=False, **parser_params):
+    """
+    Like call(), but writes the result to sink (a LineSink on stdout by
+    default) while the command produces it. Returns (ns, sink).
+    """
+    obj = obj or inspect.getmodule(inspect.currentframe().f_back)
+    ns, result = call(obj, arg_list, greedy=True, only_known_args=only_known_args, **parser_params)
+    return ns, emit(result, sink or LineSink())
@@ -0,0 +1,182 @@
+"""
+Timing of the phases of a command line dispatch.
+
+The phases are spec (CallableCommandSpec introspection), build (parser
+construction), subcommands, populate, parse (smart_parse_args), extract
+(command extraction), consume, command (the command call) and results
+(materialization of the result in call()). They nest: each time includes
+the phases run inside it.
+
+    with Profiler() as profiler:
+        call(obj, arg_list)
+    sys.stderr.write(profiler.summary())
+
+add_hook(callback) has callback(phase, wall, cpu) called after every
+phase. With the PYCLAP_PROFILE environment variable set, a summary of the
+whole process is written to stderr at exit. When nothing listens, a phase
+costs a global lookup.
+"""
+
+__all__ = ['Profiler', 'add_hook', 'remove_hook', 'phase', 'timed', 'count']
+
+import os, sys, time, atexit, threading
+from collections import OrderedDict
+from functools import wraps
+
+wall_time = getattr(time, 'perf_counter', time.time)
+cpu_time = getattr(time, 'thread_time', None) or getattr(time, 'process_time', None) or time.clock
+
+_listeners = () # replaced, never mutated: read without locking
+
+
+class Profiler(object):
+    """Calls, wall and CPU seconds per phase, and counters"""
+
+    def __init__(self):
+        self.phases = OrderedDict() # name -> [calls, wall, cpu]
+        self.counters = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def add(self, name, wall, cpu):
+        with self._lock:
+            stats = self.phases.get(name)
+            if stats is None:
+                stats = self.phases[name] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += wall
+            stats[2] += cpu
+
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def reset(self):
+        with self._lock:
+            self.phases.clear()
+            self.counters.clear()
+
+
+    def summary(self):
+        lines = ['{0:12} {1:>8} {2:>12} {3:>12}'.format('phase', 'calls', 'wall ms', 'cpu ms')]
+        for name, (calls, wall, cpu) in self.phases.items():
+            lines.append('{0:12} {1:8d} {2:12.3f} {3:12.3f}'.format(name, calls, wall * 1e3, cpu * 1e3))
+        for name, value in self.counters.items():
+            lines.append('{0:30} {1:12d}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+
+
+    def __enter__(self):
+        listen(self)
+        return self
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        unlisten(self)
+
+
+
+class Hook(object):
+    """Listener forwarding phases to a callback"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+
+    def add(self, name, wall, cpu):
+        self.callback(name, wall, cpu)
+
+
+    def count(self, name, n=1):
+        pass
+
+
+
+_lock = threading.Lock()
+
+def listen(listener):
+    global _listeners
+    with _lock:
+        _listeners = _listeners + (listener,)
+
+
+def unlisten(listener):
+    global _listeners
+    with _lock:
+        _listeners = tuple(l for l in _listeners if l is not listener)
+
+
+def add_hook(callback):
+    """callback(phase, wall, cpu) will be called after every phase"""
+    listen(Hook(callback))
+
+
+def remove_hook(callback):
+    for listener in _listeners:
+        if isinstance(listener, Hook) and listener.callback is callback:
+            unlisten(listener)
+
+
+
+class Timer(object):
+    __slots__ = ('name', 'wall', 'cpu')
+
+    def __init__(self, name):
+        self.name = name
+
+
+    def __enter__(self):
+        self.wall = wall_time()
+        self.cpu = cpu_time()
+        return self
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        wall = wall_time() - self.wall
+        cpu = cpu_time() - self.cpu
+        for listener in _listeners:
+            listener.add(self.name, wall, cpu)
+
+
+
+class NullTimer(object):
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def phase(name):
+    """Context manager timing the phase name"""
+    return Timer(name) if _listeners else NULL_TIMER
+
+
+def timed(name):
+    """Decorator timing the calls of a function as the phase name"""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _listeners:
+                return func(*args, **kwargs)
+            with Timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1):
+    for listener in _listeners:
+        listener.count(name, n)
+
+
+if os.environ.get('PYCLAP_PROFILE', '0') not in ('', '0'):
+    profiler = Profiler()
+    listen(profiler)
+    atexit.register(lambda: sys.stderr.write(profiler.summary()))
@@ -0,0 +1,316 @@
+"""
+On-disk cache of the command specs of modules.
+
+The names, kinds, defaults, help and choices of the commands of a module
+are saved as JSON next to the size and mtime of its source. While the
+source is unchanged, parsers are built from the cache and the module is
+only imported to run a command.
+"""
+
+__all__ = ['SpecCache', 'CachedModule', 'NotCacheable', 'extract_specs', 'cached_call']
+
+import os, sys, json, argparse, hashlib, tempfile, importlib
+
+from .core import (ArgumentParser, Annotation, CallableCommandSpec, ModuleCommandsSpec, BaseParserBuilder,
+                   CommandGroup, as_group, basestring, call, indexed_choices, __version__)
+from .defaults import ConfigDefaults
+
+FORMAT = 6
+_targets = {} # path of the cache entry -> CachedModule
+BUILTIN_TYPES = dict((t.__name__, t) for t in (int, float, complex, str, bool))
+
+
+class NotCacheable(Exception):
+    """The specs of the object can not be saved as JSON"""
+
+
+
+def extract_specs(obj):
+    """Returns the JSON-compatible description of the commands of obj, a module"""
+    conf = ArgumentParser.get_conf(obj)
+    if conf.pop('formatter_class') is not argparse.RawDescriptionHelpFormatter:
+        raise NotCacheable('formatter_class')
+    spec = ModuleCommandsSpec(obj, obj.commands)
+    return dict(conf=json_value(conf),
+                case_sensitive=json_value(getattr(obj, 'case_sensitive', True)),
+                lazy_subcommands=json_value(getattr(obj, 'lazy_subcommands', False)),
+                fast_parse=json_value(getattr(obj, 'fast_parse', False)),
+                argfile_prefix=json_value(getattr(obj, 'argfile_prefix', None)),
+                config_defaults=extract_config(getattr(obj, 'config_defaults', None)),
+                commands=[extract_command(spec, entry) for entry in obj.commands])
+
+
+def extract_config(config):
+    if config is None:
+        return None
+    if type(config) is not ConfigDefaults:
+        raise NotCacheable(repr(config))
+    return json_value(config.to_dict())
+
+
+def extract_command(spec, entry):
+    group = as_group(entry)
+    if group is None:
+        return dict(name=entry, spec=extract_spec(getattr(spec, entry).callable_spec))
+    if not isinstance(group.target, basestring):
+        raise NotCacheable(repr(group))
+    return dict(name=group.name, group=group.target, help=json_value(group.help))
+
+
+def extract_spec(callable_spec):
+    def annotation(name):
+        a = callable_spec.annotations[name]
+        return dict(name=name, kind=a.kind, abbrev=a.abbrev, help=json_value(a.help), type=type_name(a.type),
+                    choices=json_value(list(indexed_choices(a.choices))) if a.choices is not None else None,
+                    metavar=json_value(a.metavar), container=json_value(getattr(a, 'container', None)))
+
+    arguments = []
+    for name, default in zip(callable_spec.vars, callable_spec.defaults):
+        argument = annotation(name)
+        if default is not callable_spec.NONE:
+            argument['default'] = json_value(default)
+        arguments.append(argument)
+    return dict(vars=arguments,
+                varargs=annotation(callable_spec.varargs) if callable_spec.varargs else None,
+                varkw=annotation(callable_spec.varkw) if callable_spec.varkw else None)
+
+
+def json_value(value):
+    """Returns value if JSON gives it back unchanged"""
+    try:
+        same = json.loads(json.dumps(value)) == value
+    except (TypeError, ValueError):
+        same = False
+    if not same:
+        raise NotCacheable(repr(value))
+    return value
+
+
+def type_name(type):
+    if type is None:
+        return None
+    if BUILTIN_TYPES.get(type.__name__) is type:
+        return type.__name__
+    name = getattr(type, '__qualname__', type.__name__)
+    module = getattr(type, '__module__', None)
+    if not module or '<' in name:
+        raise NotCacheable(repr(type))
+    return '{0}:{1}'.format(module, name)
+
+
+
+class LazyType(object):
+    """Type converter imported on first use"""
+
+    def __init__(self, path):
+        self.path = path
+        self.__name__ = path.rpartition(':')[2].rpartition('.')[2] # used by argparse messages
+        self._type = None
+
+
+    def __call__(self, value):
+        if self._type is None:
+            module_name, _, name = self.path.partition(':')
+            obj = importlib.import_module(module_name)
+            for part in name.split('.'):
+                obj = getattr(obj, part)
+            self._type = obj
+        return self._type(value)
+
+
+
+class CachedCommandSpec(object):
+    """Stand-in for the CallableCommandSpec of a command, built from its cached description"""
+    NONE = CallableCommandSpec.NONE
+
+    def __init__(self, module, name, spec):
+        self.module = module
+        self.name = name
+        self.vars = [a['name'] for a in spec['vars']]
+        self.defaults = tuple(a.get('default', self.NONE) for a in spec['vars'])
+        self.varargs = spec['varargs'] and spec['varargs']['name']
+        self.varkw = spec['varkw'] and spec['varkw']['name']
+        self.annotations = dict((a['name'], self.annotation(a))
+                                for a in spec['vars'] + [spec['varargs'], spec['varkw']] if a)
+
+
+    @staticmethod
+    def annotation(a):
+        type = a['type'] and (BUILTIN_TYPES.get(a['type']) or LazyType(a['type']))
+        choices = tuple(a['choices']) if a['choices'] is not None else None
+        return Annotation(a['help'], a['kind'], a['abbrev'], type, choices, a['metavar'], container=a['container'])
+
+
+    @property
+    def obj(self):
+        return getattr(self.module.module(), self.name)
+
+
+    @property
+    def memo(self):
+        return getattr(self.obj, 'memo_cache', None)
+
+
+
+class CachedModule(object):
+    """
+    Stand-in for a module, exposing its cached commands and parser
+    configuration. The module is imported by module() when a command runs.
+    """
+
+    def __init__(self, name, specs):
+        self.name = name
+        self.specs = specs
+        self.commands = [CommandGroup(command['name'], command['group'], command['help']) if 'group' in command
+                         else command['name'] for command in specs['commands']]
+        self.case_sensitive = specs['case_sensitive']
+        self.lazy_subcommands = specs['lazy_subcommands']
+        self.fast_parse = specs['fast_parse']
+        self.argfile_prefix = specs['argfile_prefix']
+        self.config_defaults = ConfigDefaults(**specs['config_defaults']) if specs['config_defaults'] else None
+        self.__doc__ = specs['conf'].get('description')
+        for key, value in specs['conf'].items():
+            if key != 'description':
+                setattr(self, key, value)
+        self._module = None
+
+
+    def module(self):
+        if self._module is None:
+            self._module = importlib.import_module(self.name)
+        return self._module
+
+
+
+class CachedCommandsSpec(object):
+
+    def __init__(self, cached_module):
+        self.cached_module = cached_module
+        self.command_specs = dict((command['name'], CachedCommandSpec(cached_module, command['name'], command['spec']))
+                                  for command in cached_module.specs['commands'] if 'group' not in command)
+        self._commands_spec = None
+
+
+    def __getattr__(self, item):
+        if item not in self.command_specs:
+            raise AttributeError(item)
+
+        def wrapper(*args, **kwargs):
+            if self._commands_spec is None:
+                self._commands_spec = ModuleCommandsSpec(self.cached_module.module(), self.cached_module.commands)
+            return getattr(self._commands_spec, item)(*args, **kwargs)
+
+        wrapper.callable_spec = self.command_specs[item]
+        return wrapper
+
+
+
+class CachedModuleParserBuilder(BaseParserBuilder):
+    def can_build(self, obj):
+        return isinstance(obj, CachedModule)
+
+
+    def populate(self, parser, obj):
+        parser.populate_subcommands(obj.commands, CachedCommandsSpec(obj))
+        parser.set_defaults(_cmd_func_=None)
+
+
+
+class SpecCache(object):
+    """
+    Directory of cached specs, one JSON file per module. An entry is valid
+    while the size and mtime of the module source are unchanged, and with
+    verify='hash' while its SHA-1 is unchanged.
+    """
+
+    def __init__(self, directory=None, verify='mtime'):
+        self.directory = directory or os.environ.get('PYCLAP_SPEC_CACHE') or \
+                         os.path.join(os.path.expanduser('~'), '.cache', 'pyclap')
+        self.verify = verify
+
+
+    def path(self, module_name):
+        return os.path.join(self.directory, module_name + '.json')
+
+
+    def load(self, module_name):
+        """Returns the cached specs of the module, None if missing or stale"""
+        try:
+            with open(self.path(module_name)) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        source = find_source(module_name)
+        if entry.get('key') != [FORMAT, __version__] or source is None or entry.get('source') != self.stamp(source):
+            return None
+        return entry['specs']
+
+
+    def store(self, module):
+        """Saves the specs of the (imported) module, may raise NotCacheable"""
+        source = getattr(module, '__file__', None)
+        if source is None:
+            raise NotCacheable(module.__name__)
+        entry = dict(key=[FORMAT, __version__], source=self.stamp(source_file(source)),
+                     specs=extract_specs(module))
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        getattr(os, 'replace', os.rename)(tmp, self.path(module.__name__))
+
+
+    def stamp(self, source):
+        st = os.stat(source)
+        stamp = [os.path.abspath(source), st.st_size, st.st_mtime]
+        if self.verify == 'hash':
+            with open(source, 'rb') as f:
+                stamp.append(hashlib.sha1(f.read()).hexdigest())
+        return stamp
+
+
+    def target(self, module_name):
+        """
+        A CachedModule when the cache is fresh, else the imported module
+        (cached for next time). The CachedModule is kept while its specs are
+        unchanged, so that parser_cache finds its parser again.
+        """
+        specs = self.load(module_name)
+        if specs is not None:
+            key = self.path(module_name)
+            target = _targets.get(key)
+            if target is None or target.specs != specs:
+                target = _targets[key] = CachedModule(module_name, specs)
+            return target
+        module = importlib.import_module(module_name)
+        try:
+            self.store(module)
+        except (NotCacheable, IOError, OSError):
+            pass
+        return module
+
+
+
+def source_file(path):
+    """The .py file of a module file path (which may be a .pyc)"""
+    if path.endswith(('.pyc', '.pyo')) and os.path.exists(path[:-1]):
+        return path[:-1]
+    return path
+
+
+def find_source(module_name):
+    """Path of the source of the module, without importing it (parent packages are imported)"""
+    try:
+        from importlib.util import find_spec
+        spec = find_spec(module_name)
+    except (ImportError, ValueError, AttributeError):
+        return None
+    if spec is None or not spec.has_location or not spec.origin:
+        return None
+    return source_file(spec.origin)
+
+
+def cached_call(module_name, arg_list=sys.argv[1:], cache=None, **call_params):
+    """call() for the named module, serving its parser from the spec cache"""
+    return call((cache or SpecCache()).target(module_name), arg_list, **call_params)
@@ -0,0 +1,57 @@
+import asyncio
+from pyclap import annotations, call, Positional as Pos
+from pyclap.aio import async_call
+from nose.tools import *
+
+########################################################################################################################
+
+@annotations(n=Pos(type=int))
+async def count(n):
+    await asyncio.sleep(0)
+    return n * 2
+
+
+@annotations(n=Pos(type=int))
+async def rows(n):
+    for i in range(n):
+        await asyncio.sleep(0)
+        yield i
+
+
+def test_async_1():
+    ns, output = call(count, arg_list=['2'])
+    eq_(output, 4)
+    ns, output = call(rows, arg_list=['3'])
+    eq_(output, [0, 1, 2])
+    ns, output = call(rows, arg_list=['3'], greedy=True)
+    eq_(list(output), [0, 1, 2])
+
+
+########################################################################################################################
+def test_async_2():
+    events = []
+
+    class Interface(object):
+        commands = ['fetch']
+
+        def __enter__(self):
+            events.append('enter')
+
+        def __exit__(self, et, ex, tb):
+            events.append('exit')
+
+        @annotations(n=Pos(type=int))
+        async def fetch(self, n):
+            events.append('fetch')
+            return n
+
+    async def main():
+        return await async_call(Interface(), arg_list=['fetch', '5'])
+
+    loop = asyncio.new_event_loop()
+    try:
+        ns, output = loop.run_until_complete(main())
+    finally:
+        loop.close()
+    eq_(output, [5])
+    eq_(events, ['enter', 'fetch', 'exit'])
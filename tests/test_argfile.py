@@ -0,0 +1,60 @@
+import os, tempfile
+from pyclap import annotations, call, Positional as Pos
+from pyclap import argfile
+from nose.tools import *
+
+########################################################################################################################
+
+@annotations(values=Pos(type=int))
+def total(*values):
+    return sum(values)
+
+
+class Interface(object):
+    commands = ['add', 'echo']
+    argfile_prefix = '@'
+
+    @annotations(values=Pos(type=int))
+    def add(self, *values):
+        return sum(values)
+
+    def echo(self, *words):
+        return ' '.join(words)
+
+
+def write(data):
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_argfile_1():
+    path = write(b'1\n2\r\n3\n')
+    try:
+        eq_(call(total, ['@' + path, '4'], argfile_prefix='@', use_cache=False)[1], 10)
+        eq_(call(Interface(), ['ad', '@' + path])[1], [6])
+    finally:
+        os.remove(path)
+    path = write(b'echo\0a b\0\nc')
+    try:
+        eq_(call(Interface(), ['@' + path])[1], ['a b \nc'])
+    finally:
+        os.remove(path)
+
+
+def test_argfile_2():
+    path = write(b''.join(b'%d\0' % i for i in range(1000)))
+    mmap_threshold = argfile.MMAP_THRESHOLD
+    argfile.MMAP_THRESHOLD = 0
+    try:
+        eq_(list(argfile.iter_tokens(path))[-2:], ['998', '999'])
+        eq_(call(Interface(), ['add', '@' + path])[1], [sum(range(1000))])
+    finally:
+        argfile.MMAP_THRESHOLD = mmap_threshold
+        os.remove(path)
+
+
+@raises(SystemExit)
+def test_argfile_3():
+    call(Interface(), ['@/nonexistent/args'])
@@ -0,0 +1,27 @@
+from io import StringIO
+from pyclap import annotations, Positional as Pos, Option as Opt, CommandError
+from pyclap.batch import batch_call, read_records
+from nose.tools import *
+
+########################################################################################################################
+
+@annotations(a=Pos(type=int), b=Opt(type=int, abbrev='b'))
+def add(a, b=1):
+    return a + b
+
+
+def test_batch_1():
+    results = list(batch_call(add, [['1'], '2 -b 3', ['x'], '4']))
+    eq_(results[0][1], 2)
+    eq_(results[1][1], 5)
+    eq_(results[1][0]['b'], 3)
+    eq_(results[2][0], None)
+    ok_(isinstance(results[2][1], CommandError))
+    eq_(results[2][1].exit_code, 2)
+    eq_(results[3][1], 5)
+
+
+########################################################################################################################
+def test_records_1():
+    eq_(list(read_records(StringIO(u'a "b c"\n\nd\n'))), [['a', 'b c'], ['d']])
+    eq_(list(read_records(StringIO(u'a\nb\0c'), '\0', split=False, chunk_size=2)), ['a\nb', 'c'])
@@ -0,0 +1,64 @@
+from pyclap import annotations, Positional as Pos, Option as Opt
+from pyclap.chain import chain_call, split_chain
+from nose.tools import *
+
+########################################################################################################################
+
+events = []
+
+class Database(object):
+    commands = ['load', 'count', 'double', 'total']
+
+    @annotations(db=Opt('database', 'd'))
+    def __init__(self, db='test'):
+        events.append('init ' + db)
+        self.rows = []
+
+    def __enter__(self):
+        events.append('enter')
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        events.append('exit')
+
+    @annotations(rows=Pos(type=int))
+    def load(self, *rows):
+        self.rows.extend(rows)
+        return rows
+
+    def count(self):
+        return len(self.rows)
+
+    @annotations(values=Pos(type=int))
+    def double(self, *values):
+        for value in values:
+            yield value * 2
+
+    def total(self, *values):
+        return sum(values)
+
+
+def test_chain_1():
+    eq_(split_chain(['a', '+', 'b', 'c', '+']), [['a'], ['b', 'c'], []])
+    del events[:]
+    results = chain_call(Database, ['-d', 'prod', 'load', '1', '2', '+', 'load', '3', '+', 'co'], use_cache=False)
+    eq_([result for ns, result in results], [[1, 2], [3], [3]])
+    eq_(events, ['init prod', 'enter', 'exit'])
+
+
+def test_chain_2():
+    del events[:]
+    results = chain_call(Database, ['double', '1', '2', '::', 'double', '::', 'total'], separator='::', pipe=True,
+                         use_cache=False)
+    eq_([result for ns, result in results], [[2, 4], [4, 8], [12]])
+    eq_(events, ['init test', 'enter', 'exit'])
+
+
+def test_chain_3():
+    del events[:]
+    exits = raises(SystemExit)
+    exits(lambda: chain_call(Database, ['load', '1', '+', 'count'], pipe=True, use_cache=False))()
+    exits(lambda: chain_call(Database, ['load', '1', '+', 'load', 'x'], use_cache=False))()
+    exits(lambda: chain_call(Database, ['load', '1', '+'], use_cache=False))()
+    eq_(events, []) # nothing ran
+    raises(ValueError)(lambda: chain_call(Database, ['count'], separator='--', use_cache=False))()
@@ -0,0 +1,88 @@
+import os, sys
+from pyclap import annotations, call, Positional as Pos, Option as Opt, Flag
+from pyclap.completion import completer_for, script
+from nose.tools import *
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+########################################################################################################################
+
+class Interface(object):
+    commands = ['search', 'select', 'status']
+
+    @annotations(conn=Opt("Connection", 'c', choices=['db1', 'db2']))
+    def __init__(self, conn='db1'):
+        self.conn = conn
+
+    @annotations(regex=Pos("Regular Expression"), mode=Opt("Mode", 'm', choices=['fast', 'full', 'exact']),
+                 verbose=Flag("Verbose", 'v'))
+    def search(self, regex, mode='fast', verbose=False):
+        return regex
+
+    @annotations(table=Pos(choices=['users', 'groups']))
+    def select(self, table, *columns):
+        return table
+
+    def status(self):
+        return 'ok'
+
+
+def test_completion_1():
+    completer = completer_for(Interface)
+    eq_(completer.complete([], 's'), ['search', 'select', 'status'])
+    eq_(completer.complete([], 'se'), ['search', 'select'])
+    eq_(completer.complete([], '--c'), ['--conn'])
+    eq_(completer.complete(['-c'], ''), ['db1', 'db2'])
+    eq_(completer.complete(['-c', 'db1'], 'st'), ['status'])
+    eq_(completer.complete(['sea'], '--'), ['--help', '--mode', '--verbose'])
+    eq_(completer.complete(['search'], '-'), ['--help', '--mode', '--verbose', '-h', '-m', '-v'])
+    eq_(completer.complete(['search', '-m'], 'f'), ['fast', 'full'])
+    eq_(completer.complete(['search'], '--mode=e'), ['--mode=exact'])
+    eq_(completer.complete(['sel'], ''), ['groups', 'users'])
+    eq_(completer.complete(['select', 'users'], ''), [])
+    eq_(completer.complete(['s'], ''), []) # ambiguous
+
+
+def test_completion_2():
+    @annotations(level=Pos(choices=[1, 2, 3]), out=Opt('output', 'o'))
+    def func(level, out=None):
+        return level
+
+    ran = []
+    def command(word):
+        ran.append(word)
+
+    def complete(arg_list, **parser_params):
+        stream = StringIO()
+        stdout, sys.stdout = sys.stdout, stream
+        try:
+            call(func, arg_list, **parser_params)
+        except SystemExit as e:
+            eq_(e.code, 0)
+        else:
+            raise AssertionError('no exit')
+        finally:
+            sys.stdout = stdout
+        return stream.getvalue()
+
+    argv0, sys.argv[0] = sys.argv[0], '/usr/bin/my-tool' # installed name and prog differ
+    os.environ.update(PYCLAP_COMPLETE='bash', PYCLAP_COMPLETE_PROG='other', COMP_CWORD='3')
+    try:
+        raises(SystemExit)(lambda: call(command, ['x'], prog='tool'))() # completing another program
+        eq_(ran, [])
+        ok_('PYCLAP_COMPLETE' in os.environ)
+        eq_(complete(['x'], prog='tool'), '')
+        os.environ['PYCLAP_COMPLETE_PROG'] = 'tool'
+        eq_(complete(['-o', 'x', ''], prog='tool'), '1\n2\n3\n')
+        ok_('PYCLAP_COMPLETE' not in os.environ) # answered once
+        os.environ.update(PYCLAP_COMPLETE='bash', PYCLAP_COMPLETE_PROG='my-tool')
+        eq_(complete(['-o', 'x', ''], prog='tool'), '1\n2\n3\n')
+    finally:
+        sys.argv[0] = argv0
+        for name in ('PYCLAP_COMPLETE', 'PYCLAP_COMPLETE_PROG', 'COMP_CWORD'):
+            os.environ.pop(name, None)
+    ok_('complete -o default -F _pyclap_my_tool my-tool' in script('bash', 'my-tool'))
+    ok_('pyclap.completion query tool' in script('fish', 'tool', module='tool'))
+    ok_("PYCLAP_COMPLETE_PROG='tool'" in script('zsh', 'my-tool', name='tool'))
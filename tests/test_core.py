@@ -1,5 +1,6 @@
-
-from pyclap import annotations, call, Positional as Pos, Option as Opt, Flag, wizard_call
+import array, argparse
+from pyclap import annotations, call, Positional as Pos, Option as Opt, Flag, wizard_call, parser_cache, ParserCache, InstancePool
+from pyclap.core import DictType, container_factory
 from nose_tools import outputs, exits
 from nose.tools import *
 
@@ -218,3 +219,266 @@ def test_wizard_1():
     eq_(ns['test2_arg'], '7890')
     eq_(ns['test2_code'], 'test_2')
 
+
+
+########################################################################################################################
+def test_parser_cache_1():
+    @annotations(test_pos=Pos("test pos"))
+    def func(test_pos, *args, **kwargs):
+        return test_pos, args, kwargs
+
+    parser_cache.clear()
+    ns, output = call(func, arg_list=['1', 'a=1'])
+    eq_(output, ['1', (), {'a': '1'}])
+    ns, output = call(func, arg_list=['2', 'b'])
+    eq_(output, ['2', ('b',), {}])
+    eq_(parser_cache.misses, 1)
+    eq_(parser_cache.hits, 1)
+
+
+########################################################################################################################
+def test_parser_cache_2():
+    class Interface(object):
+        commands = ['search']
+
+        def search(self):
+            pass
+
+    obj = Interface()
+    cache = ParserCache(maxsize=1)
+    parser = cache.get(obj)
+    ok_(cache.get(obj) is parser)
+    obj.commands = []
+    ok_(cache.get(obj) is not parser)
+    cache.get(test_parser_cache_1)
+    eq_(len(cache), 1)
+
+
+########################################################################################################################
+def test_instance_pool_1():
+    closed = []
+
+    class Interface(object):
+        commands = ['search']
+        instance_pool_size = 1
+
+        @annotations(conn=Opt("Connection", 'c'))
+        def __init__(self, conn='a'):
+            self.conn = conn
+
+        def close(self):
+            closed.append(self.conn)
+
+        @annotations(regex=Pos("Regular Expression"))
+        def search(self, regex):
+            return self.conn + regex
+
+    ns, output = call(Interface, arg_list=['search', 'x'])
+    eq_(output, ['ax'])
+    ns, output = call(Interface, arg_list=['-c', 'b', 'search', 'y'])
+    eq_(output, ['by'])
+    eq_(closed, ['a'])
+
+
+########################################################################################################################
+def test_instance_pool_2():
+    closed = []
+    pool = InstancePool(lambda name: [name], maxsize=1, on_evict=closed.append)
+    with pool.using(('a',)) as obj:
+        ok_(pool.get(('a',)) is obj)
+        pool.get(('b',))
+        eq_(closed, [])
+    eq_(closed, [['a']])
+    eq_(pool.stats(), dict(hits=1, misses=2, evictions=1, size=1, in_use=0))
+
+
+def test_instance_pool_3():
+    import threading
+    started, release = threading.Event(), threading.Event()
+    built = []
+    def factory(name):
+        built.append(name)
+        if name == 'slow':
+            started.set()
+            release.wait(5)
+        return [name]
+
+    pool = InstancePool(factory)
+    eq_(pool.maxsize, InstancePool.MAXSIZE)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.get(('slow',)))) for i in range(3)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    eq_(pool.get(('fast',)), ['fast']) # not held up by the slow constructor
+    ok_(threads[0].is_alive())
+    release.set()
+    for thread in threads:
+        thread.join()
+    eq_(built, ['slow', 'fast']) # built once
+    ok_(results[0] is results[1] is results[2])
+
+
+########################################################################################################################
+def test_varargs_1():
+    @annotations(values=Pos(type=int), options=Pos(type=float))
+    def func(*values, **options):
+        return values, options
+
+    ns, output = call(func, arg_list=['1', 'a=2', '3', 'b=0.5'])
+    eq_(output, [(1, 3), dict(a=2.0, b=0.5)])
+
+    def plain(*values):
+        return values
+
+    ns, output = call(plain, arg_list=['1', 'a=2'])
+    eq_(output, ['1', 'a=2'])
+
+
+def test_dict_type_1():
+    to_int = DictType(int)
+    eq_(to_int('a=2'), ('a', 2))
+    eq_(DictType()('key=x=y'), ('key', 'x=y'))
+    raises(argparse.ArgumentTypeError)(lambda: to_int('2'))()
+
+
+@raises(SystemExit)
+def test_varargs_2():
+    @annotations(values=Pos(type=int))
+    def func(*values, **options):
+        return values
+
+    call(func, arg_list=['1', 'x', 'a=2'])
+
+
+########################################################################################################################
+def test_container_1():
+    @annotations(values=Pos(type=float, container='array'), counts=Pos(type=int, container='i'))
+    def func(values, counts=None):
+        return values, counts
+
+    ns, output = call(func, arg_list=['1', '2.5'])
+    eq_(ns['values'], array.array('d', [1.0, 2.5]))
+    eq_(ns['counts'], array.array('i'))
+
+    @annotations(counts=Pos(type=int, container='i'))
+    def first(n, counts):
+        return n, counts
+
+    ns, output = call(first, arg_list=['1', '2', '3'])
+    eq_(ns['counts'], array.array('i', [2, 3]))
+    eq_(container_factory('array', int)[1](['7']).typecode, 'q')
+    assert_raises(ValueError, container_factory, 'u')
+
+
+@raises(SystemExit)
+def test_container_2():
+    @annotations(values=Pos(type=int, container='array'))
+    def func(values):
+        return values
+
+    call(func, arg_list=['1', 'x'])
+
+
+########################################################################################################################
+def test_spec_1():
+    from pyclap.core import ArgumentParser, CallableCommandSpec
+    option = Opt("Size (default {default})")
+
+    @annotations(size=option, name=('Name', 'option', 'n'))
+    def func(path, size=3, name=None):
+        return path
+
+    @annotations(name=('Name', 'option', 'n'))
+    def other(path, name=None):
+        return path
+
+    spec = CallableCommandSpec(func)
+    ok_(spec.annotations['path'] is CallableCommandSpec(other).annotations['path'])
+    ok_(spec.annotations['name'] is CallableCommandSpec(other).annotations['name'])
+    ok_('__dict__' not in vars(CallableCommandSpec)) # slots only
+    help = ArgumentParser.parser_from(func).format_help()
+    ok_('Size (default 3)' in help)
+    eq_(option.help, "Size (default {default})")
+    eq_(ArgumentParser.parser_from(func).format_help(), help)
+
+
+########################################################################################################################
+def test_help_1():
+    import types
+    from pyclap.core import ArgumentParser
+    module = types.ModuleType('tool')
+    module.commands = ['deploy', 'delete', 'status']
+    module.deploy = lambda target: target
+    module.delete = lambda target: target
+    module.status = lambda: None
+    module.lazy_subcommands = True
+    parser = ArgumentParser.parser_from(module, prog='tool')
+
+    help = parser.format_help('de')
+    ok_('deploy' in help and 'delete' in help and 'status' not in help)
+    eq_(sorted(k for k, v in dict.items(parser._get_subparsers()) if v is not None), ['delete', 'deploy'])
+    ok_(parser.format_help('de') is help) # cached
+    ok_('No command starts with' in parser.format_help('x'))
+    usage = parser.format_usage()
+    ok_('{deploy,delete,status}' in usage)
+    ok_(parser.format_usage() is usage)
+    parser.add_argument('--verbose', action='store_true')
+    ok_('--verbose' in parser.format_usage())
+    parser.format_help() # cached
+    parser.add_argument_group('extra').add_argument('--zzz')
+    ok_('--zzz' in parser.format_help())
+    parser.description = 'Deploys things'
+    ok_('Deploys things' in parser.format_help())
+    raises(SystemExit)(lambda: parser.smart_parse_args(['-h', 'sta']))()
+    eq_(parser._help_prefix(['-h', 'sta']), 'sta')
+    eq_(parser._help_prefix(['deploy', '-h', 'foo']), None) # the help of deploy
+    eq_(parser._help_prefix(['dep', '-h', 'foo']), None)
+
+
+########################################################################################################################
+def test_choices_1():
+    from pyclap import Choices
+    from pyclap.core import ArgumentParser, ParserError
+    catalog = ['item{0:05d}'.format(i) for i in range(50000)]
+
+    @annotations(item=Pos(choices=catalog), count=Opt(type=int, choices=Choices([1, 2, 3])))
+    def func(item, count=1):
+        return item
+
+    parser = ArgumentParser.parser_from(func, raise_errors=True)
+    eq_(parser.consume(['item04242'])[1], 'item04242')
+    ok_('{item00000,item00001,' in parser.format_usage())
+    ok_(len(parser.format_usage()) < 200)
+    try:
+        parser.consume(['item4242'])
+    except ParserError as e:
+        ok_("did you mean 'item04242'" in e.message, e.message)
+    else:
+        ok_(False)
+    try:
+        parser.consume(['item00001', '--count', '7'])
+    except ParserError as e:
+        ok_('choose from 1, 2, 3' in e.message, e.message)
+    else:
+        ok_(False)
+    eq_(Choices(catalog).complete('itemx'), [])
+    eq_(len(Choices(catalog).complete('item0424')), 10)
+
+
+def test_choices_2():
+    from pyclap.core import ArgumentParser, indexed_choices
+    from pyclap.completion import completer_for
+
+    @annotations(level=Pos(choices=(name for name in ['low', 'high'])))
+    def func(level):
+        return level
+
+    for i in range(2): # a generator is read once, by the first parser
+        eq_(ArgumentParser.parser_from(func, prog='p{0}'.format(i)).consume(['high'])[1], 'high')
+    eq_(completer_for(func).complete([], 'h'), ['high'])
+    catalog = ['item{0:02d}'.format(i) for i in range(20)]
+    ok_(indexed_choices(catalog) is indexed_choices(catalog)) # indexed once
+    catalog.append('item20')
+    ok_('item20' in indexed_choices(catalog))
@@ -0,0 +1,83 @@
+import os, sys, time, shutil, tempfile
+from pyclap.daemon import Daemon, forward, socket_path, check_directory
+from nose.tools import *
+
+########################################################################################################################
+
+SOURCE = '''
+commands = ['add']
+
+def add(a, b):
+    return int(a) + int(b) + %d
+'''
+
+
+def capture(func, *args):
+    """Returns func(*args) and what it wrote on the stdout file descriptor"""
+    with tempfile.TemporaryFile() as f:
+        saved, stdout = os.dup(1), sys.stdout
+        os.dup2(f.fileno(), 1)
+        sys.stdout = os.fdopen(os.dup(1), 'w')
+        try:
+            result = func(*args)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+            os.dup2(saved, 1)
+            os.close(saved)
+        f.seek(0)
+        return result, f.read().decode()
+
+
+def test_daemon_1():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'daemon.sock')
+    with open(os.path.join(directory, 'daemon_cmds.py'), 'w') as f:
+        f.write(SOURCE % 0)
+    sys.path.insert(0, directory)
+    pid = None
+    try:
+        eq_(capture(forward, 'daemon_cmds', ['add', '1', '2'], path, False), (0, '3\n')) # in-process
+        pid = os.fork()
+        if pid == 0:
+            try:
+                Daemon('daemon_cmds', path, idle_timeout=5).serve()
+            finally:
+                os._exit(0)
+        for _ in range(100):
+            if os.path.exists(path):
+                break
+            time.sleep(0.05)
+        eq_(capture(forward, 'daemon_cmds', ['add', '1', '2'], path, False), (0, '3\n'))
+        eq_(capture(forward, 'daemon_cmds', ['add', '1'], path, False)[0], 2)
+
+        time.sleep(0.01)
+        with open(os.path.join(directory, 'daemon_cmds.py'), 'w') as f:
+            f.write(SOURCE % 100 + '\n')
+        eq_(capture(forward, 'daemon_cmds', ['add', '1', '2'], path, False), (0, '103\n')) # reloaded
+    finally:
+        if pid:
+            os.kill(pid, 15)
+            os.waitpid(pid, 0)
+        sys.path.remove(directory)
+        sys.modules.pop('daemon_cmds', None)
+        shutil.rmtree(directory)
+
+
+def test_daemon_2():
+    directory = tempfile.mkdtemp()
+    saved = os.environ.get('XDG_RUNTIME_DIR')
+    os.environ['XDG_RUNTIME_DIR'] = directory
+    try:
+        path = socket_path('daemon_cmds')
+        eq_(os.stat(os.path.dirname(path)).st_mode & 0o777, 0o700)
+        check_directory(path)
+        os.chmod(os.path.dirname(path), 0o755) # readable by others: refused
+        raises(IOError)(lambda: check_directory(path))()
+        raises(IOError)(lambda: forward('daemon_cmds', ['add', '1', '2'], path, False))()
+    finally:
+        if saved is None:
+            del os.environ['XDG_RUNTIME_DIR']
+        else:
+            os.environ['XDG_RUNTIME_DIR'] = saved
+        shutil.rmtree(directory)
@@ -0,0 +1,95 @@
+import os, json, shutil, tempfile
+from pyclap import call, annotations, Option as Opt, Flag
+from pyclap.core import ArgumentParser
+from pyclap.defaults import ConfigDefaults, LazyDefault
+from nose.tools import *
+
+########################################################################################################################
+
+INI = '''
+[DEFAULT]
+since = leaked
+
+[main]
+host = db.example.org
+
+[deploy]
+retries = 5
+verbose = yes
+'''
+
+
+def make_class(config):
+    class Tool(object):
+        commands = ['deploy', 'status']
+        config_defaults = config
+
+        @annotations(host=Opt('database host', 'H'))
+        def __init__(self, host='localhost'):
+            self.host = host
+
+        @annotations(retries=Opt('retries', 'r', type=int), verbose=Flag('verbose', 'v'))
+        def deploy(self, target, retries=3, verbose=False):
+            return self.host, target, retries, verbose
+
+        def status(self, since=LazyDefault('last_seen')):
+            return since
+
+        def last_seen(self):
+            return 'seen by ' + self.host
+
+    return Tool
+
+
+def test_defaults_1():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'tool.ini')
+        with open(path, 'w') as f:
+            f.write(INI)
+        Tool = make_class(ConfigDefaults(path, env_prefix='PYCLAP_TEST'))
+        eq_(call(Tool, ['deploy', 'prod'], use_cache=False)[1], ['db.example.org', 'prod', 5, True])
+        eq_(call(Tool, ['-H', 'h', 'deploy', 'prod', '-r', '1'], use_cache=False)[1], ['h', 'prod', 1, True])
+        os.environ['PYCLAP_TEST_DEPLOY_RETRIES'] = '7'
+        os.environ['PYCLAP_TEST_DEPLOY_TARGET'] = 'staging' # a positional with a value becomes optional
+        try:
+            eq_(call(Tool, ['deploy'], use_cache=False)[1], ['db.example.org', 'staging', 7, True])
+        finally:
+            del os.environ['PYCLAP_TEST_DEPLOY_RETRIES']
+            del os.environ['PYCLAP_TEST_DEPLOY_TARGET']
+        ns, output = call(Tool, ['status'], use_cache=False)
+        eq_(output, ['seen by db.example.org'])
+        eq_(ns['since'], 'seen by db.example.org')
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_defaults_2():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'tool.json')
+        with open(path, 'w') as f:
+            json.dump(dict(host='json-host', deploy={'retries': 2}), f)
+        Tool = make_class(ConfigDefaults(path))
+        eq_(call(Tool, ['deploy', 'x'], use_cache=False)[1], ['json-host', 'x', 2, False])
+        os.remove(path) # read once per process
+        eq_(call(Tool, ['deploy', 'x'], use_cache=False)[1], ['json-host', 'x', 2, False])
+        eq_(call(make_class(ConfigDefaults(os.path.join(directory, 'missing.json'))), ['deploy', 'x'],
+                 use_cache=False)[1], ['localhost', 'x', 3, False])
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_defaults_3():
+    calls = []
+    def now():
+        calls.append(1)
+        return 'now'
+
+    def log(since=LazyDefault(now, 'the current time')):
+        return since
+
+    ok_('[the current time]' in ArgumentParser.parser_from(log).format_help())
+    eq_(call(log, [], use_cache=False), ({'since': 'now', '_cmd_func_': log}, 'now'))
+    eq_(call(log, ['then'], use_cache=False)[1], 'then')
+    eq_(len(calls), 1)
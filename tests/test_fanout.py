@@ -0,0 +1,90 @@
+import os, sys, shutil, tempfile, threading
+from concurrent.futures import ThreadPoolExecutor
+from pyclap import annotations, Positional as Pos, CommandError
+from pyclap.fanout import fanout_call
+from pyclap.memo import memoize
+from pyclap.defaults import LazyDefault
+from nose.tools import *
+
+########################################################################################################################
+
+@annotations(shard=Pos(type=int))
+def scan(shard):
+    if shard < 0:
+        raise ValueError(shard)
+    return shard * 10
+
+
+def test_fanout_1():
+    results = list(fanout_call(scan, [[str(i)] for i in range(10)] + [['x'], ['-1']], max_workers=3))
+    eq_([r for ns, r in results[:10]], [i * 10 for i in range(10)])
+    eq_(results[10][1].exit_code, 2)
+    ok_(isinstance(results[11][1].error, ValueError))
+
+    results = list(fanout_call(scan, [[str(i)] for i in range(10)], ordered=False, max_pending=2))
+    eq_(sorted(r for ns, r in results), [i * 10 for i in range(10)])
+
+
+########################################################################################################################
+def test_fanout_2():
+    class Interface(object):
+        commands = ['scan']
+
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.entered = 0
+
+        def __enter__(self):
+            with self.lock:
+                self.entered += 1
+
+        def __exit__(self, et, ex, tb):
+            with self.lock:
+                self.entered -= 1
+
+        @annotations(shard=Pos(type=int))
+        def scan(self, shard):
+            ok_(self.entered > 0)
+            return shard
+
+    obj = Interface()
+    results = list(fanout_call(obj, [['scan', str(i)] for i in range(20)], max_workers=4))
+    eq_([r for ns, r in results], [[i] for i in range(20)])
+    eq_(obj.entered, 0)
+
+
+########################################################################################################################
+def test_fanout_3():
+    calls = []
+
+    @memoize
+    def label(shard, prefix=LazyDefault(lambda: 'shard')):
+        calls.append(shard)
+        return '{0}-{1}'.format(prefix, shard)
+
+    results = list(fanout_call(label, [['1'], ['2'], ['1']], max_workers=1))
+    eq_([r for ns, r in results], ['shard-1', 'shard-2', 'shard-1'])
+    eq_(sorted(calls), ['1', '2']) # the third one from the memo cache
+
+
+########################################################################################################################
+def test_fanout_4():
+    directory = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(directory, 'pyclap_fanout_sub.py'), 'w') as f:
+            f.write("def ping(host):\n    return 'pong ' + host\n\ncommands = ['ping']\n")
+        with open(os.path.join(directory, 'pyclap_fanout_top.py'), 'w') as f:
+            f.write("from pyclap import group\n\ndef status():\n    return 'ok'\n\n"
+                    "commands = ['status', group('net', 'pyclap_fanout_sub')]\n")
+        sys.path.insert(0, directory)
+        import pyclap_fanout_top
+        for executor in ('thread', 'process'):
+            results = list(fanout_call(pyclap_fanout_top, [['net', 'ping', 'h'], ['status']],
+                                       executor=executor, max_workers=2))
+            eq_([r for ns, r in results], [['pong h'], ['ok']])
+        assert_raises(ValueError, list, fanout_call(scan, [['1']], executor=ThreadPoolExecutor(1)))
+    finally:
+        sys.path.remove(directory)
+        for name in ('pyclap_fanout_top', 'pyclap_fanout_sub'):
+            sys.modules.pop(name, None)
+        shutil.rmtree(directory)
@@ -0,0 +1,93 @@
+from pyclap import annotations, call, Positional as Pos, Option as Opt, Flag
+from pyclap.core import ArgumentParser
+from pyclap.fastpath import FastParser, FastPathFallback
+from nose.tools import *
+
+########################################################################################################################
+
+@annotations(src=Pos('source'), count=Opt('count', 'c', type=int, choices=[1, 2, 3]),
+             name=Opt('name', 'n'), ratio=Opt('ratio', 'r', type=float), verbose=Flag('verbose', 'v'))
+def copy(src, dst='out', count=1, name='x', ratio='0.5', verbose=False):
+    return src, dst, count, name, ratio, verbose
+
+
+ARG_LISTS = [
+    ['a'], ['a', 'b'], ['-c', '2', 'a'], ['--count=2', 'a'], ['-v', 'a', '-n', 'y'], ['-', '-v'], ['a', '-r', '2'],
+    ['-n', '', 'a'], ['', ''],
+    # handled by argparse
+    ['a', '--', '-b'], ['--cou', '2', 'a'], ['-vn', 'y', 'a'], ['-c2', 'a'],
+]
+
+ERRORS = [[], ['a', 'b', 'c'], ['-c', '5', 'a'], ['-c', 'x', 'a'], ['-z', 'a'], ['a', '-c'], ['--verbose=1', 'a'],
+          ['-c', '-1', 'a'], ['a', '-v', 'b'], ['a', '--count', '3', 'b']]
+
+
+def parse(parser, arg_list):
+    try:
+        return vars(parser.parse_args(list(arg_list)))
+    except SystemExit:
+        return SystemExit
+
+
+def test_fastpath_1():
+    parser = ArgumentParser.parser_from(copy)
+    fast_parser = FastParser.compile(parser)
+    ok_(fast_parser)
+    handled = 0
+    for arg_list in ARG_LISTS + ERRORS:
+        try:
+            ns = fast_parser.parse(arg_list)
+        except FastPathFallback:
+            continue
+        handled += 1
+        eq_(ns, parse(parser, arg_list), arg_list)
+    eq_(handled, 9)
+
+
+def test_fastpath_2():
+    for arg_list in ARG_LISTS:
+        eq_(call(copy, arg_list, fast_parse=True, use_cache=False)[1],
+            call(copy, arg_list, use_cache=False)[1])
+
+
+def test_fastpath_errors():
+    for arg_list in ERRORS:
+        raises(SystemExit)(lambda: call(copy, arg_list, fast_parse=True, use_cache=False))()
+
+
+########################################################################################################################
+def test_fastpath_3():
+    class Interface(object):
+        commands = ['add', 'show']
+        fast_parse = True
+
+        @annotations(a=Pos(type=int), b=Pos(type=int), quiet=Flag('quiet', 'q'))
+        def add(self, a, b, quiet=False):
+            return a + b
+
+        def show(self, *names, **opts):
+            return names
+
+    eq_(call(Interface(), ['add', '1', '2'])[1], [3])
+    eq_(call(Interface(), ['ad', '-q', '1', '2'])[1], [3])
+    eq_(call(Interface(), ['show', 'x', 'y'])[1], ['x', 'y'])
+    parser = ArgumentParser.parser_from(Interface())
+    ok_(parser._get_fast_parser())
+    ok_(parser.command_func('add'))
+    ok_(parser._get_subparsers()['add']._get_fast_parser())
+    eq_(parser._get_subparsers()['show']._get_fast_parser(), False) # *args
+
+
+def test_fastpath_4():
+    @annotations(n=Pos(type=int), tag=Pos(choices=['a', 'b']))
+    def first(n, tag='c'):
+        return n, tag
+
+    eq_(FastParser.compile(ArgumentParser.parser_from(first)), None) # the default is not a choice
+    eq_(call(first, ['1', 'b'], fast_parse=True, use_cache=False)[1], [1, 'b'])
+    try:
+        call(first, ['1'], fast_parse=True, use_cache=False)
+    except SystemExit:
+        pass
+    else:
+        raise AssertionError('no error')
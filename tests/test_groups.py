@@ -0,0 +1,98 @@
+import os, sys, types, shutil, tempfile
+from pyclap import call, group
+from pyclap.core import ArgumentParser
+from pyclap.completion import completer_for
+from pyclap.spec_cache import SpecCache, cached_call
+from nose.tools import *
+
+########################################################################################################################
+
+SUBSYSTEM = '''
+from pyclap import annotations, Option as Opt
+
+class Queue(object):
+    commands = ['push', 'size']
+
+    @annotations(name=Opt('queue name', 'n'))
+    def __init__(self, name='default'):
+        self.name = name
+
+    def push(self, *items):
+        return self.name, items
+
+    def size(self):
+        return 0
+
+def ping(host):
+    return 'pong ' + host
+
+commands = ['ping', 'pyclap_sub.Queue']
+'''
+
+
+def make_tree():
+    directory = tempfile.mkdtemp()
+    with open(os.path.join(directory, 'pyclap_sub.py'), 'w') as f:
+        f.write(SUBSYSTEM)
+    sys.path.insert(0, directory)
+    sys.modules.pop('pyclap_sub', None)
+    root = types.ModuleType('pyclap_root')
+    root.status = lambda: 'ok'
+    root.commands = ['status', group('net', 'pyclap_sub', help='Network tools'), group('pong', 'pyclap_sub:ping')]
+    return directory, root
+
+
+def remove_tree(directory):
+    sys.path.remove(directory)
+    sys.modules.pop('pyclap_sub', None)
+    shutil.rmtree(directory)
+
+
+def test_groups_1():
+    directory, root = make_tree()
+    try:
+        eq_(call(root, ['status'], use_cache=False)[1], ['ok'])
+        ok_('Network tools' in ArgumentParser.parser_from(root).format_help())
+        ok_('pyclap_sub' not in sys.modules)
+        eq_(call(root, ['n', 'pi', 'localhost'], use_cache=False)[1], ['pong localhost'])
+        eq_(call(root, ['net', 'Queue', '-n', 'jobs', 'pu', 'a', 'b'], use_cache=False)[1], ['jobs', ('a', 'b')])
+        eq_(call(root, ['pong', 'x'], use_cache=False)[1], 'pong x')
+        raises(SystemExit)(lambda: call(root, ['net'], use_cache=False))()
+
+        parser = ArgumentParser.parser_from(root)
+        parser.smart_parse_args(['net', 'ping', 'h']) # builds the group
+        help = parser.format_help()
+        eq_(help.count('Network tools'), 1)
+        eq_(len([line for line in help.splitlines() if line.split()[:1] == ['net']]), 1)
+        eq_(len([line for line in help.splitlines() if line.split()[:1] == ['pong']]), 1)
+    finally:
+        remove_tree(directory)
+
+
+def test_groups_2():
+    directory, root = make_tree()
+    try:
+        completer = completer_for(root)
+        eq_(completer.complete([], ''), ['net', 'pong', 'status'])
+        ok_('pyclap_sub' not in sys.modules)
+        eq_(completer.complete(['net'], ''), ['Queue', 'ping'])
+        eq_(completer.complete(['net', 'Queue', '-n', 'x'], 's'), ['size'])
+    finally:
+        remove_tree(directory)
+
+
+def test_groups_3():
+    directory, root = make_tree()
+    cache = SpecCache(tempfile.mkdtemp())
+    try:
+        with open(os.path.join(directory, 'pyclap_top.py'), 'w') as f:
+            f.write("from pyclap import group\ncommands = ['pyclap_sub:ping', group('net', 'pyclap_sub')]\n")
+        cache.target('pyclap_top')
+        sys.modules.pop('pyclap_top')
+        ns, output = cached_call('pyclap_top', ['net', 'ping', 'h'], cache=cache)
+        eq_((ns['_cmd_name_'], output), ('ping', ['pong h']))
+        ok_('pyclap_top' not in sys.modules)
+    finally:
+        sys.modules.pop('pyclap_top', None)
+        shutil.rmtree(cache.directory)
+        remove_tree(directory)
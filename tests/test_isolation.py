@@ -0,0 +1,94 @@
+import os, time
+from pyclap.core import ArgumentParser
+from pyclap.batch import batch_call
+from pyclap.isolation import IsolatedPool, CommandTimeout, WorkerDied
+from pyclap.defaults import LazyDefault
+from nose.tools import *
+
+########################################################################################################################
+
+def pid():
+    return os.getpid()
+
+def sleep(seconds):
+    time.sleep(float(seconds))
+    return 'slept'
+
+def count(n):
+    for i in range(int(n)):
+        yield i
+
+def fail(n):
+    yield 1
+    raise ValueError(n)
+
+def spin():
+    while True:
+        pass
+
+
+def parent():
+    return os.getpid()
+
+
+class Tools(object):
+    commands = ['pid', 'sleep', 'count', 'fail', 'spin', 'pids', 'owner']
+    pid = staticmethod(pid)
+    sleep = staticmethod(sleep)
+    count = staticmethod(count)
+    fail = staticmethod(fail)
+    spin = staticmethod(spin)
+
+    def pids(self, caller=LazyDefault(parent)):
+        return caller, os.getpid()
+
+    def owner(self, name=LazyDefault('worker')):
+        return name
+
+    def worker(self):
+        return os.getpid()
+
+
+def test_isolation_1():
+    with IsolatedPool(timeout=5) as pool:
+        results = list(batch_call(Tools, [['pid'], ['pid'], ['count', '200'], ['nope'], ['fail', 'x']],
+                                  executor=pool))
+        eq_(pool.spawned, 1) # reused, and not spawned for the parse error
+        ok_(results[0][1][0] != os.getpid())
+        eq_(results[0][1], results[1][1])
+        eq_(results[2][1], list(range(200)))
+        eq_(results[3][1].exit_code, 2)
+        ok_(isinstance(results[4][1].error, ValueError))
+
+
+def test_isolation_2():
+    with IsolatedPool(timeout=0.5) as pool:
+        start = time.time()
+        results = list(batch_call(Tools, [['sleep', '10'], ['sleep', '0']], executor=pool))
+        ok_(time.time() - start < 5)
+        ok_(isinstance(results[0][1].error, CommandTimeout))
+        eq_(results[1][1], ['slept'])
+        eq_(pool.spawned, 2)
+
+
+def test_isolation_3():
+    with IsolatedPool(cpu_time=1, timeout=30) as pool:
+        results = list(batch_call(Tools, [['spin']], executor=pool))
+        ok_(isinstance(results[0][1].error, WorkerDied))
+
+    results = list(batch_call(count, [['3'], ['4']], greedy=True, executor='isolated')) # listed, not streamed
+    eq_([r for ns, r in results], [[0, 1, 2], [0, 1, 2, 3]])
+
+    with IsolatedPool(max_tasks=1) as pool:
+        stream = pool.run(ArgumentParser.parser_from(count), count, ['5'], {})
+        eq_(list(stream), list(range(5)))
+
+
+def test_isolation_4():
+    with IsolatedPool() as pool:
+        (ns, pids), (owner_ns, owner) = batch_call(Tools, [['pids'], ['owner']], executor=pool)
+        eq_(ns['caller'], os.getpid()) # resolved in the parent
+        eq_(pids[0], os.getpid())
+        ok_(pids[1] != os.getpid())
+        eq_(owner_ns['name'], owner[0]) # resolved by the worker
+        ok_(owner[0] != os.getpid())
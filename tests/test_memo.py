@@ -0,0 +1,115 @@
+import time, shutil, tempfile
+from pyclap import annotations, call, Positional as Pos, Option as Opt
+from pyclap.core import ArgumentParser
+from pyclap.memo import MemoCache, memoize
+from nose.tools import *
+
+########################################################################################################################
+
+runs = []
+
+@memoize
+@annotations(a=Pos(type=int), b=Opt(type=int))
+def add(a, b=1):
+    runs.append(a)
+    return a + b
+
+
+class Reports(object):
+    commands = ['numbers']
+
+    @annotations(base=Opt(type=int))
+    def __init__(self, base=0):
+        self.base = base
+
+    @memoize(maxsize=2)
+    @annotations(n=Pos(type=int))
+    def numbers(self, n):
+        runs.append(n)
+        for i in range(n):
+            yield self.base + i
+
+
+def test_memo_1():
+    del runs[:]
+    add.memo_cache.clear()
+    eq_(call(add, ['1'])[1], 2)
+    eq_(call(add, ['01', '--b', '1'])[1], 2) # same converted arguments
+    eq_(call(add, ['2'])[1], 3)
+    eq_(runs, [1, 2])
+    parser = ArgumentParser.parser_from(add)
+    eq_(parser.memo_stats()[None]['hits'], 1)
+    eq_(parser.memo_stats()[None]['misses'], 2)
+
+
+def test_memo_2():
+    del runs[:]
+    parser = ArgumentParser.parser_from(Reports)
+    eq_(list(parser.consume(['numbers', '3'])[1]), [0, 1, 2])
+    eq_(list(parser.consume(['numbers', '3'])[1]), [0, 1, 2])
+    eq_(list(parser.consume(['--base', '1', 'numbers', '3'])[1]), [1, 2, 3])
+    eq_(runs, [3, 3])
+    result = parser.consume(['numbers', '4'])[1]
+    next(result) # not exhausted: not cached
+    eq_(list(parser.consume(['numbers', '4'])[1]), [0, 1, 2, 3])
+    stats = parser.memo_stats()['numbers']
+    eq_((stats['hits'], stats['size']), (1, 2))
+    ok_(stats['evictions'] >= 1)
+
+
+def test_memo_3():
+    directory = tempfile.mkdtemp()
+    try:
+        cache = MemoCache(ttl=60, max_bytes=10 ** 4, directory=directory)
+        func = lambda *args: list(args)
+        eq_(cache.call(func, (1, 2), {}, name='f'), [1, 2])
+        eq_(cache.call(func, (1, 2), {}, name='f'), [1, 2])
+        eq_(cache.call(func, ('x' * 10 ** 5,), {}, name='f')[0][:1], 'x') # too big to be kept
+        eq_(cache.stats()['size'], 1)
+
+        other = MemoCache(ttl=60, directory=directory) # another process
+        eq_(other.call(lambda *args: None, (1, 2), {}, name='f'), [1, 2])
+        eq_(other.stats()['hits'], 1)
+
+        other.ttl = 0
+        time.sleep(0.01)
+        eq_(other.call(lambda *args: None, (1, 2), {}, name='g'), None)
+        eq_(MemoCache(ttl=0, directory=directory).call(lambda *args: 'new', (1, 2), {}, name='f'), 'new')
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_memo_4():
+    class Counter(object):
+        commands = ['value']
+
+        def __init__(self, start):
+            self.start = start
+
+        @memoize
+        def value(self):
+            return self.start
+
+    eq_(call(Counter(1), ['value'])[1], [1])
+    eq_(call(Counter(2), ['value'])[1], [2]) # not the result of the other instance
+
+    class Point(object): # __eq__ without __hash__: not hashable on Python 3
+        commands = ['norm']
+        calls = []
+
+        def __init__(self, x):
+            self.x = x
+
+        def __eq__(self, other):
+            return self.x == other.x
+
+        __hash__ = None
+
+        @memoize
+        def norm(self):
+            self.calls.append(self.x)
+            return abs(self.x)
+
+    eq_(call(Point(-3), ['norm'])[1], [3])
+    eq_(call(Point(-3), ['norm'])[1], [3]) # not cached
+    eq_(Point.calls, [-3, -3])
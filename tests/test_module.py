@@ -1,4 +1,4 @@
-from pyclap import annotations, call, Positional as Pos, Option as Opt, Flag, wizard_call
+from pyclap import annotations, call, Positional as Pos, Option as Opt, Flag, wizard_call, parser_cache
 import sys
 from nose_tools import exits, outputs
 from nose.tools import *
@@ -57,3 +57,25 @@ def test_arg_1():
     eq_(ns['_cmd_name_'], 'command1')
     eq_(ns['positional_arg'], '1234')
     eq_(ns['optional_arg'], 'test')
+
+
+######################################################################################################
+def test_lazy_1():
+    parser = parser_cache.get(sys.modules[__name__], lazy_subcommands=True)
+    ns, output = parser.consume(['command2', '1234', '--flag-arg'])
+    eq_(list(output), ['1234', 'test', True])
+    eq_(list(parser.subparsers._name_parser_map.stubs), ['command1'])
+
+
+######################################################################################################
+def test_abbrev_1():
+    ns, output = call(sys.modules[__name__], arg_list=['command2', '1234'])
+    eq_(ns['_cmd_name_'], 'command2')
+    ns, output = call(sys.modules[__name__], arg_list=['COMMAND1', '1234'], case_sensitive=False)
+    eq_(ns['_cmd_name_'], 'command1')
+
+
+######################################################################################################
+@raises(NameError)
+def test_abbrev_2():
+    call(sys.modules[__name__], arg_list=['comm', '1234'])
@@ -0,0 +1,39 @@
+from io import StringIO
+from pyclap.output import LineSink, JsonLinesSink, CsvSink, stream_call
+from pyclap import annotations, Positional as Pos
+from nose.tools import *
+
+########################################################################################################################
+
+@annotations(n=Pos(type=int))
+def rows(n):
+    for i in range(n):
+        yield i, 'row {0}'.format(i)
+
+
+def test_stream_1():
+    out = StringIO()
+    ns, sink = stream_call(rows, JsonLinesSink(out, buffer_size=8), arg_list=['3'])
+    eq_(out.getvalue(), u'[0, "row 0"]\n[1, "row 1"]\n[2, "row 2"]\n')
+    eq_(sink.rows, 3)
+    eq_(sink.bytes, len(out.getvalue()))
+
+
+########################################################################################################################
+def test_stream_2():
+    out = StringIO()
+    stream_call(rows, CsvSink(out, lineterminator='\n'), arg_list=['2'])
+    eq_(out.getvalue(), u'0,row 0\n1,row 1\n')
+
+    for fieldnames in (None, ['b', 'a']):
+        out = StringIO()
+        with CsvSink(out, fieldnames=fieldnames, lineterminator='\n') as sink:
+            sink.write(dict(b=1, a=2))
+            sink.write(dict(a=3))
+        eq_(out.getvalue(), u'b,a\n1,2\n,3\n') # the same header, inferred or given
+
+    out = StringIO()
+    with LineSink(out) as sink:
+        sink.write(u'a')
+        eq_(out.getvalue(), u'')
+    eq_(out.getvalue(), u'a\n')
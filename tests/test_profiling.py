@@ -0,0 +1,39 @@
+from pyclap import annotations, call, Positional as Pos
+from pyclap.profiling import Profiler, add_hook, remove_hook, phase, NULL_TIMER
+from nose.tools import *
+
+########################################################################################################################
+
+@annotations(n=Pos(type=int))
+def numbers(n):
+    for i in range(n):
+        yield i
+
+
+def test_profiling_1():
+    with Profiler() as profiler:
+        ns, output = call(numbers, ['3'], use_cache=False)
+    eq_(output, [0, 1, 2])
+    for name in ('spec', 'build', 'populate', 'parse', 'consume', 'command', 'results'):
+        ok_(name in profiler.phases, name)
+    calls, wall, cpu = profiler.phases['parse']
+    eq_(calls, 1)
+    ok_(wall >= 0 and cpu >= 0)
+    eq_(profiler.counters['result_items'], 3)
+    ok_('consume' in profiler.summary())
+    eq_(phase('parse'), NULL_TIMER) # nothing listens anymore
+
+
+def test_profiling_2():
+    events = []
+    hook = lambda name, wall, cpu: events.append(name)
+    add_hook(hook)
+    try:
+        call(numbers, ['1'])
+    finally:
+        remove_hook(hook)
+    ok_('parse' in events)
+    ok_(events.index('parse') < events.index('consume'))
+    del events[:]
+    call(numbers, ['1'])
+    eq_(events, [])
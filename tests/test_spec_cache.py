@@ -0,0 +1,24 @@
+import sys, shutil, tempfile
+from pyclap.spec_cache import SpecCache, CachedModule, cached_call
+from nose.tools import *
+
+########################################################################################################################
+
+def test_spec_cache_1():
+    directory = tempfile.mkdtemp()
+    try:
+        cache = SpecCache(directory)
+        ok_(not isinstance(cache.target('test_module'), CachedModule))
+        target = cache.target('test_module')
+        ok_(isinstance(target, CachedModule))
+        eq_(target.commands, ['command1', 'command2'])
+
+        ok_(cache.target('test_module') is target) # parser_cache hits across calls
+        sys.modules.pop('test_module')
+        raises(SystemExit)(lambda: cached_call('test_module', ['command2'], cache=cache))()
+        ok_('test_module' not in sys.modules) # parsed from the cache
+        ns, output = cached_call('test_module', ['command2', '1234', '--flag-arg'], cache=cache)
+        eq_(ns['_cmd_name_'], 'command2')
+        eq_(output, ['1234', 'test', True])
+    finally:
+        shutil.rmtree(directory)